@@ -0,0 +1,213 @@
+"""
+Content-addressed artifact store for card images, card prompts and uploads.
+
+Artifacts are keyed by the SHA-256 of their bytes and sharded two levels deep:
+
+    images/3f/a2/3fa2…e1.png        the artifact
+    images/3f/a2/3fa2…e1.png.json   its metadata sidecar
+
+Rendering the same word twice in one second can no longer collide, and no
+directory grows past a few hundred entries. Writes are atomic (temporary file,
+then rename) and deduplicated: storing bytes that are already there only
+returns the existing key.
+
+Backends:
+
+    local  - files under `root` (default "artifacts")
+    s3     - any S3-compatible store (AWS, MinIO, R2, ...), via boto3. Point
+             `endpoint_url` at a local MinIO to try it out. Artifacts are
+             mirrored into a local cache laid out like the local backend, so
+             Telegram uploads and PIL still read plain files.
+
+Configured by the "artifacts" section of model_config.json; bot.py calls
+configure() on import. Until then, get_store() is a local store.
+"""
+
+import abc
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Optional
+
+import metrics
+
+
+def content_key(data: bytes, kind: str, extension: str) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{kind}/{digest[:2]}/{digest[2:4]}/{digest}.{extension.lstrip('.')}"
+
+
+def _atomic_write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class ArtifactStore(abc.ABC):
+    """Interface shared by the backends"""
+
+    @abc.abstractmethod
+    def put(self, data: bytes, kind: str, extension: str, metadata: Optional[dict] = None) -> str:
+        """Store `data` (if new) and return its key"""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> bytes:
+        """The artifact's bytes"""
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether the artifact is stored"""
+
+    @abc.abstractmethod
+    def metadata(self, key: str) -> dict:
+        """The artifact's metadata sidecar"""
+
+    @abc.abstractmethod
+    def local_path(self, key: str) -> str:
+        """A local file holding the artifact, fetched if needed"""
+
+
+class LocalArtifactStore(ArtifactStore):
+    def __init__(self, root: str = "artifacts"):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, data: bytes, kind: str, extension: str, metadata: Optional[dict] = None) -> str:
+        key = content_key(data, kind, extension)
+        path = self.path(key)
+        if os.path.exists(path):
+            metrics.increment("artifacts.deduplicated")
+            return key
+
+        sidecar = {
+            **(metadata or {}),
+            "key": key,
+            "size": len(data),
+            "stored_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        # Sidecar first: a visible artifact always has its metadata
+        _atomic_write(f"{path}.json", json.dumps(sidecar, ensure_ascii=False, indent=2).encode('utf-8'))
+        _atomic_write(path, data)
+        metrics.increment("artifacts.stored")
+        return key
+
+    def get(self, key: str) -> bytes:
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def metadata(self, key: str) -> dict:
+        try:
+            with open(f"{self.path(key)}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def local_path(self, key: str) -> str:
+        return self.path(key)
+
+
+class S3ArtifactStore(ArtifactStore):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, cache_root: str = "artifacts"):
+        import boto3  # optional dependency, only for this backend
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.cache = LocalArtifactStore(cache_root)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def exists(self, key: str) -> bool:
+        if self.cache.exists(key):
+            return True
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError:
+            return False
+
+    def put(self, data: bytes, kind: str, extension: str, metadata: Optional[dict] = None) -> str:
+        key = content_key(data, kind, extension)
+        if self.exists(key):
+            metrics.increment("artifacts.deduplicated")
+        else:
+            sidecar = {**(metadata or {}), "key": key, "size": len(data),
+                       "stored_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+            # A PUT is atomic: readers see the whole object or none of it
+            self.client.put_object(Bucket=self.bucket, Key=f"{self._object_key(key)}.json",
+                                   Body=json.dumps(sidecar, ensure_ascii=False).encode('utf-8'),
+                                   ContentType="application/json")
+            self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+            metrics.increment("artifacts.stored")
+        if not self.cache.exists(key):
+            _atomic_write(self.cache.path(key), data)
+        return key
+
+    def get(self, key: str) -> bytes:
+        if self.cache.exists(key):
+            return self.cache.get(key)
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        return response["Body"].read()
+
+    def metadata(self, key: str) -> dict:
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self._object_key(key)}.json")
+            return json.loads(response["Body"].read())
+        except ClientError:
+            return self.cache.metadata(key)
+
+    def local_path(self, key: str) -> str:
+        if not self.cache.exists(key):
+            _atomic_write(self.cache.path(key), self.get(key))
+            metrics.increment("artifacts.cache_fills")
+        return self.cache.path(key)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def configure(settings: dict):
+    """Install the backend from the "artifacts" section of model_config.json"""
+    global _store
+    settings = settings or {}
+    backend = settings.get("backend", "local")
+    root = settings.get("root", "artifacts")
+    with _store_lock:
+        if backend == "s3":
+            s3 = settings.get("s3", {})
+            _store = S3ArtifactStore(
+                bucket=s3["bucket"],
+                prefix=s3.get("prefix", ""),
+                endpoint_url=s3.get("endpoint_url"),
+                region=s3.get("region"),
+                cache_root=root
+            )
+            logging.info(f"🗄️ Artifacts stored in s3://{s3['bucket']}/{s3.get('prefix', '')} (cache: {root}/)")
+        else:
+            _store = LocalArtifactStore(root)
+    return _store
+
+
+def get_store() -> ArtifactStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LocalArtifactStore()
+        return _store
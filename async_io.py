@@ -0,0 +1,95 @@
+"""
+Blocking disk I/O off the event loop, and a loop-lag monitor.
+
+Handlers never touch the disk directly: history files, artifacts, temp files
+and cleanup all go through run_io(), which runs the blocking function on a
+small dedicated thread pool. Slow container disks then delay only the turn
+that is waiting for them, not every chat on the loop. Model calls and renders
+keep to their own pools, so disk work doesn't queue behind a 20-second
+Gemini call.
+
+LoopLagMonitor measures how late the loop wakes up from a short sleep. That
+delay is the time the loop spent running something that wouldn't yield. It
+is observed as `loop.lag` (compare its p95 in /metrics under load), and a
+warning is logged when it passes a threshold.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+_io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+# The loop only keeps weak references to tasks; these are held until they finish
+_background_tasks = set()
+
+
+async def run_io(func, *args, **kwargs):
+    """Run a blocking disk function on the I/O pool and await its result"""
+    return await asyncio.get_running_loop().run_in_executor(_io_pool, functools.partial(func, *args, **kwargs))
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Start `coro` without awaiting it, keeping the task alive until it is done"""
+    task = asyncio.get_running_loop().create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def pending_background_tasks() -> int:
+    return len(_background_tasks)
+
+
+def read_bytes_sync(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+async def read_bytes(path: str) -> bytes:
+    return await run_io(read_bytes_sync, path)
+
+
+async def exists(path: str) -> bool:
+    return await run_io(os.path.exists, path)
+
+
+async def remove(path: str) -> bool:
+    """Delete `path`; False if it didn't exist"""
+    def _remove():
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+    return await run_io(_remove)
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.25, warn_seconds: float = 0.5):
+        self.interval = interval
+        self.warn_seconds = warn_seconds
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - expected)
+            metrics.observe("loop.lag", lag)
+            if lag >= self.warn_seconds:
+                metrics.increment("loop.stalls")
+                logging.warning(f"🐢 Event loop stalled for {lag * 1000:.0f}ms")
@@ -0,0 +1,124 @@
+"""
+Chat backend benchmark.
+
+Sends the same short Soliloquy turns to one or more OpenAI-compatible backends
+and compares latency: time to first token (when the backend streams), total
+time, and output tokens per second. Capabilities are probed first, as the bot
+does at startup.
+
+Usage:
+
+    python benchmark_backends.py \\
+        --backend openai=https://api.openai.com/v1@gpt-4o-mini \\
+        --backend local=http://localhost:8080/v1@qwen2.5-7b-instruct \\
+        --requests 10
+
+Each backend is given as name=base_url@model. The key comes from
+OPENAI_API_KEY for the hosted API; local servers get a placeholder.
+"""
+
+import argparse
+import logging
+import os
+import time
+
+import chat_backend
+
+SAMPLE_TURNS = [
+    "I miss a place I've never been to.",
+    "That feeling when a song ends and the room is too quiet.",
+    "Being happy for a friend and lonely at the same time.",
+    "The nervousness before opening a letter.",
+]
+
+
+def parse_backend(spec: str) -> dict:
+    name, _, rest = spec.partition("=")
+    base_url, _, model = rest.rpartition("@")
+    if not (name and base_url and model):
+        raise argparse.ArgumentTypeError(f"expected name=base_url@model, got {spec!r}")
+    return {"name": name, "base_url": base_url, "model": model}
+
+
+def run_turn(client, model: str, system_prompt: str, user_input: str, stream: bool, max_tokens: int) -> dict:
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_input}]
+    started = time.perf_counter()
+    if not stream:
+        response = client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens)
+        total = time.perf_counter() - started
+        tokens = response.usage.completion_tokens if response.usage else 0
+        return {"ttft": None, "total": total, "tokens": tokens}
+
+    first_token = None
+    pieces = 0
+    for chunk in client.chat.completions.create(model=model, messages=messages, max_tokens=max_tokens, stream=True):
+        if chunk.choices and chunk.choices[0].delta.content:
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            pieces += 1  # servers send about one token per chunk
+    return {"ttft": first_token, "total": time.perf_counter() - started, "tokens": pieces}
+
+
+def benchmark(backend: dict, system_prompt: str, requests: int, max_tokens: int) -> dict:
+    api_settings = {"base_url": backend["base_url"], "timeout": 120, "max_retries": 0}
+    client = chat_backend.create_client(api_settings, os.getenv("OPENAI_API_KEY"))
+    capabilities = chat_backend.resolve_capabilities(client, backend["model"], api_settings)
+
+    results, failures = [], 0
+    for index in range(requests):
+        try:
+            results.append(run_turn(client, backend["model"], system_prompt,
+                                    SAMPLE_TURNS[index % len(SAMPLE_TURNS)],
+                                    capabilities["streaming"], max_tokens))
+        except Exception as e:
+            failures += 1
+            logging.error(f"❌ {backend['name']} request {index + 1} failed: {e}")
+    return {**backend, "capabilities": capabilities, "results": results, "failures": failures}
+
+
+def _percentiles(values: list) -> str:
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    p50 = values[len(values) // 2]
+    p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+    return f"p50 {p50:.2f}s  p95 {p95:.2f}s"
+
+
+def format_report(runs: list) -> str:
+    lines = ["📊 Chat backend benchmark"]
+    for run in runs:
+        results = run["results"]
+        capabilities = ", ".join(f"{name}={'yes' if ok else 'no'}" for name, ok in run["capabilities"].items())
+        lines.append(f"  {run['name']} ({run['model']} at {run['base_url']}): {capabilities}")
+        lines.append(f"    ok: {len(results)}  failed: {run['failures']}")
+        lines.append(f"    total:       {_percentiles([r['total'] for r in results])}")
+        lines.append(f"    first token: {_percentiles([r['ttft'] for r in results if r['ttft'] is not None])}")
+        throughput = [r["tokens"] / r["total"] for r in results if r["total"] and r["tokens"]]
+        if throughput:
+            lines.append(f"    output: {sum(throughput) / len(throughput):.1f} tokens/s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Compare latency of OpenAI-compatible chat backends")
+    parser.add_argument("--backend", action="append", type=parse_backend, required=True,
+                        help="name=base_url@model (repeatable)")
+    parser.add_argument("--requests", type=int, default=8, help="Turns sent to each backend")
+    parser.add_argument("--max-tokens", type=int, default=300, help="max_tokens per turn")
+    parser.add_argument("--system-prompt", default="system_prompt.md", help="System prompt file")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args.system_prompt, 'r', encoding='utf-8') as f:
+        system_prompt = f.read()
+
+    runs = []
+    for backend in args.backend:
+        print(f"⏱️ Benchmarking {backend['name']} ({args.requests} turns)")
+        runs.append(benchmark(backend, system_prompt, args.requests, args.max_tokens))
+    print(format_report(runs))
@@ -1,57 +1,238 @@
+from __future__ import annotations
+
+import time
+_PROCESS_STARTED = time.perf_counter()
+
 import os
+import signal
+import asyncio
 import logging
 import json
+import re
+import html
+import weakref
+import functools
 from datetime import datetime, date
+from functools import lru_cache
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import ApplicationBuilder, MessageHandler, filters, ContextTypes, CommandHandler
-from openai import OpenAI
-
-from tool_functions import TOOL_FUNCTIONS
-
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('soliloquy_bot.log'),
-        logging.StreamHandler()
-    ]
+
+from tool_functions import TOOL_FUNCTIONS, USER_READY_TOOLS, TOOL_ACKNOWLEDGEMENTS, DEFERRED_ACKNOWLEDGEMENTS, parse_image_reply
+from startup_report import StartupTimer
+import catalogue
+import metrics
+import resilience
+import job_journal
+import chat_backend
+import phase_router
+import artifact_store
+import usage_ledger
+import turn_control
+import profiling
+import traffic_recorder
+from async_io import run_io, run_in_background, exists, remove, LoopLagMonitor
+from turn_control import Turn, TurnCancelled
+from update_dedup import UpdateDeduplicator
+from telegram_sender import OutboundSender
+from media_groups import MediaGroupCollector
+from load_governor import LoadGovernor
+from telegram_html import render_html
+from transcription import create_backend, transcribe_clip
+from word_of_the_day import (
+    load_word_of_the_day, ensure_word_of_the_day, run_daily_precompute,
+    render_word_of_the_day, word_of_the_day_system_note
 )
 
+if TYPE_CHECKING:
+    # Telegram is imported for real in __main__; handlers only need the types
+    from telegram import Update
+    from telegram.ext import ContextTypes
+
 # Load .env variables (Railway doesn't use .env files, uses environment variables directly)
 load_dotenv()
 
-# Debug: Print all environment variables starting with relevant prefixes
-print("🔍 Debug: Checking environment variables...")
-print(f"Total environment variables: {len(os.environ)}")
-
-# Print ALL environment variables (first 10 characters only for security)
-print("All env vars:")
-for key, value in list(os.environ.items())[:10]:  # Show first 10 to avoid spam
-    print(f"  {key}: {value[:10]}...")
-
-# Check specifically for our variables
-target_vars = ['TELEGRAM_TOKEN', 'OPENAI_API_KEY', 'GEMINI_API_KEY']
-for key in target_vars:
-    if key in os.environ:
-        value = os.environ[key]
-        print(f"Found {key}: {value[:10]}...{value[-8:] if len(value) > 18 else 'SHORT_VALUE'}")
-    else:
-        print(f"❌ {key} not found in environment")
-
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip().isdigit()}
+
+# update_ids of journalled turns currently being worked on (see job_journal)
+_in_flight = set()
+
+# Updates are processed concurrently across users, but each user's updates
+# run one at a time, in arrival order (asyncio.Lock wakes waiters FIFO), so
+# their history load-modify-write cycles never interleave
+_user_locks = weakref.WeakValueDictionary()
+
+# Every outgoing message goes through this queue (see telegram_sender); set in post_init
+outbound: OutboundSender = None
+
+def get_user_lock(user_id: int) -> asyncio.Lock:
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[user_id] = lock
+    return lock
+
+def serialized_per_user(handler):
+    """Decorator: run a handler under its user's lock"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not update.effective_user:
+            return await handler(update, context)
+        async with get_user_lock(update.effective_user.id):
+            return await handler(update, context)
+    return wrapper
+
+# The turn each user has in flight (see turn_control). /clear, /reset and,
+# per the "cancellation" config, newer messages cancel it
+_user_turns = {}
+# Inputs of turns cancelled by a newer message, folded into that message's turn
+_superseded_inputs = {}
+
+def start_turn(user_id: int, kind: str, user_input: str = "") -> Turn:
+    turn = Turn(user_id, kind, user_input)
+    _user_turns[user_id] = turn
+    return turn
+
+def end_turn(turn: Turn):
+    if _user_turns.get(turn.user_id) is turn:
+        del _user_turns[turn.user_id]
+
+def cancel_user_turn(user_id: int, reason: str) -> bool:
+    """Cancel the user's in-flight turn, if any. reason: "clear", "reset", "text" or "voice" """
+    turn = _user_turns.get(user_id)
+    if not turn or turn.cancelled.is_set() or not turn.cancel(reason):
+        return False
+    metrics.increment(f"turns.cancelled.{reason}")
+    logging.info(f"✋ Cancelled {turn.kind} turn for user {user_id} ({reason})")
+    return True
+
+def cancels_running_turn(reason: str):
+    """Decorator: cancel the user's in-flight turn before this update queues for their lock"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            settings = config.get('cancellation', {})
+            if reason in ('clear', 'reset'):
+                enabled = settings.get('on_clear', True)
+            else:
+                enabled = reason in settings.get('supersede_on', [])
+            if enabled and update.effective_user:
+                cancel_user_turn(update.effective_user.id, reason)
+                if reason in ('clear', 'reset'):
+                    # A card promised by the cleared conversation shouldn't arrive after it
+                    cancel_deferred_cards(update.effective_user.id)
+            return await handler(update, context)
+        return wrapper
+    return decorator
+
+def turn_cancelled(user_id: int, update_id: int, error: TurnCancelled, user_input: str = None):
+    """Bookkeeping for a cancelled turn: nothing was written or sent, so only the journal changes"""
+    job_journal.mark_cancelled(update_id)
+    traffic_recorder.note(outcome="cancelled")
+    if user_input and error.args and error.args[0] not in ('clear', 'reset'):
+        _superseded_inputs.setdefault(user_id, []).append(user_input)
+
+def with_superseded_inputs(user_id: int, user_input: str) -> str:
+    """Prefix the inputs of turns this one superseded, so nothing the user said is lost"""
+    return "\n\n".join(_superseded_inputs.pop(user_id, []) + [user_input])
+
+async def post_init(application):
+    """Start background jobs once the application's event loop is running"""
+    global outbound
+    outbound_settings = config.get('outbound', {})
+    outbound = OutboundSender(
+        application.bot,
+        global_per_second=outbound_settings.get('global_per_second', 25),
+        per_chat_interval=outbound_settings.get('per_chat_interval', 1.0),
+        max_retries=outbound_settings.get('max_retries', 3)
+    )
+    outbound.start()
+
+    # Find out whether the chat backend can call tools and stream, and which models it serves
+    chat_capabilities.update(await asyncio.to_thread(
+        chat_backend.resolve_capabilities, get_chat_client(), config['model_settings']['model_name'], config['api_settings']
+    ))
+    if not chat_capabilities['tools']:
+        logging.warning("⚠️ Chat backend has no tool calling; cards can't be rendered")
+    await asyncio.to_thread(chat_backend.load_served_models, get_chat_client(), config['api_settings'])
+
+    wotd_settings = config.get('word_of_the_day', {})
+    if wotd_settings.get('enabled', False):
+        application.create_task(run_daily_precompute(
+            get_chat_client(), chat_model(wotd_settings.get('model')), word_of_the_day_json_mode()
+        ))
+
+    # Load a local transcription model now rather than on the first voice note
+    application.create_task(asyncio.to_thread(transcription_backend.load))
+
+    # Drain in-flight turns on SIGTERM (Railway redeploys) instead of dropping them
+    asyncio.get_running_loop().add_signal_handler(
+        signal.SIGTERM, lambda: application.create_task(drain_and_stop(application))
+    )
+
+    # Watch for anything blocking the loop, and clean up old files off it
+    io_settings = config.get('io', {})
+    LoopLagMonitor(io_settings.get('lag_interval', 0.25), io_settings.get('lag_warn_seconds', 0.5)).start()
+    application.create_task(run_io(cleanup_old_conversations))
+
+    # Opt-in: log the blocking stack during stalls, and profile on SIGUSR1
+    profiling_settings = config.get('profiling', {})
+    if profiling_settings.get('stall_watchdog', False):
+        profiling.StallWatchdog(profiling_settings.get('stall_seconds', 1.0)).start()
+    if profiling.enabled():
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, lambda: application.create_task(run_profile(profiling_settings.get('signal_seconds', 30)))
+        )
 
-print(f"🔍 After loading:")
-print(f"TELEGRAM_TOKEN: {'✅ Found' if TELEGRAM_TOKEN else '❌ Missing'}")
-print(f"OPENAI_API_KEY: {'✅ Found' if OPENAI_API_KEY else '❌ Missing'}")
-print(f"GEMINI_API_KEY: {'✅ Found' if GEMINI_API_KEY else '❌ Missing'}")
+    governor.start()
+
+    # Re-drive turns the previous process accepted but never delivered
+    job_journal.prune()
+    application.create_task(resume_unfinished_jobs(application))
+
+async def drain_and_stop(application):
+    """Stop taking updates, give in-flight turns a grace period, then shut down"""
+    grace_seconds = config.get('deployment', {}).get('drain_grace_seconds', 20)
+    logging.info(f"🛑 SIGTERM received: draining {len(_in_flight)} in-flight job(s) for up to {grace_seconds}s")
+
+    if application.updater and application.updater.running:
+        await application.updater.stop()
+
+    deadline = time.monotonic() + grace_seconds
+    while (_in_flight or _deferred_cards or media_groups.pending() or outbound.depth()) and time.monotonic() < deadline:
+        await asyncio.sleep(0.2)
+
+    if _in_flight:
+        logging.warning(f"⏳ {len(_in_flight)} job(s) still running at shutdown; they will resume on restart")
+    if media_groups.pending():
+        logging.warning(f"⏳ {media_groups.pending()} album(s) still being handled at shutdown")
+    application.stop_running()
+
+def setup_logging():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('soliloquy_bot.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+def check_required_keys():
+    """Exit with Railway troubleshooting hints if required API keys are missing"""
+    # A local chat server with local transcription needs no OpenAI key
+    needs_openai_key = (
+        chat_backend.is_hosted(config['api_settings'].get('base_url'))
+        or transcription_backend.name == 'openai'
+    )
+    if TELEGRAM_TOKEN and (OPENAI_API_KEY or not needs_openai_key):
+        return
 
-# Check if API keys are loaded before initializing client
-if not TELEGRAM_TOKEN or not OPENAI_API_KEY:
     print("\n❌ Error: Missing required API keys in environment variables")
+    print(f"TELEGRAM_TOKEN: {'✅ Found' if TELEGRAM_TOKEN else '❌ Missing'}")
+    print(f"OPENAI_API_KEY: {'✅ Found' if OPENAI_API_KEY else '❌ Missing'}")
     print("🔧 Railway Troubleshooting:")
     print("1. Go to Railway dashboard > Your Project > Variables tab")
     print("2. Make sure variables are spelled EXACTLY as:")
@@ -60,28 +241,98 @@ if not TELEGRAM_TOKEN or not OPENAI_API_KEY:
     print("   - GEMINI_API_KEY (optional, for image generation)")
     print("3. Values should have NO quotes, NO spaces at start/end")
     print("4. After adding variables, redeploy the service")
-    
-    # Show what Railway environment looks like
-    print(f"\n🔍 Railway Environment Debug:")
-    env_vars = [k for k in os.environ.keys() if any(x in k.upper() for x in ['TOKEN', 'KEY', 'API'])]
-    if env_vars:
-        print(f"Found environment variables: {env_vars}")
-    else:
-        print("No API-related environment variables found")
-    
     exit(1)
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+_openai_client = None
+_chat_client = None
+
+def get_openai_client():
+    """Hosted OpenAI client (Whisper), created on first use so importing bot.py stays cheap"""
+    global _openai_client
+    if _openai_client is None:
+        from openai import OpenAI
+        _openai_client = OpenAI(api_key=OPENAI_API_KEY)
+    return _openai_client
+
+def get_chat_client():
+    """Client for chat completions at api_settings.base_url (hosted or a local server)"""
+    global _chat_client
+    if _chat_client is None:
+        _chat_client = chat_backend.create_client(config['api_settings'], OPENAI_API_KEY)
+    return _chat_client
+
+_async_chat_client = None
+
+def get_async_chat_client():
+    """Async twin of get_chat_client, for turns: cancelling the awaiting task aborts the request"""
+    global _async_chat_client
+    if _async_chat_client is None:
+        _async_chat_client = chat_backend.create_client(config['api_settings'], OPENAI_API_KEY, use_async=True)
+    return _async_chat_client
+
+# What the chat backend supports; "auto" entries are probed in post_init
+chat_capabilities = {"tools": True, "streaming": True}
 
 # Load configuration
 with open('model_config.json', 'r') as f:
     config = json.load(f)
 
+resilience.configure(config.get('resilience', {}))
+artifact_store.configure(config.get('artifacts', {}))
+profiling.configure(config.get('profiling', {}))
+traffic_recorder.configure(config.get('traffic_recording', {}))
+
+# Voice notes go to the Whisper API or a local model, per config (see transcription.py)
+transcription_backend = create_backend(config.get('transcription', {}), get_openai_client)
+
+dedup_settings = config.get('dedup', {})
+update_deduplicator = UpdateDeduplicator(
+    capacity=dedup_settings.get('capacity', 10000),
+    persist_path=dedup_settings.get('persist_path')
+)
+
+# Steps the bot down to cheaper behaviour under load and back up as it clears (see load_governor)
+governor = LoadGovernor(config.get('load_governor', {}), lambda: len(_in_flight))
+# Cards deferred by the governor, delivered after their turn's reply: user_id -> delivery tasks
+_deferred_cards = {}
+
+def word_of_the_day_json_mode() -> bool:
+    """Only the hosted API is relied on to honour response_format=json_object"""
+    return chat_backend.is_hosted(config['api_settings'].get('base_url'))
+
+def chat_model(model: str = None) -> str:
+    """A configured model name the chat backend can serve (see chat_backend.served_model)"""
+    default = config['model_settings']['model_name']
+    return chat_backend.served_model(model or default, default)
+
+async def create_chat_completion(hedge: bool = False, **kwargs):
+    """Chat completion through the OpenAI circuit breaker, on the async client.
+
+    Falls back to resilience.openai.fallback_model while the breaker is open;
+    hedge=True allows a duplicate request after the recent p95 latency.
+    Cancelling the caller cancels the HTTP request.
+    """
+    model = chat_model(kwargs.pop('model', None))
+    started = time.perf_counter()
+    response = await resilience.call_with_fallback_async(
+        'openai',
+        model,
+        lambda chosen_model: get_async_chat_client().chat.completions.create(model=chat_model(chosen_model), **kwargs),
+        hedge
+    )
+    elapsed = time.perf_counter() - started
+    governor.observe_chat_latency(elapsed)
+    message = response.choices[0].message
+    traffic_recorder.note_call(
+        'openai', elapsed,
+        prompt_tokens=response.usage.prompt_tokens,
+        completion_tokens=response.usage.completion_tokens,
+        content_chars=len(message.content or ""),
+        tool_calls=[tool_call.function.name for tool_call in message.tool_calls or []]
+    )
+    return response
 
-# Create conversations directory if it doesn't exist
 CONVERSATIONS_DIR = "conversations"
-if not os.path.exists(CONVERSATIONS_DIR):
-    os.makedirs(CONVERSATIONS_DIR)
 
 # Conversation storage functions
 def get_conversation_file_path(user_id, date_str):
@@ -109,12 +360,16 @@ def save_conversation_history(user_id, conversation_history):
     file_path = get_conversation_file_path(user_id, today)
     
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
+        # Write to a temp file and rename over the old one, so a crash or a
+        # concurrent reader never sees a half-written history
+        temp_path = f"{file_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
             json.dump(conversation_history, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, file_path)
     except Exception as e:
         logging.error(f"Error saving conversation history for user {user_id}: {e}")
 
-def add_to_conversation_history(user_id, user_message, bot_response, tool_calls=None):
+def add_to_conversation_history(user_id, user_message, bot_response, tool_calls=None, update_id=None):
     """Add a new exchange to the conversation history"""
     conversation_history = load_conversation_history(user_id)
     
@@ -130,6 +385,10 @@ def add_to_conversation_history(user_id, user_message, bot_response, tool_calls=
     # Include tool call info if present
     if tool_calls:
         exchange["tool_calls"] = tool_calls
+
+    # Tag journalled turns so a re-drive after restart can tell they were recorded
+    if update_id is not None:
+        exchange["update_id"] = update_id
     
     conversation_history.append(exchange)
     
@@ -140,6 +399,13 @@ def add_to_conversation_history(user_id, user_message, bot_response, tool_calls=
     save_conversation_history(user_id, conversation_history)
     return conversation_history
 
+def find_exchange_by_update_id(user_id, update_id):
+    """Today's history exchange recorded for a Telegram update, if any"""
+    for exchange in load_conversation_history(user_id):
+        if exchange.get("update_id") == update_id:
+            return exchange
+    return None
+
 def format_conversation_for_openai(conversation_history):
     """Convert conversation history to OpenAI message format"""
     messages = []
@@ -173,10 +439,15 @@ def cleanup_old_conversations():
     except Exception as e:
         logging.error(f"Error cleaning up old conversations: {e}")
 
+@lru_cache(maxsize=1)
+def load_system_prompt() -> str:
+    """Read system_prompt.md once; it only changes on redeploy"""
+    with open("system_prompt.md", "r", encoding="utf-8") as f:
+        return f.read()
+
 # Read the system prompt and append username
 def get_system_prompt(username: str = None):
-    with open("system_prompt.md", "r", encoding="utf-8") as f:
-        system_prompt = f.read()
+    system_prompt = load_system_prompt()
     
     # Append username if provided
     if username:
@@ -212,65 +483,103 @@ def log_conversation(user_id, username, message_type, content, status="success",
     logging.info(log_entry)
     print(f"📝 {log_entry}")
 
-import re
-
-def convert_asterisks_to_html(text: str) -> str:
-    """
-    Convert asterisk formatting to HTML tags as a fallback protection.
-    This ensures that if the AI generates asterisks, they get converted to proper HTML.
-    """
-    if not text:
-        return text
-    
-    # Log if we find asterisks (so we can debug)
-    if '*' in text:
-        logging.warning(f"🚨 Found asterisks in response, converting to HTML: {text[:100]}...")
-    
-    # Convert **text** to <b>text</b>
-    text = re.sub(r'\*\*([^*]+?)\*\*', r'<b>\1</b>', text)
-    
-    # Convert *text* to <i>text</i> (but be careful not to break emoji or other content)
-    text = re.sub(r'(?<!\*)\*([^*\s][^*]*?)\*(?!\*)', r'<i>\1</i>', text)
-    
-    return text
-
-async def process_user_message(user_input: str, user_id: int, username: str, telegram_user=None, update: Update = None, context: ContextTypes.DEFAULT_TYPE = None) -> str:
+def record_route(phase: str, model: str, started: float, total_tokens: int):
+    """Log and record a routed turn's model latency and token use"""
+    elapsed = time.perf_counter() - started
+    metrics.increment(f"route.{phase}.turns")
+    metrics.observe(f"route.{phase}.seconds", elapsed)
+    metrics.observe(f"route.{phase}.tokens", total_tokens)
+    logging.info(f"🧭 Route {phase} → {model}: {elapsed:.2f}s, {total_tokens} tokens")
+
+def quota_exceeded(user_id: int, resource: str, amount: float = 0) -> bool:
+    """Whether the user is over today's quota for `resource` (admins never are); counts the rejection"""
+    if user_id in ADMIN_USER_IDS:
+        return False
+    if not usage_ledger.over_quota(user_id, resource, config.get('usage', {}), amount):
+        return False
+    usage_ledger.record(user_id, rejections=1)
+    metrics.increment(f"usage.rejected.{resource}")
+    logging.info(f"🚧 User {user_id} is over today's {resource} quota")
+    return True
+
+@profiling.profiled_turn
+async def process_user_message(user_input: str, user_id: int, username: str, telegram_user=None, update: Update = None, context: ContextTypes.DEFAULT_TYPE = None, update_id: int = None) -> str:
     """Process user message with OpenAI function calling and return response"""
+    render_tasks = []  # (tool_call_info index, tool_responses index, task) for pipelined renders
+    deferred = []  # the same, for renders the governor defers until after the reply
 
     try:
         # Load conversation history
-        conversation_history = load_conversation_history(user_id)
+        conversation_history = await run_io(load_conversation_history, user_id)
 
         # Get username for system prompt
         user_display_name = get_telegram_username(telegram_user) if telegram_user else username
 
+        system_prompt = get_system_prompt(user_display_name)
+
+        # First turn of the day: hand the model the shared, precomputed word
+        # so it doesn't choose and explain one from scratch
+        if not conversation_history and config.get('word_of_the_day', {}).get('enabled', False):
+            word_of_the_day = await run_io(load_word_of_the_day)
+            if word_of_the_day:
+                system_prompt += word_of_the_day_system_note(word_of_the_day)
+
         # Prepare messages for OpenAI API
         messages = [
-            {"role": "system", "content": get_system_prompt(user_display_name)}
+            {"role": "system", "content": system_prompt}
         ]
 
-        # Add conversation history
-        messages.extend(format_conversation_for_openai(conversation_history))
+        # Add conversation history (only the latest exchanges while the governor trims it)
+        history_limit = governor.history_limit()
+        if history_limit is not None and len(conversation_history) > history_limit:
+            metrics.increment("load.history_trimmed")
+            messages.extend(format_conversation_for_openai(conversation_history[-history_limit:] if history_limit else []))
+        else:
+            messages.extend(format_conversation_for_openai(conversation_history))
 
         # Add current user message
         messages.append({"role": "user", "content": user_input})
 
-        logging.info(f"🤖 Sending to OpenAI with {len(conversation_history)} history items")
+        # Cheap, fast model for conversational phases; the strong one for building the word
+        phase, model, max_tokens = phase_router.route(conversation_history, config['model_settings'], config.get('routing'))
+        model = chat_model(governor.model_override() or model)
+        turn_started = time.perf_counter()
+
+        logging.info(f"🤖 Sending to {model} ({phase} phase) with {len(conversation_history)} history items")
 
         # Send status message: crafting the response
         if update and context:
             await update.message.chat.send_action("typing")
 
-        # Make API call to OpenAI with function calling
-        response = client.chat.completions.create(
-            model=config['model_settings']['model_name'],
+        # Make API call with function calling, when the backend supports it
+        tool_kwargs = {"tools": config['tools'], "tool_choice": "auto"} if chat_capabilities['tools'] else {}
+        response = await create_chat_completion(
+            hedge=True,
+            model=model,
             messages=messages,
             temperature=config['model_settings']['temperature'],
-            max_tokens=config['model_settings']['max_tokens'],
-            tools=config['tools'],
-            tool_choice="auto"
+            max_tokens=max_tokens,
+            **tool_kwargs
         )
 
+        # A conversational phase's short budget cut the reply off (e.g. a card's
+        # arguments mid-JSON): ask again with the construction phase's budget
+        escalated = phase_router.escalation(max_tokens, config['model_settings'], config.get('routing'))
+        if response.choices[0].finish_reason == "length" and escalated:
+            usage_ledger.record(user_id, username, tokens=response.usage.total_tokens)
+            metrics.increment(f"route.{phase}.truncated")
+            logging.warning(f"🧭 {phase} reply hit max_tokens={max_tokens}; retrying with {escalated[1]}")
+            model, max_tokens = chat_model(governor.model_override() or escalated[0]), escalated[1]
+            response = await create_chat_completion(
+                hedge=True,
+                model=model,
+                messages=messages,
+                temperature=config['model_settings']['temperature'],
+                max_tokens=max_tokens,
+                **tool_kwargs
+            )
+
+        usage_ledger.record(user_id, username, turns=1, tokens=response.usage.total_tokens)
         assistant_message = response.choices[0].message
 
         # Handle tool calls if present
@@ -279,6 +588,19 @@ async def process_user_message(user_input: str, user_id: int, username: str, tel
             tool_responses = []
             tool_call_info = []
             image_path = None  # Track if image generation occurred
+            card_args = None  # Arguments of the card that produced image_path
+
+            tool_settings = config.get('tool_settings', {})
+            called_functions = [tool_call.function.name for tool_call in assistant_message.tool_calls]
+            direct_reply = (tool_settings.get('direct_reply', False)
+                            and all(name in USER_READY_TOOLS for name in called_functions))
+            # Pipelined renders start as soon as the call is parsed: they overlap the
+            # status message and, without a direct reply, the caption completion
+            pipelined = tool_settings.get('pipelined_render', False)
+            # Under load, cards render after the reply is sent (needs a chat to send them to)
+            defer_cards = governor.defer_cards() and update is not None
+            if defer_cards:
+                pipelined = True
 
             for tool_call in assistant_message.tool_calls:
                 function_name = tool_call.function.name
@@ -286,25 +608,52 @@ async def process_user_message(user_input: str, user_id: int, username: str, tel
 
                 log_conversation(user_id, username, "tool_call", f"{function_name}({function_args})")
 
-                # Send status message for image generation
-                if function_name == "generate_neologism_image" and update and context:
-                    await update.message.reply_text("🎨 <i>Painting your neologism into existence...</i>", parse_mode='HTML')
-                    await update.message.chat.send_action("upload_photo")
+                # Renders are the expensive call: admit them against the user's daily quota
+                if function_name == "generate_neologism_image":
+                    if governor.shed_cards():
+                        metrics.increment("load.cards_shed")
+                        tool_responses.append("❌ The card can't be painted right now: the studio is overloaded. "
+                                              "Offer the word itself now, and the card once things are quieter.")
+                        tool_call_info.append({"function": function_name, "args": function_args, "error": "shed under load"})
+                        continue
+                    if quota_exceeded(user_id, usage_ledger.RENDERS, 1):
+                        tool_responses.append("❌ The card can't be painted today: this user has used today's card renders. "
+                                              "Offer the word itself now and the card tomorrow.")
+                        tool_call_info.append({"function": function_name, "args": function_args, "error": "render quota reached"})
+                        continue
+                    usage_ledger.record(user_id, username, renders=1)
+
+                # Send status message for image generation (a pipelined render starts first)
+                pipelined_call = pipelined and function_name in TOOL_ACKNOWLEDGEMENTS
+                show_painting = function_name == "generate_neologism_image" and update and context and not defer_cards
+                if show_painting and not pipelined_call:
+                    await send_painting_status(update)
 
                 if function_name in TOOL_FUNCTIONS:
                     try:
-                        tool_response = TOOL_FUNCTIONS[function_name](**function_args)
-
-                        # Check if this is an image generation response
-                        if tool_response.startswith("IMAGE_PATH:"):
-                            lines = tool_response.split('\n', 1)
-                            image_path = lines[0].replace("IMAGE_PATH:", "").strip()
-                            # Send only the message part to OpenAI, not the IMAGE_PATH: prefix
-                            clean_response = lines[1].strip() if len(lines) > 1 else "I've created a visual card for your neologism."
-                            tool_responses.append(clean_response)
-                            logging.info(f"🖼️ Image path captured for sending: {image_path}")
+                        if pipelined_call:
+                            # Acknowledge the call now and render in the background (a
+                            # deferred card mustn't be described as already made)
+                            acknowledgements = DEFERRED_ACKNOWLEDGEMENTS if defer_cards else TOOL_ACKNOWLEDGEMENTS
+                            acknowledgement = acknowledgements[function_name](**function_args)
+                            render_tasks.append((len(tool_call_info), len(tool_responses), asyncio.create_task(
+                                run_tool(function_name, function_args)
+                            )))
+                            tool_responses.append(acknowledgement)
+                            logging.info(f"⏩ {function_name} acknowledged, rendering in the background")
                         else:
-                            tool_responses.append(tool_response)
+                            tool_response = await run_tool(function_name, function_args)
+
+                            # Check if this is an image generation response
+                            tool_image_path, clean_response = parse_image_reply(tool_response)
+                            if tool_image_path:
+                                image_path = tool_image_path
+                                card_args = function_args
+                                # Send only the message part to OpenAI, not the IMAGE_PATH: prefix
+                                tool_responses.append(clean_response or "I've created a visual card for your neologism.")
+                                logging.info(f"🖼️ Image path captured for sending: {image_path}")
+                            else:
+                                tool_responses.append(tool_response)
 
                         tool_call_info.append({"function": function_name, "args": function_args})
                     except Exception as e:
@@ -314,6 +663,51 @@ async def process_user_message(user_input: str, user_id: int, username: str, tel
                 else:
                     tool_responses.append(f"❌ Unknown function: {function_name}")
 
+                if show_painting and pipelined_call:
+                    await send_painting_status(update)
+
+            if defer_cards:
+                deferred, render_tasks = render_tasks, []
+                for info_index, _, _ in deferred:
+                    tool_call_info[info_index]["deferred"] = True
+
+            # A direct reply needs the card itself: join the renders and put their
+            # captions (or errors) where the acknowledgements were
+            if direct_reply and render_tasks:
+                for info_index, response_index, render_task in render_tasks:
+                    rendered_path, message = await join_render(render_task)
+                    if rendered_path:
+                        image_path = rendered_path
+                        card_args = tool_call_info[info_index]["args"]
+                        tool_responses[response_index] = message or "I've created a visual card for your neologism."
+                    else:
+                        tool_call_info[info_index]["error"] = message
+                        tool_responses[response_index] = message
+                render_tasks = []
+
+            # Direct-reply fast path: when every tool called is user-ready (the card
+            # tool supplies its own caption), skip the follow-up completion and
+            # record a synthetic assistant turn instead
+            if direct_reply and (image_path or deferred):
+                final_message = "\n\n".join(
+                    part for part in [assistant_message.content] + tool_responses if part
+                )
+                final_message = render_html(final_message)
+                if deferred:
+                    final_message += f"\n\n{DEFERRED_CARD_NOTE}"
+                if image_path:
+                    final_message = f"IMAGE_PATH:{image_path}\n\n{final_message}"
+
+                turn_control.commit()
+                await run_io(add_to_conversation_history, user_id, user_input, final_message, tool_call_info, update_id)
+                if image_path:
+                    catalogue.record_neologism(user_id, card_args, image_path)
+                start_deferred_cards(update.effective_chat.id if deferred else None, user_id, update_id, tool_call_info, deferred)
+
+                record_route(phase, model, turn_started, response.usage.total_tokens)
+                logging.info(f"⚡ Direct reply for {', '.join(called_functions)}, skipped follow-up completion. Tokens: {response.usage.total_tokens}")
+                return final_message
+
             # Prepare messages with tool responses for follow-up call
             messages_with_tools = messages + [
                 {
@@ -336,18 +730,37 @@ async def process_user_message(user_input: str, user_id: int, username: str, tel
                 } for i, response_text in enumerate(tool_responses)
             ]
 
-            # Make another API call with tool responses
-            final_response = client.chat.completions.create(
-                model=config['model_settings']['model_name'],
+            # Make another API call with tool responses (off the event loop, so
+            # pipelined renders progress while the caption is written)
+            final_response = await create_chat_completion(
+                hedge=True,
+                model=model,
                 messages=messages_with_tools,
                 temperature=config['model_settings']['temperature'],
-                max_tokens=config['model_settings']['max_tokens']
+                max_tokens=max_tokens
             )
 
+            usage_ledger.record(user_id, username, tokens=final_response.usage.total_tokens)
             final_message = final_response.choices[0].message.content
 
-            # Convert any asterisks to HTML as fallback protection
-            final_message = convert_asterisks_to_html(final_message)
+            # Markdown emphasis to HTML, stray markup escaped, tags balanced
+            final_message = render_html(final_message)
+
+            # Deferred under load: the reply goes now and each card follows it when painted
+            if deferred:
+                final_message += f"\n\n{DEFERRED_CARD_NOTE}"
+
+            # Join pipelined renders; a failed render falls back to a text-only reply
+            for info_index, _, render_task in render_tasks:
+                rendered_path, message = await join_render(render_task)
+                if rendered_path:
+                    image_path = rendered_path
+                    card_args = tool_call_info[info_index]["args"]
+                    logging.info(f"🖼️ Pipelined render joined: {image_path}")
+                else:
+                    tool_call_info[info_index]["error"] = message
+                    final_message += f"\n\n{RENDER_FAILED_NOTE}"
+                    logging.error(f"❌ Pipelined render failed: {message}")
 
             # If image was generated, prepend IMAGE_PATH: for handle_message to detect
             if image_path:
@@ -355,8 +768,13 @@ async def process_user_message(user_input: str, user_id: int, username: str, tel
                 logging.info(f"🖼️ Image path attached to final message: {image_path}")
 
             # Save conversation with tool call info
-            add_to_conversation_history(user_id, user_input, final_message, tool_call_info)
+            turn_control.commit()
+            await run_io(add_to_conversation_history, user_id, user_input, final_message, tool_call_info, update_id)
+            if image_path and card_args:
+                catalogue.record_neologism(user_id, card_args, image_path)
+            start_deferred_cards(update.effective_chat.id if deferred else None, user_id, update_id, tool_call_info, deferred)
 
+            record_route(phase, model, turn_started, response.usage.total_tokens + final_response.usage.total_tokens)
             logging.info(f"✅ OpenAI API success with tools. Tokens: {final_response.usage.total_tokens}")
             return final_message
         
@@ -364,20 +782,201 @@ async def process_user_message(user_input: str, user_id: int, username: str, tel
             # No tool calls, just return the assistant's message
             response_content = assistant_message.content
             
-            # Convert any asterisks to HTML as fallback protection
-            response_content = convert_asterisks_to_html(response_content)
+            # Markdown emphasis to HTML, stray markup escaped, tags balanced
+            response_content = render_html(response_content)
             
-            add_to_conversation_history(user_id, user_input, response_content)
+            turn_control.commit()
+            await run_io(add_to_conversation_history, user_id, user_input, response_content, update_id=update_id)
             
+            record_route(phase, model, turn_started, response.usage.total_tokens)
             logging.info(f"✅ OpenAI API success. Tokens: {response.usage.total_tokens}")
             return response_content
-            
+
+    except (asyncio.CancelledError, TurnCancelled):
+        # The turn was cancelled: stop background renders too, and write nothing
+        for _, _, render_task in render_tasks + deferred:
+            render_task.cancel()
+        raise
     except Exception as e:
-        error_message = f"Alamak! Something went wrong: {str(e)}"
+        # e.g. the follow-up completion failed: don't leave renders running for nobody
+        for _, _, render_task in render_tasks + deferred:
+            render_task.cancel()
+        error_message = f"Alamak! Something went wrong: {html.escape(str(e))}"
         logging.error(f"❌ Error processing message for user {username}: {e}")
         return error_message
 
+async def send_painting_status(update: Update):
+    await reply(update, "🎨 <i>Painting your neologism into existence...</i>")
+    await update.message.chat.send_action("upload_photo")
+
+async def join_render(render_task: asyncio.Task) -> tuple:
+    """(image_path, caption) of a finished pipelined render, or (None, error); a raised error counts as a failed render"""
+    try:
+        render_result = await render_task
+    except Exception as e:
+        return None, f"❌ Render failed: {e}"
+    rendered_path, message = parse_image_reply(render_result)
+    return (rendered_path, message) if rendered_path else (None, render_result)
+
+async def run_tool(function_name: str, function_args: dict) -> str:
+    """Run a tool off the event loop, counting card renders in flight for the governor"""
+    if function_name != "generate_neologism_image":
+        return await asyncio.to_thread(TOOL_FUNCTIONS[function_name], **function_args)
+    governor.render_started()
+    try:
+        return await asyncio.to_thread(TOOL_FUNCTIONS[function_name], **function_args)
+    finally:
+        governor.render_finished()
+
+RENDER_FAILED_NOTE = "<i>The paint wouldn't take this time—your card couldn't be rendered. Ask me and I'll try again.</i>"
+DEFERRED_CARD_NOTE = "<i>🎨 Your card is coming—the studio is busy, so I'll send it the moment the paint dries.</i>"
+
+def attach_deferred_card(user_id: int, update_id: int, image_path: str) -> bool:
+    """Add a delivered deferred card to the history exchange of the turn that promised it"""
+    conversation_history = load_conversation_history(user_id)
+    for exchange in reversed(conversation_history):
+        if exchange.get("update_id") != update_id:
+            continue
+        if not exchange["assistant"].startswith("IMAGE_PATH:"):
+            exchange["assistant"] = f"IMAGE_PATH:{image_path}\n\n{exchange['assistant']}"
+        for call in exchange.get("tool_calls", []):
+            if call.get("deferred") is True:
+                call["deferred"] = "delivered"
+                call["image_path"] = image_path
+                break
+        save_conversation_history(user_id, conversation_history)
+        return True
+    return False
+
+def start_deferred_cards(chat_id: int, user_id: int, update_id: int, tool_call_info: list, deferred: list):
+    """Deliver the turn's deferred cards in the background, once its reply is committed"""
+    if not deferred:
+        return
+    metrics.increment("load.cards_deferred", len(deferred))
+    for info_index, _, render_task in deferred:
+        deliver_deferred_card(chat_id, user_id, update_id, tool_call_info[info_index]["args"], render_task)
+
+def deliver_deferred_card(chat_id: int, user_id: int, update_id: int, card_args: dict, render_task: asyncio.Task):
+    """Send a card deferred by the governor once its render finishes, and record it in history"""
+    async def deliver():
+        delivered = False
+        try:
+            image_path, message = await join_render(render_task)
+            if image_path and await exists(image_path):
+                sent = await outbound.send_photo(chat_id, image_path, caption=f"✨ <b>{html.escape(card_args.get('word_or_place', ''))}</b>")
+                delivered = True
+                catalogue.record_neologism(user_id, card_args, image_path)
+                catalogue.attach_file_id(image_path, sent.photo[-1].file_id)
+                # Under the user's lock, like every other history write
+                async with get_user_lock(user_id):
+                    await run_io(attach_deferred_card, user_id, update_id, image_path)
+                logging.info(f"🖼️ Deferred card sent to chat {chat_id}: {image_path}")
+            else:
+                logging.error(f"❌ Deferred render failed: {message}")
+        except Exception as e:
+            logging.error(f"❌ Deferred card delivery failed for chat {chat_id}: {e}")
+        if not delivered:
+            # The user was promised a card: say it isn't coming
+            try:
+                await outbound.send_text(chat_id, RENDER_FAILED_NOTE)
+            except Exception as e:
+                logging.error(f"❌ Couldn't tell chat {chat_id} its card failed: {e}")
+
+    task = asyncio.get_running_loop().create_task(deliver())
+    _deferred_cards.setdefault(user_id, set()).add(task)
+    task.add_done_callback(lambda done: forget_deferred_card(user_id, done))
+
+def forget_deferred_card(user_id: int, task: asyncio.Task):
+    tasks = _deferred_cards.get(user_id)
+    if tasks is not None:
+        tasks.discard(task)
+        if not tasks:
+            del _deferred_cards[user_id]
+
+def cancel_deferred_cards(user_id: int) -> int:
+    """Cancel the user's undelivered deferred cards (e.g. on /clear): their turn's history is going away"""
+    tasks = [task for task in _deferred_cards.get(user_id, ()) if not task.done()]
+    for task in tasks:
+        task.cancel()  # also cancels the render it is waiting on
+    if tasks:
+        metrics.increment("load.cards_cancelled", len(tasks))
+        logging.info(f"✋ Cancelled {len(tasks)} deferred card(s) for user {user_id}")
+    return len(tasks)
+
+# Runs before every other handler (group -1): drop redelivered updates
+async def guard_duplicate_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Checked without yielding: an await here would let a user's updates reach
+    # their per-user lock out of arrival order
+    if update_deduplicator.check_and_add(update.update_id):
+        from telegram.ext import ApplicationHandlerStop
+
+        metrics.increment("updates.duplicate")
+        logging.info(f"🧾 Duplicate update {update.update_id} acknowledged without reprocessing")
+        raise ApplicationHandlerStop
+    metrics.increment("updates.accepted")
+    # Not persisted yet: until the update is journalled or handled, a crash must
+    # leave it to Telegram's redelivery (see accept_job and persist_handled_update)
+
+# Runs after every other handler (group 1): the update is handled, so a redelivery is a duplicate
+async def persist_handled_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.message and update.message.media_group_id:
+        return  # album photos are persisted when their album is journalled
+    run_in_background(run_io(update_deduplicator.persist, update.update_id))
+
+async def accept_job(update_id: int, chat_id: int, user_id: int, username: str, kind: str, payload: dict,
+                     album_ids: tuple = ()) -> bool:
+    """Journal a turn, then persist its update id(s) as seen.
+
+    A crash before the journal entry leaves the update to Telegram's redelivery,
+    one after it to resume_unfinished_jobs. False if the update was already
+    journalled: a redelivery that the journal re-drives, so it's dropped here.
+    """
+    if not job_journal.accept(update_id, chat_id, user_id, username, kind, payload):
+        metrics.increment("updates.duplicate")
+        logging.info(f"🧾 Update {update_id} is already journalled; leaving it to the journal")
+        return False
+    for seen_id in (update_id, *album_ids):
+        await run_io(update_deduplicator.persist, seen_id)
+    return True
+
+def voice_transcript_note(transcript: str) -> str:
+    return f"🎙️ <i>Voice message transcribed: \"{html.escape(transcript, quote=False)}\"</i>"
+
+async def reply(update: Update, text: str):
+    """Queue a text reply to the update's chat"""
+    return await outbound.send_text(update.effective_chat.id, text)
+
+async def send_reply(bot, chat_id: int, reply_text: str, note: str = None):
+    """Deliver a turn's reply: a photo with caption when it carries IMAGE_PATH:, else text"""
+    # Check if response contains IMAGE_PATH: prefix (from generate_neologism_image)
+    image_path, text_message = parse_image_reply(reply_text)
+    traffic_recorder.note(reply_chars=len(text_message), card=bool(image_path))
+    if image_path:
+        text_message = text_message or "✨ Your neologism's visual card."
+        if note:
+            text_message = f"{note}\n\n{text_message}"
+
+        # Send the image
+        if await exists(image_path):
+            sent = await outbound.send_photo(chat_id, image_path, caption=text_message)
+            catalogue.attach_file_id(image_path, sent.photo[-1].file_id)
+            logging.info(f"🖼️ Image sent successfully to chat {chat_id}: {image_path}")
+        else:
+            # Fallback if image file not found
+            await outbound.send_text(chat_id, f"❌ Image generation completed but file not found at {image_path}")
+    else:
+        # Normal text response without image
+        if note:
+            reply_text = f"{note}\n\n{reply_text}"
+        await outbound.send_text(chat_id, reply_text)
+        logging.info(f"📤 Reply sent successfully to chat {chat_id}")
+
+OVER_BUDGET_MESSAGE = "🌙 We've wandered far together today, and I need to rest my voice. Come back tomorrow and we'll name more feelings."
+
 # Handle incoming messages
+@traffic_recorder.recorded("text")
+@cancels_running_turn("text")
+@serialized_per_user
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Get user info
     user = update.effective_user
@@ -386,7 +985,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check if message exists and has text
     if not update.message or not update.message.text:
-        await update.message.reply_text("Please send me a text message!", parse_mode='HTML')
+        await reply(update, "Please send me a text message!")
         return
 
     user_input = update.message.text.strip()
@@ -396,158 +995,238 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check for empty messages
     if not user_input:
-        await update.message.reply_text("Your message is empty! Please ask me something!", parse_mode='HTML')
+        await reply(update, "Your message is empty! Please ask me something!")
+        return
+
+    # Over today's token budget: decline before any model call
+    if quota_exceeded(user_id, usage_ledger.TOKENS):
+        await reply(update, OVER_BUDGET_MESSAGE)
         return
 
+    # Messages this one cancelled (see cancels_running_turn) are answered together with it
+    user_input = with_superseded_inputs(user_id, user_input)
+
+    # Journal the turn before any model call so a restart can re-drive it
+    update_id = update.update_id
+    if not await accept_job(update_id, update.effective_chat.id, user_id, username, "text", {"user_input": user_input}):
+        return
+    _in_flight.add(update_id)
+    turn = start_turn(user_id, "text", user_input)
+
     try:
         # Send initial status message
         await update.message.chat.send_action("typing")
 
-        # Process message with function calling
-        reply_text = await process_user_message(user_input, user_id, username, user, update, context)
+        # Process message with function calling, as a cancellable turn
+        reply_text = await turn.run(process_user_message(user_input, user_id, username, user, update, context, update_id))
+        job_journal.mark_responded(update_id, reply_text)
 
         # Log successful response
         log_conversation(user_id, username, "outgoing", reply_text)
 
-        # Check if response contains IMAGE_PATH: prefix (from generate_neologism_image)
-        if reply_text.startswith("IMAGE_PATH:"):
-            # Extract image path and remaining text
-            lines = reply_text.split('\n', 1)
-            image_path = lines[0].replace("IMAGE_PATH:", "").strip()
-            text_message = lines[1].strip() if len(lines) > 1 else "✨ Your neologism's visual card."
-
-            # Send the image
-            if os.path.exists(image_path):
-                with open(image_path, 'rb') as photo:
-                    await update.message.reply_photo(photo=photo, caption=text_message, parse_mode='HTML')
-                logging.info(f"🖼️ Image sent successfully to {username}: {image_path}")
-            else:
-                # Fallback if image file not found
-                await update.message.reply_text(f"❌ Image generation completed but file not found at {image_path}", parse_mode='HTML')
-        else:
-            # Normal text response without image
-            await update.message.reply_text(reply_text, parse_mode='HTML')
-            logging.info(f"📤 Reply sent successfully to {username}")
+        await send_reply(context.bot, update.effective_chat.id, reply_text)
+        job_journal.mark_delivered(update_id)
 
+    except TurnCancelled as e:
+        turn_cancelled(user_id, update_id, e, user_input)
     except Exception as e:
         error_msg = str(e)
+        job_journal.mark_failed(update_id)
+        traffic_recorder.note(outcome="error")
         log_conversation(user_id, username, "error", user_input, "failed", error_msg)
-        await update.message.reply_text("Something went wrong! Please try again.", parse_mode='HTML')
+        await reply(update, "Something went wrong! Please try again.")
+    finally:
+        end_turn(turn)
+        _in_flight.discard(update_id)
+
+async def download_and_transcribe(voice_file, duration: float = None) -> str:
+    """Download a Telegram voice file to a temporary location and transcribe it"""
+    import tempfile
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_file:
+        temp_file_path = temp_file.name
+        await voice_file.download_to_drive(temp_file_path)
 
-def transcribe_voice_message(voice_file_path: str) -> str:
-    """Transcribe voice message using OpenAI Whisper API with language detection"""
     try:
-        with open(voice_file_path, 'rb') as audio_file:
-            # First attempt: Auto-detect language (no language parameter)
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="json"  # Use JSON to get language info
-            )
-        
-        # Extract text and detected language
-        text = transcript.text
-        detected_language = getattr(transcript, 'language', 'unknown')
-        
-        logging.info(f"🌐 Detected language: {detected_language}")
-        
-        # If detected language is not English or Chinese, try forcing English
-        if detected_language not in ['en', 'zh', 'zh-cn', 'zh-tw']:
-            logging.info(f"🔄 Non-English/Chinese detected ({detected_language}), retrying with English")
-            with open(voice_file_path, 'rb') as audio_file:
-                transcript = client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text",
-                    language="en"
-                )
-            return transcript
-        
-        return text
+        return await transcribe_clip(transcription_backend, temp_file_path, duration)
     except Exception as e:
         logging.error(f"❌ Error transcribing voice message: {e}")
         return f"Error transcribing voice message: {str(e)}"
+    finally:
+        # Clean up temporary file
+        await remove(temp_file_path)
+
+async def transcribe_voice_note(voice_file, user_id: int, username: str, duration: float = None) -> str:
+    """download_and_transcribe, with the clip charged to the user's ledger once it has run"""
+    transcript = await download_and_transcribe(voice_file, duration)
+    usage_ledger.record(user_id, username, transcription_seconds=duration or 0)
+    return transcript
+
+async def shielded(task: asyncio.Task):
+    """Await `task` without cancelling it when the waiter is cancelled"""
+    return await asyncio.shield(task)
 
 # Handle voice messages
+@traffic_recorder.recorded("voice")
+@cancels_running_turn("voice")
+@serialized_per_user
 async def handle_voice_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle voice messages by transcribing and processing them"""
     user = update.effective_user
     user_id = user.id
     username = user.username or user.first_name or "Unknown"
+
+    # Decline before downloading anything when the user is over today's budget
+    if quota_exceeded(user_id, usage_ledger.TOKENS):
+        await reply(update, OVER_BUDGET_MESSAGE)
+        return
+    if quota_exceeded(user_id, usage_ledger.TRANSCRIPTION_SECONDS, update.message.voice.duration):
+        await reply(update, "🎙️ I've listened to a lot of voice notes from you today. Could you type this one for me?")
+        return
+
+    # Journal the turn on receipt; the transcript is added once known
+    update_id = update.update_id
+    payload = {"file_id": update.message.voice.file_id, "duration": update.message.voice.duration}
+    if not await accept_job(update_id, update.effective_chat.id, user_id, username, "voice", payload):
+        return
+    _in_flight.add(update_id)
+    turn = start_turn(user_id, "voice")
+    transcript = transcription = None
     
     try:
         # Get voice message file
         voice_file = await update.message.voice.get_file()
         
-        # Download voice file to a temporary location
-        import tempfile
-        import os
-        
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.ogg') as temp_file:
-            temp_file_path = temp_file.name
-            await voice_file.download_to_drive(temp_file_path)
-        
         # Log voice message received
         log_conversation(user_id, username, "incoming", "[Voice Message]")
         
-        # Transcribe the voice message
+        # Transcribe the voice message. The transcription is shielded from the turn: a
+        # worker thread can't be cancelled anyway, and a superseded turn still wants the text
         logging.info(f"🎙️ Transcribing voice message from {username}")
-        transcript = transcribe_voice_message(temp_file_path)
-        
-        # Clean up temporary file
-        os.unlink(temp_file_path)
+        transcription = run_in_background(transcribe_voice_note(voice_file, user_id, username, payload["duration"]))
+        transcript = await turn.run(shielded(transcription))
         
         if transcript.startswith("Error"):
-            await update.message.reply_text(f"❌ {transcript}", parse_mode='HTML')
+            job_journal.mark_delivered(update_id)
+            await reply(update, f"❌ {transcript}")
             return
         
         # Log transcribed text
         log_conversation(user_id, username, "transcription", f"Transcribed: '{transcript}'")
         
         if not transcript.strip():
-            await update.message.reply_text("🎙️ I couldn't understand the voice message. Please try again or send a text message.", parse_mode='HTML')
+            job_journal.mark_delivered(update_id)
+            await reply(update, "🎙️ I couldn't understand the voice message. Please try again or send a text message.")
             return
+
+        # Messages this one cancelled are answered together with it
+        user_input = with_superseded_inputs(user_id, transcript)
+        turn.user_input = user_input
+        job_journal.update_payload(update_id, {**payload, "transcript": user_input})
         
         # Send status message
         await update.message.chat.send_action("typing")
 
         # Process the transcribed text like a regular message
-        reply_text = await process_user_message(transcript, user_id, username, user, update, context)
+        reply_text = await turn.run(process_user_message(user_input, user_id, username, user, update, context, update_id))
+        job_journal.mark_responded(update_id, reply_text)
 
         # Log successful response
         log_conversation(user_id, username, "outgoing", reply_text)
 
-        # Check if response contains IMAGE_PATH: prefix (from generate_neologism_image)
-        if reply_text.startswith("IMAGE_PATH:"):
-            # Extract image path and remaining text
-            lines = reply_text.split('\n', 1)
-            image_path = lines[0].replace("IMAGE_PATH:", "").strip()
-            text_message = lines[1].strip() if len(lines) > 1 else "✨ Your neologism's visual card."
-
-            # Add voice transcription note
-            text_message = f"🎙️ <i>Voice message transcribed: \"{transcript}\"</i>\n\n{text_message}"
-
-            # Send the image
-            if os.path.exists(image_path):
-                with open(image_path, 'rb') as photo:
-                    await update.message.reply_photo(photo=photo, caption=text_message, parse_mode='HTML')
-                logging.info(f"🖼️ Image sent successfully to {username} (voice): {image_path}")
-            else:
-                # Fallback if image file not found
-                await update.message.reply_text(f"❌ Image generation completed but file not found at {image_path}", parse_mode='HTML')
-        else:
-            # Normal text response without image - add voice transcription note
-            reply_text = f"🎙️ <i>Voice message transcribed: \"{transcript}\"</i>\n\n{reply_text}"
-            await update.message.reply_text(reply_text, parse_mode='HTML')
-            logging.info(f"📤 Voice message reply sent successfully to {username}")
+        # Send with the voice transcription note
+        await send_reply(context.bot, update.effective_chat.id, reply_text, voice_transcript_note(transcript))
+        job_journal.mark_delivered(update_id)
         
+    except TurnCancelled as e:
+        user_input = turn.user_input or transcript
+        if not user_input and transcription and e.args and e.args[0] not in ('clear', 'reset'):
+            # Superseded while still transcribing: wait for the same transcription to finish
+            # so the note is folded into the newer message's turn rather than lost
+            try:
+                user_input = await transcription
+            except Exception as error:
+                logging.error(f"❌ Error transcribing superseded voice message: {error}")
+                user_input = "Error"
+            if user_input.startswith("Error") or not user_input.strip():
+                user_input = None
+                await reply(update, "🎙️ Your next message arrived while I was still listening to this voice note, "
+                                    "and I couldn't make it out. Could you send it again?")
+        turn_cancelled(user_id, update_id, e, user_input)
     except Exception as e:
         error_msg = str(e)
+        job_journal.mark_failed(update_id)
+        traffic_recorder.note(outcome="error")
         logging.error(f"❌ Error processing voice message from {username}: {e}")
         log_conversation(user_id, username, "error", "[Voice Message]", "failed", error_msg)
-        await update.message.reply_text("❌ Something went wrong processing your voice message! Please try again.", parse_mode='HTML')
+        await reply(update, "❌ Something went wrong processing your voice message! Please try again.")
+    finally:
+        end_turn(turn)
+        _in_flight.discard(update_id)
+
+async def resume_unfinished_jobs(application):
+    """Re-drive journalled turns that a restart interrupted, idempotently"""
+    jobs = job_journal.unfinished_jobs()
+    if jobs:
+        logging.info(f"♻️ Resuming {len(jobs)} unfinished job(s) from the journal")
+
+    for job in jobs:
+        update_id = job["update_id"]
+        if job_journal.record_attempt(update_id) > job_journal.MAX_ATTEMPTS:
+            job_journal.mark_failed(update_id)
+            logging.warning(f"⚠️ Giving up on job {update_id} after {job_journal.MAX_ATTEMPTS} attempts")
+            continue
+
+        _in_flight.add(update_id)
+        try:
+            async with get_user_lock(job["user_id"]):
+                await resume_job(application, job)
+        except Exception as e:
+            logging.error(f"❌ Could not resume job {update_id}: {e}")
+        finally:
+            _in_flight.discard(update_id)
+
+async def resume_job(application, job):
+    """Finish one journalled turn, reusing its stored reply or history exchange if present"""
+    update_id = job["update_id"]
+    payload = job["payload"]
+    note = None
+    user_input = payload.get("user_input")
+
+    if job["kind"] == "photo" and job["status"] == job_journal.ACCEPTED:
+        await record_photos(application.bot, job["chat_id"], job["user_id"], job["username"], update_id, payload["photos"])
+        logging.info(f"♻️ Resumed photo job {update_id} for {job['username']}")
+        return
+
+    if job["kind"] == "voice":
+        if "transcript" not in payload:
+            voice_file = await application.bot.get_file(payload["file_id"])
+            transcript = await download_and_transcribe(voice_file, payload.get("duration"))
+            if transcript.startswith("Error") or not transcript.strip():
+                job_journal.mark_failed(update_id)
+                return
+            payload = {**payload, "transcript": transcript}
+            job_journal.update_payload(update_id, payload)
+        user_input = payload["transcript"]
+        note = voice_transcript_note(user_input)
+
+    if job["status"] == job_journal.RESPONDED:
+        reply_text = job["reply"]
+    else:
+        # The exchange may have reached history just before the restart
+        exchange = await run_io(find_exchange_by_update_id, job["user_id"], update_id)
+        if exchange:
+            reply_text = exchange["assistant"]
+        else:
+            reply_text = await process_user_message(user_input, job["user_id"], job["username"], update_id=update_id)
+        job_journal.mark_responded(update_id, reply_text)
+
+    await send_reply(application.bot, job["chat_id"], reply_text, note)
+    job_journal.mark_delivered(update_id)
+    logging.info(f"♻️ Resumed job {update_id} for {job['username']}")
 
 # Handle /start command
+@serialized_per_user
 async def handle_start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     welcome_message = f"""<b>Soliloquy</b>
@@ -568,7 +1247,22 @@ Together, we'll create a <i>neologism</i>—a new word for the ineffable—and p
 
 What's a feeling you've carried that has no word?"""
 
-    await update.message.reply_text(welcome_message, parse_mode='HTML')
+    # Open with the shared word of the day, recorded so the model continues from Step 2
+    wotd_settings = config.get('word_of_the_day', {})
+    if wotd_settings.get('enabled', False):
+        word_of_the_day = await run_io(load_word_of_the_day)
+        if not word_of_the_day:
+            # Not computed yet: don't hold this user's lock on a model call. It's generated
+            # in the background; meanwhile the model picks the Step 1 word as usual
+            run_in_background(ensure_word_of_the_day(
+                get_chat_client(), chat_model(wotd_settings.get('model')), json_mode=word_of_the_day_json_mode()
+            ))
+        else:
+            word_block = f"📖 <i>Today's word:</i>\n\n{render_word_of_the_day(word_of_the_day)}"
+            welcome_message = f"{welcome_message}\n\n{word_block}"
+            await run_io(add_to_conversation_history, user.id, "/start", word_block)
+
+    await reply(update, welcome_message)
 
 # Handle /help command
 async def handle_help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -594,118 +1288,299 @@ I help you create <i>neologisms</i>—new words for feelings that don't have nam
 
 <b>Commands:</b>
 • /start - Begin a new ritual
+• /mywords - The words you've created
+• /findword - Search your words by feeling
 • /clear or /reset - Clear conversation history
 • /help - This message
 
 The feeling is real. That's enough. Let's name it."""
 
-    await update.message.reply_text(help_message, parse_mode='HTML')
+    await reply(update, help_message)
 
 # Handle /clear command to reset conversation history
+@traffic_recorder.recorded("clear")
+@cancels_running_turn("clear")
+@serialized_per_user
 async def handle_clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
     username = user.username or user.first_name or "Unknown"
+    _superseded_inputs.pop(user_id, None)
     
     try:
         # Clear today's conversation history
         today = date.today().strftime("%Y-%m-%d")
         file_path = get_conversation_file_path(user_id, today)
         
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if await remove(file_path):
             log_conversation(user_id, username, "clear", "/clear", "success")
-            await update.message.reply_text("✅ Conversation cleared! Let's start fresh!", parse_mode='HTML')
+            await reply(update, "✅ Conversation cleared! Let's start fresh!")
         else:
-            await update.message.reply_text("No conversation to clear! We haven't chatted today!", parse_mode='HTML')
+            await reply(update, "No conversation to clear! We haven't chatted today!")
             
         logging.info(f"🗑️ Conversation history cleared for user {username}")
         
     except Exception as e:
         logging.error(f"❌ Error clearing conversation for user {username}: {e}")
-        await update.message.reply_text("Something went wrong when clearing!", parse_mode='HTML')
+        await reply(update, "Something went wrong when clearing!")
 
 # Handle /reset command to flush conversation history
+@traffic_recorder.recorded("reset")
+@cancels_running_turn("reset")
+@serialized_per_user
 async def handle_reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
     username = user.username or user.first_name or "Unknown"
+    _superseded_inputs.pop(user_id, None)
     
     try:
         # Reset today's conversation history
         today = date.today().strftime("%Y-%m-%d")
         file_path = get_conversation_file_path(user_id, today)
         
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if await remove(file_path):
             log_conversation(user_id, username, "reset", "/reset", "success")
-            await update.message.reply_text("🔄 Conversation history has been reset! Ready for a fresh start!", parse_mode='HTML')
+            await reply(update, "🔄 Conversation history has been reset! Ready for a fresh start!")
         else:
-            await update.message.reply_text("Nothing to reset! We haven't chatted today!", parse_mode='HTML')
+            await reply(update, "Nothing to reset! We haven't chatted today!")
             
         logging.info(f"🔄 Conversation history reset for user {username}")
         
     except Exception as e:
         logging.error(f"❌ Error resetting conversation for user {username}: {e}")
-        await update.message.reply_text("Something went wrong when resetting!", parse_mode='HTML')
+        await reply(update, "Something went wrong when resetting!")
+
+def format_catalogue_rows(rows) -> str:
+    lines = []
+    for row in rows:
+        definition = row['definition'] or ''
+        if len(definition) > 90:
+            definition = definition[:90].rstrip() + "…"
+        lines.append(
+            f"<b>{html.escape(row['word'])}</b> <i>{html.escape(row['pronunciation'] or '')}</i> · /card_{row['id']}\n"
+            f"{html.escape(definition)}"
+        )
+    return "\n\n".join(lines)
+
+def format_catalogue_page(heading: str, rows, total: int, page: int, more_command: str) -> str:
+    """One page of catalogue rows under `heading`, or a note if `page` is past the last one"""
+    pages = (total + catalogue.PAGE_SIZE - 1) // catalogue.PAGE_SIZE
+    if page > pages:
+        return f"There's no page {page}; there {'is' if pages == 1 else 'are'} {pages}. Try <i>{more_command} {pages}</i>."
+    message = f"{heading} — page {page}/{pages}\n\n{format_catalogue_rows(rows)}"
+    if page < pages:
+        message += f"\n\n<i>More: {more_command} {page + 1}</i>"
+    return message
+
+# Handle /mywords [page] command: the user's neologisms, newest first
+async def handle_mywords_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    page = max(int(context.args[0]), 1) if context.args and context.args[0].isdigit() else 1
 
-# Handle photo uploads (reference images for neologism generation)
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle photo uploads for visual inspiration in neologism generation"""
+    rows, total = catalogue.list_user_words(user.id, page)
+    if not total:
+        await reply(update, "You haven't named any feelings yet. Tell me about one.")
+        return
+
+    await reply(update, format_catalogue_page(f"📚 <b>Your words</b> ({total})", rows, total, page, "/mywords"))
+
+# Handle /findword <query> [page] command: full-text search of the user's neologisms
+async def handle_findword_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    user_id = user.id
-    username = user.username or user.first_name or "Unknown"
+    args = list(context.args or [])
+    page = 1
+    if len(args) > 1 and args[-1].isdigit():
+        page = max(int(args.pop()), 1)
+    query = " ".join(args)
+    if not query:
+        await reply(update, "Tell me what to look for: <i>/findword nostalgia</i>")
+        return
 
-    try:
-        # Create user_uploads directory if it doesn't exist
-        os.makedirs("user_uploads", exist_ok=True)
+    rows, total = catalogue.search_words(query, user_id=user.id, page=page)
+    if not total:
+        await reply(update, f"No words of yours hold <i>{html.escape(query)}</i> yet.")
+        return
 
-        # Get the largest photo size
-        photo = update.message.photo[-1]
-        photo_file = await photo.get_file()
+    heading = f"🔎 <b>{total}</b> found for <i>{html.escape(query)}</i>"
+    await reply(update, format_catalogue_page(heading, rows, total, page, f"/findword {html.escape(query)}"))
 
-        # Generate unique filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        photo_filename = f"user_{user_id}_{timestamp}.jpg"
-        photo_path = os.path.join("user_uploads", photo_filename)
+# Handle /card_<id> command: re-send a catalogued card, by Telegram file_id when known
+async def handle_card_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    match = re.match(r"/card_(\d+)", update.message.text or "")
+    row = catalogue.get_word(int(match.group(1)), user_id=user.id) if match else None
+    if not row:
+        await reply(update, "I can't find that card.")
+        return
 
-        # Download photo
-        await photo_file.download_to_drive(photo_path)
+    caption = f"<b>{html.escape(row['word'])}</b> <i>{html.escape(row['pronunciation'] or '')}</i>\n{html.escape(row['definition'] or '')}"
+    if row['telegram_file_id']:
+        await outbound.send_photo(update.effective_chat.id, row['telegram_file_id'], caption=caption)
+    elif row['image_path'] and await exists(row['image_path']):
+        sent = await outbound.send_photo(update.effective_chat.id, row['image_path'], caption=caption)
+        catalogue.attach_file_id(row['image_path'], sent.photo[-1].file_id)
+    else:
+        await reply(update, "That card's image is no longer stored.")
 
-        log_conversation(user_id, username, "photo", f"Saved to {photo_path}")
-        logging.info(f"📷 Photo uploaded by {username}: {photo_path}")
+# Handle /metrics command (admins only): counters, gauges and latency percentiles
+async def handle_metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    await reply(update, f"<pre>{html.escape(metrics.format_snapshot())}</pre>")
 
-        # Store photo path in conversation history with a special marker
-        caption = update.message.caption or "[Photo uploaded for visual inspiration]"
-        conversation_history = load_conversation_history(user_id)
+async def run_profile(seconds: float) -> tuple:
+    """A whole-process profile; (path, summary), or (None, reason) if one is already running"""
+    try:
+        return await profiling.profile_for(seconds)
+    except RuntimeError as e:
+        logging.warning(f"🔬 Profile not started: {e}")
+        return None, str(e)
+
+# Handle /profile command (admins only): "/profile 30" samples for 30s, "/profile turns 5" the next 5 turns
+async def handle_profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    if not profiling.enabled():
+        await reply(update, "Profiling is off. Set <code>profiling.enabled</code> in model_config.json.")
+        return
 
-        exchange = {
-            "timestamp": datetime.now().strftime("%H:%M:%S"),
-            "user": f"[PHOTO:{photo_path}] {caption}",
-            "assistant": "I've received your photo. It will inspire the colors and atmosphere when I create your neologism's visual card. Tell me about the feeling you want to name."
-        }
+    args = context.args or []
+    max_seconds = config.get('profiling', {}).get('max_seconds', 300)
+    max_turns = config.get('profiling', {}).get('max_turns', 50)
+    try:
+        if args and args[0] == "turns":
+            count = min(int(args[1]) if len(args) > 1 else 1, max_turns)
+            finished = profiling.profile_next_turns(count)
+            await reply(update, f"🔬 Profiling the next {count} turn(s)")
+            path, summary = await finished
+        else:
+            seconds = min(float(args[0]) if args else 30, max_seconds)
+            if not seconds > 0:
+                raise ValueError(seconds)
+            await reply(update, f"🔬 Profiling for {seconds:g}s")
+            path, summary = await run_profile(seconds)
+    except ValueError:
+        await reply(update, "Usage: /profile [seconds] or /profile turns [count]")
+        return
+    except RuntimeError as e:
+        await reply(update, f"🔬 {html.escape(str(e))}")
+        return
+    if path:
+        await reply(update, f"🔬 Folded stacks in <code>{html.escape(path)}</code>\n<pre>{html.escape(summary)}</pre>")
+    else:
+        await reply(update, f"🔬 {html.escape(summary)}")
 
-        conversation_history.append(exchange)
-        if len(conversation_history) > 20:
-            conversation_history = conversation_history[-20:]
-        save_conversation_history(user_id, conversation_history)
+# Handle /usage command (admins only): today's top consumers
+async def handle_usage_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        return
+    day = context.args[0] if context.args else None
+    await reply(update, f"<pre>{html.escape(usage_ledger.format_top_consumers(day))}</pre>")
+
+async def store_photo(bot, file_id: str, user_id: int) -> str:
+    """Download a photo into the artifact store; returns its local path"""
+    photo_file = await bot.get_file(file_id)
+
+    # The same photo sent twice is stored once
+    photo_bytes = bytes(await photo_file.download_as_bytearray())
+    store = artifact_store.get_store()
+    photo_key = await run_io(store.put, photo_bytes, "uploads", "jpg", {
+        "user_id": user_id,
+        "telegram_file_id": file_id,
+        "uploaded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    return await run_io(store.local_path, photo_key)
+
+async def record_photos(bot, chat_id: int, user_id: int, username: str, update_id: int, photos: list):
+    """Store one or more reference photos as a single history exchange, with one acknowledgement.
+
+    `photos` are {"file_id", "caption"} dicts, as journalled, so resume_job can re-drive it.
+    """
+    try:
+        # A re-drive whose exchange already reached history only re-sends the acknowledgement
+        if not await run_io(find_exchange_by_update_id, user_id, update_id):
+            # Download the whole album at once
+            photo_paths = await asyncio.gather(*(store_photo(bot, photo["file_id"], user_id) for photo in photos))
+
+            log_conversation(user_id, username, "photo", f"Saved {len(photo_paths)} to {', '.join(photo_paths)}")
+            logging.info(f"📷 {len(photo_paths)} photo(s) uploaded by {username}: {', '.join(photo_paths)}")
+
+            # Store photo paths in conversation history with a special marker
+            markers = " ".join(f"[PHOTO:{path}]" for path in photo_paths)
+            caption = " ".join(photo["caption"] for photo in photos if photo["caption"]) or "[Photo uploaded for visual inspiration]"
+            if len(photo_paths) == 1:
+                acknowledgement = "I've received your photo. It will inspire the colors and atmosphere when I create your neologism's visual card. Tell me about the feeling you want to name."
+            else:
+                acknowledgement = f"I've received your {len(photo_paths)} photos. Together they will inspire the colors and atmosphere when I create your neologism's visual card. Tell me about the feeling you want to name."
+            await run_io(add_to_conversation_history, user_id, f"{markers} {caption}", acknowledgement, update_id=update_id)
 
         # Acknowledge receipt with poetic message
-        response_message = """📷 <i>I've received your image.</i>
+        if len(photos) == 1:
+            response_message = """📷 <i>I've received your image.</i>
 
 The colors, the light, the mood—I'll carry them with me.
 
-When we create your word, this image will whisper to the paint.
+When we create your word, this image will whisper to the paint."""
+        else:
+            response_message = f"""📷 <i>I've received your {len(photos)} images.</i>
+
+The colors, the light, the mood—I'll carry them all with me.
 
-Now, tell me: what's the feeling you want to name?"""
+When we create your word, these images will whisper to the paint together."""
 
-        await update.message.reply_text(response_message, parse_mode='HTML')
+        reply_text = f"{response_message}\n\nNow, tell me: what's the feeling you want to name?"
+        job_journal.mark_responded(update_id, reply_text)
+        await outbound.send_text(chat_id, reply_text)
+        job_journal.mark_delivered(update_id)
 
     except Exception as e:
         error_msg = f"Error processing photo: {str(e)}"
+        job_journal.mark_failed(update_id)
         logging.error(f"❌ Error processing photo from {username}: {e}")
         log_conversation(user_id, username, "error", "[Photo]", "failed", error_msg)
-        await update.message.reply_text("❌ Something went wrong processing your photo. Please try again.", parse_mode='HTML')
+        await outbound.send_text(chat_id, "❌ Something went wrong processing your photo. Please try again.")
+
+async def handle_photo_turn(bot, updates: list):
+    """Journal a photo, or a whole album, as one turn and record it"""
+    first = updates[0]
+    user = first.effective_user
+    username = user.username or user.first_name or "Unknown"
+    update_id = first.update_id
+    payload = {"photos": [
+        {"file_id": update.message.photo[-1].file_id, "caption": update.message.caption} for update in updates
+    ]}
+
+    async with get_user_lock(user.id):
+        album_ids = tuple(update.update_id for update in updates[1:])
+        if not await accept_job(update_id, first.effective_chat.id, user.id, username, "photo", payload, album_ids):
+            return
+        _in_flight.add(update_id)
+        try:
+            await record_photos(bot, first.effective_chat.id, user.id, username, update_id, payload["photos"])
+        finally:
+            _in_flight.discard(update_id)
+
+async def handle_photo_album(updates: list, context: ContextTypes.DEFAULT_TYPE):
+    """A collected album (see media_groups): one turn for all its photos"""
+    await handle_photo_turn(context.bot, updates)
+
+media_group_settings = config.get('media_groups', {})
+media_groups = MediaGroupCollector(
+    handle_photo_album,
+    window=media_group_settings.get('collection_window_seconds', 1.5),
+    max_items=media_group_settings.get('max_photos', 10)
+)
+
+# Handle photo uploads (reference images for neologism generation)
+@traffic_recorder.recorded("photo")
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle photo uploads for visual inspiration in neologism generation"""
+    if update.message.media_group_id:
+        # Part of an album: held until the rest of it arrives, then handled as one
+        media_groups.add(update, context)
+        return
+    await handle_photo_turn(context.bot, [update])
 
 # Handle non-text messages
 async def handle_non_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -723,45 +1598,74 @@ async def handle_non_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message_type = "audio"
 
     log_conversation(user.id, username, "non_text", message_type, "handled")
-    await update.message.reply_text("I can only read text messages, voice messages, and photos! Please type your question, send a voice message, or share a photo for inspiration.", parse_mode='HTML')
+    await reply(update, "I can only read text messages, voice messages, and photos! Please type your question, send a voice message, or share a photo for inspiration.")
 
 if __name__ == "__main__":
+    setup_logging()
+    check_required_keys()
+    startup = StartupTimer(_PROCESS_STARTED)
+    startup.record("bot.py module import", time.perf_counter() - _PROCESS_STARTED)
+
     print("✨ Starting Soliloquy...")
     print(f"🔧 Using {config['model_settings']['model_name']} model")
     print("📝 Logging to soliloquy_bot.log")
     print("💾 Conversation history saved per day")
     print("🎨 Image generation: " + ("✅ Enabled" if GEMINI_API_KEY else "⚠️ Disabled (GEMINI_API_KEY not set)"))
 
-    # Clean up old conversation files on startup
-    cleanup_old_conversations()
+    with startup.phase("telegram import"):
+        from telegram import Update
+        from telegram.ext import ApplicationBuilder, MessageHandler, TypeHandler, filters, CommandHandler
+
+    # Pre-warm only what the first turn needs: the chat client and the prompt.
+    # Gemini and PIL stay unloaded until the first card is painted.
+    with startup.phase("chat client"):
+        get_chat_client()
+    with startup.phase("system prompt"):
+        load_system_prompt()
 
-    # Create necessary directories
-    os.makedirs("conversations", exist_ok=True)
-    os.makedirs("generated_prompts", exist_ok=True)
-    os.makedirs("generated_images", exist_ok=True)
-    os.makedirs("user_uploads", exist_ok=True)
-    print("📁 Directories ready: conversations/, generated_prompts/, generated_images/, user_uploads/")
+    with startup.phase("directories"):
+        # Create necessary directories (old conversations are cleaned up in post_init)
+        os.makedirs("conversations", exist_ok=True)
+        os.makedirs(config.get('artifacts', {}).get('root', 'artifacts'), exist_ok=True)
+        print("📁 Directories ready: conversations/, artifacts/")
 
     try:
-        app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
-
-        # Add handlers
-        app.add_handler(CommandHandler("start", handle_start_command))
-        app.add_handler(CommandHandler("help", handle_help_command))
-        app.add_handler(CommandHandler("clear", handle_clear_command))
-        app.add_handler(CommandHandler("reset", handle_reset_command))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        app.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
-        app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
-        app.add_handler(MessageHandler(~filters.TEXT & ~filters.VOICE & ~filters.PHOTO & ~filters.COMMAND, handle_non_text))
+        with startup.phase("application build"):
+            app = (
+                ApplicationBuilder()
+                .token(TELEGRAM_TOKEN)
+                .concurrent_updates(config.get('concurrency', {}).get('max_concurrent_updates', 64))
+                .post_init(post_init)
+                .build()
+            )
+
+            # Add handlers
+            app.add_handler(TypeHandler(Update, guard_duplicate_update), group=-1)
+            app.add_handler(TypeHandler(Update, persist_handled_update), group=1)
+            app.add_handler(CommandHandler("start", handle_start_command))
+            app.add_handler(CommandHandler("help", handle_help_command))
+            app.add_handler(CommandHandler("clear", handle_clear_command))
+            app.add_handler(CommandHandler("reset", handle_reset_command))
+            app.add_handler(CommandHandler("mywords", handle_mywords_command))
+            app.add_handler(CommandHandler("metrics", handle_metrics_command))
+            app.add_handler(CommandHandler("profile", handle_profile_command))
+            app.add_handler(CommandHandler("usage", handle_usage_command))
+            app.add_handler(CommandHandler("findword", handle_findword_command))
+            app.add_handler(MessageHandler(filters.Regex(r"^/card_\d+"), handle_card_command))
+            app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+            app.add_handler(MessageHandler(filters.VOICE, handle_voice_message))
+            app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+            app.add_handler(MessageHandler(~filters.TEXT & ~filters.VOICE & ~filters.PHOTO & ~filters.COMMAND, handle_non_text))
 
         logging.info("🚀 Soliloquy handlers configured")
+        startup.log_report()
         print("✅ Bot initialized successfully!")
         print("🔄 Starting polling for messages...")
         print("\n💭 A voice from within, ready to name the unnamed...")
-        app.run_polling()
+        # SIGTERM is handled by drain_and_stop (installed in post_init)
+        app.run_polling(stop_signals=(signal.SIGINT, signal.SIGABRT))
 
     except Exception as e:
         logging.error(f"❌ Bot startup failed: {e}")
         print(f"❌ Bot startup failed: {e}")
-        print("💡 Check your .env file and try again")
\ No newline at end of file
+        print("💡 Check your .env file and try again")
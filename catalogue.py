@@ -0,0 +1,162 @@
+"""
+Neologism catalogue.
+
+Every card rendered is recorded in SQLite with its fields, image path and
+Telegram file_id, so /mywords, /findword and /card answer from an index
+instead of scanning generated_prompts/ and generated_images/. Full-text search
+over word, definition, emotional keywords and etymology uses FTS5.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+CATALOGUE_DB = "neologisms.db"
+PAGE_SIZE = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS neologisms (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    neologism_type TEXT,
+    pronunciation TEXT,
+    definition TEXT,
+    emotional_keywords TEXT,
+    etymology TEXT,
+    additional_context TEXT,
+    image_path TEXT,
+    telegram_file_id TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_neologisms_user ON neologisms(user_id, id);
+CREATE INDEX IF NOT EXISTS idx_neologisms_image ON neologisms(image_path);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS neologisms_fts USING fts5(
+    word, definition, emotional_keywords, etymology,
+    content='neologisms', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS neologisms_ai AFTER INSERT ON neologisms BEGIN
+    INSERT INTO neologisms_fts(rowid, word, definition, emotional_keywords, etymology)
+    VALUES (new.id, new.word, new.definition, new.emotional_keywords, new.etymology);
+END;
+CREATE TRIGGER IF NOT EXISTS neologisms_ad AFTER DELETE ON neologisms BEGIN
+    INSERT INTO neologisms_fts(neologisms_fts, rowid, word, definition, emotional_keywords, etymology)
+    VALUES ('delete', old.id, old.word, old.definition, old.emotional_keywords, old.etymology);
+END;
+"""
+
+_connection = None
+_lock = threading.RLock()
+
+
+def get_connection() -> sqlite3.Connection:
+    """Shared connection, created (with schema) on first use"""
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(CATALOGUE_DB, check_same_thread=False)
+            _connection.row_factory = sqlite3.Row
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.executescript(SCHEMA)
+        return _connection
+
+
+def record_neologism(user_id: int, card_args: dict, image_path: str) -> Optional[int]:
+    """Add a rendered card to the catalogue; returns its id"""
+    try:
+        connection = get_connection()
+        with _lock, connection:
+            cursor = connection.execute(
+                """INSERT INTO neologisms (user_id, word, neologism_type, pronunciation, definition,
+                       emotional_keywords, etymology, additional_context, image_path, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    user_id,
+                    card_args.get('word_or_place', ''),
+                    card_args.get('neologism_type'),
+                    card_args.get('pronunciation'),
+                    card_args.get('definition'),
+                    card_args.get('emotional_keywords'),
+                    card_args.get('etymology'),
+                    card_args.get('additional_context'),
+                    image_path,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                )
+            )
+        logging.info(f"📚 Catalogued '{card_args.get('word_or_place')}' for user {user_id} (#{cursor.lastrowid})")
+        return cursor.lastrowid
+    except Exception as e:
+        logging.error(f"Error cataloguing neologism for user {user_id}: {e}")
+        return None
+
+
+def attach_file_id(image_path: str, file_id: str):
+    """Remember Telegram's file_id for a sent card so it can be re-sent without uploading"""
+    try:
+        connection = get_connection()
+        with _lock, connection:
+            connection.execute(
+                "UPDATE neologisms SET telegram_file_id = ? WHERE image_path = ?",
+                (file_id, image_path)
+            )
+    except Exception as e:
+        logging.error(f"Error attaching file_id for {image_path}: {e}")
+
+
+def list_user_words(user_id: int, page: int = 1, page_size: int = PAGE_SIZE):
+    """(rows, total) for one page of a user's words, newest first"""
+    connection = get_connection()
+    with _lock:
+        total = connection.execute(
+            "SELECT COUNT(*) FROM neologisms WHERE user_id = ?", (user_id,)
+        ).fetchone()[0]
+        rows = connection.execute(
+            """SELECT * FROM neologisms WHERE user_id = ?
+               ORDER BY id DESC LIMIT ? OFFSET ?""",
+            (user_id, page_size, (max(page, 1) - 1) * page_size)
+        ).fetchall()
+    return rows, total
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into a safe FTS5 query: every term must match, by prefix"""
+    terms = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_words(query: str, user_id: Optional[int] = None, page: int = 1, page_size: int = PAGE_SIZE):
+    """(rows, total) matching `query` in word, definition, keywords or etymology, best match first"""
+    match = fts_query(query)
+    if not match:
+        return [], 0
+
+    user_filter = "AND n.user_id = ?" if user_id is not None else ""
+    params = [match] + ([user_id] if user_id is not None else [])
+    connection = get_connection()
+    with _lock:
+        total = connection.execute(
+            f"""SELECT COUNT(*) FROM neologisms_fts f JOIN neologisms n ON n.id = f.rowid
+                WHERE neologisms_fts MATCH ? {user_filter}""",
+            params
+        ).fetchone()[0]
+        rows = connection.execute(
+            f"""SELECT n.* FROM neologisms_fts f JOIN neologisms n ON n.id = f.rowid
+                WHERE neologisms_fts MATCH ? {user_filter}
+                ORDER BY f.rank LIMIT ? OFFSET ?""",
+            params + [page_size, (max(page, 1) - 1) * page_size]
+        ).fetchall()
+    return rows, total
+
+
+def get_word(word_id: int, user_id: Optional[int] = None):
+    connection = get_connection()
+    with _lock:
+        if user_id is None:
+            return connection.execute("SELECT * FROM neologisms WHERE id = ?", (word_id,)).fetchone()
+        return connection.execute(
+            "SELECT * FROM neologisms WHERE id = ? AND user_id = ?", (word_id, user_id)
+        ).fetchone()
@@ -0,0 +1,127 @@
+"""
+Chat backend selection and capability detection.
+
+Chat completions go to whatever OpenAI-compatible server `api_settings.base_url`
+points at: the hosted OpenAI API, or a local server such as llama.cpp
+(`llama-server`) or vLLM, which keeps traffic on the box. Local servers often
+don't need a key, and many of them can't do tool calling or streaming, or
+support them only with certain models or chat templates.
+
+`api_settings.capabilities` declares what the backend supports. Each entry is
+true, false or "auto". "auto" means true for the hosted API and probed with
+one tiny request for any other server. Without tool calling, the bot still
+converses but can't render cards.
+
+Model names elsewhere in the config (routing phases, the load governor's
+fast model, the resilience fallback, the word of the day) are hosted-API
+names. A local server only knows its own models, so for any other server
+served_model() keeps a name only if the server lists it, and otherwise
+uses model_settings.model_name.
+"""
+
+import logging
+from urllib.parse import urlparse
+
+HOSTED_HOSTS = {"api.openai.com"}
+CAPABILITIES = ("tools", "streaming")
+
+_served_models = None  # ids a non-hosted server lists; None = the hosted API, any name goes
+
+PROBE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "ping",
+        "description": "Reply to a ping.",
+        "parameters": {"type": "object", "properties": {}, "required": []}
+    }
+}
+
+
+def is_hosted(base_url: str) -> bool:
+    return not base_url or urlparse(base_url).hostname in HOSTED_HOSTS
+
+
+def create_client(api_settings: dict, api_key: str = None, use_async: bool = False):
+    """OpenAI client (or AsyncOpenAI) for the configured base_url, timeout and retries"""
+    from openai import OpenAI, AsyncOpenAI
+
+    base_url = api_settings.get("base_url") or None
+    client_class = AsyncOpenAI if use_async else OpenAI
+    return client_class(
+        # Local servers usually ignore the key, but the client insists on one
+        api_key=api_key or (None if is_hosted(base_url) else "local"),
+        base_url=base_url,
+        timeout=api_settings.get("timeout", 30),
+        max_retries=api_settings.get("max_retries", 3)
+    )
+
+
+def probe_tools(client, model: str) -> bool:
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": "Call the ping tool."}],
+            tools=[PROBE_TOOL],
+            tool_choice="auto",
+            max_tokens=32
+        )
+        return bool(response.choices[0].message.tool_calls)
+    except Exception as e:
+        logging.info(f"🔌 Tool-calling probe failed: {e}")
+        return False
+
+
+def probe_streaming(client, model: str) -> bool:
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": "Say hi."}],
+            max_tokens=4,
+            stream=True
+        )
+        for _ in stream:
+            break
+        stream.close()
+        return True
+    except Exception as e:
+        logging.info(f"🔌 Streaming probe failed: {e}")
+        return False
+
+
+PROBES = {"tools": probe_tools, "streaming": probe_streaming}
+
+
+def resolve_capabilities(client, model: str, api_settings: dict) -> dict:
+    """Declared capabilities, with "auto" entries resolved (blocking)"""
+    declared = api_settings.get("capabilities", {})
+    hosted = is_hosted(api_settings.get("base_url"))
+    capabilities = {}
+    for name in CAPABILITIES:
+        value = declared.get(name, "auto")
+        if value == "auto":
+            value = True if hosted else PROBES[name](client, model)
+        capabilities[name] = bool(value)
+    logging.info(f"🔌 Chat backend {api_settings.get('base_url')} ({model}): "
+                 + ", ".join(f"{name}={'yes' if ok else 'no'}" for name, ok in capabilities.items()))
+    return capabilities
+
+
+def load_served_models(client, api_settings: dict):
+    """Ask a non-hosted server which models it serves (blocking)"""
+    global _served_models
+    if is_hosted(api_settings.get("base_url")):
+        _served_models = None
+        return
+    try:
+        _served_models = {model.id for model in client.models.list()}
+    except Exception as e:
+        logging.warning(f"🔌 Couldn't list the backend's models ({e}); using model_settings.model_name for every call")
+        _served_models = set()
+    logging.info(f"🔌 Backend serves: {', '.join(sorted(_served_models)) or 'unknown'}")
+
+
+def served_model(model: str, default: str) -> str:
+    """`model` if the backend can serve it, else `default`"""
+    if _served_models is None or model in _served_models:
+        return model
+    return default
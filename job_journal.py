@@ -0,0 +1,160 @@
+"""
+Durable journal of in-flight turns.
+
+Railway restarts the worker on every deploy. Each accepted text, voice or
+photo update (an album counts as one) is journalled before any model call
+and moves through these states:
+
+    accepted  → the turn is running (or was lost mid-way)
+    responded → the reply is computed and in history, not yet delivered
+    delivered → done
+    failed    → gave up after MAX_ATTEMPTS re-drives
+    cancelled → cancelled by /clear, /reset or a superseding message
+
+On startup, bot.py re-drives every job that isn't delivered. A responded job
+is only re-sent. An accepted job is run again, unless its exchange already
+reached history, which is checked by update_id. Either way, no turn is charged
+or recorded twice.
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+JOURNAL_DB = "jobs.db"
+MAX_ATTEMPTS = 3
+MAX_AGE_HOURS = 12  # older unfinished jobs are abandoned rather than re-driven
+
+ACCEPTED, RESPONDED, DELIVERED, FAILED, CANCELLED = "accepted", "responded", "delivered", "failed", "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    update_id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    reply TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+_connection = None
+_lock = threading.RLock()
+
+
+def get_connection() -> sqlite3.Connection:
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(JOURNAL_DB, check_same_thread=False)
+            _connection.row_factory = sqlite3.Row
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.execute("PRAGMA synchronous=NORMAL")
+            _connection.executescript(SCHEMA)
+        return _connection
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _execute(sql: str, params=()):
+    try:
+        connection = get_connection()
+        with _lock, connection:
+            return connection.execute(sql, params)
+    except Exception as e:
+        logging.error(f"Job journal error: {e}")
+        return None
+
+
+def accept(update_id: int, chat_id: int, user_id: int, username: str, kind: str, payload: dict) -> bool:
+    """Journal a new job; returns False only if this update_id was already journalled.
+
+    If the journal itself fails, the job runs unjournalled rather than being dropped.
+    """
+    cursor = _execute(
+        """INSERT OR IGNORE INTO jobs (update_id, chat_id, user_id, username, kind, payload, status, created_at, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (update_id, chat_id, user_id, username, kind, json.dumps(payload, ensure_ascii=False), ACCEPTED, _now(), _now())
+    )
+    return cursor is None or bool(cursor.rowcount)
+
+
+def update_payload(update_id: int, payload: dict):
+    _execute(
+        "UPDATE jobs SET payload = ?, updated_at = ? WHERE update_id = ?",
+        (json.dumps(payload, ensure_ascii=False), _now(), update_id)
+    )
+
+
+def mark_responded(update_id: int, reply: str):
+    _execute(
+        "UPDATE jobs SET status = ?, reply = ?, updated_at = ? WHERE update_id = ?",
+        (RESPONDED, reply, _now(), update_id)
+    )
+
+
+def mark_delivered(update_id: int):
+    _execute(
+        "UPDATE jobs SET status = ?, updated_at = ? WHERE update_id = ?",
+        (DELIVERED, _now(), update_id)
+    )
+
+
+def mark_failed(update_id: int):
+    _execute(
+        "UPDATE jobs SET status = ?, updated_at = ? WHERE update_id = ?",
+        (FAILED, _now(), update_id)
+    )
+
+
+def mark_cancelled(update_id: int):
+    _execute(
+        "UPDATE jobs SET status = ?, updated_at = ? WHERE update_id = ?",
+        (CANCELLED, _now(), update_id)
+    )
+
+
+def record_attempt(update_id: int) -> int:
+    """Count a re-drive attempt and return the new total"""
+    _execute("UPDATE jobs SET attempts = attempts + 1, updated_at = ? WHERE update_id = ?", (_now(), update_id))
+    connection = get_connection()
+    with _lock:
+        row = connection.execute("SELECT attempts FROM jobs WHERE update_id = ?", (update_id,)).fetchone()
+    return row["attempts"] if row else 0
+
+
+def unfinished_jobs() -> list:
+    """Jobs to re-drive, oldest first; stale ones are marked failed instead"""
+    cutoff = (datetime.now() - timedelta(hours=MAX_AGE_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    _execute(
+        "UPDATE jobs SET status = ?, updated_at = ? WHERE status IN (?, ?) AND created_at < ?",
+        (FAILED, _now(), ACCEPTED, RESPONDED, cutoff)
+    )
+    connection = get_connection()
+    with _lock:
+        rows = connection.execute(
+            "SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY update_id",
+            (ACCEPTED, RESPONDED)
+        ).fetchall()
+    jobs = []
+    for row in rows:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        jobs.append(job)
+    return jobs
+
+
+def prune(days: int = 7):
+    """Drop finished jobs older than `days`"""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    _execute("DELETE FROM jobs WHERE status IN (?, ?, ?) AND updated_at < ?", (DELIVERED, FAILED, CANCELLED, cutoff))
@@ -0,0 +1,134 @@
+"""
+Overload-aware degradation.
+
+LoadGovernor watches three signals: turns in flight, card renders in flight,
+and the p95 chat-completion latency over the last `window_seconds`. It
+steps through the levels configured in the "load_governor" section of
+model_config.json. Each level names the signal values that trigger it and
+what it changes; a level keeps the changes of the levels below it:
+
+    max_history    send only the last N exchanges to the model
+    model          route every turn to this (faster) model
+    defer_cards    reply now with "your card is coming" and send the card when it's painted
+    shed_cards     decline new card renders; the word itself is still given
+
+Under load it goes straight to the highest level whose thresholds are met.
+It comes down one level at a time, and only after every signal has stayed
+below `recover_ratio` of that level's thresholds for `recover_after_seconds`.
+That hysteresis keeps it from flapping at a boundary. The level is the
+`load.level` gauge; changes count as `load.level_changes` and are logged.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import metrics
+
+SIGNALS = ("in_flight_turns", "renders_in_flight", "chat_p95_seconds")
+
+
+class LoadGovernor:
+    def __init__(self, settings: dict, in_flight_turns=lambda: 0):
+        settings = settings or {}
+        self.enabled = settings.get("enabled", False)
+        self.levels = settings.get("levels", [])
+        self.interval = settings.get("interval_seconds", 2.0)
+        self.window = settings.get("window_seconds", 60.0)
+        self.recover_ratio = settings.get("recover_ratio", 0.7)
+        self.recover_after = settings.get("recover_after_seconds", 30.0)
+        self.in_flight_turns = in_flight_turns
+        self.renders_in_flight = 0
+        self.latencies = deque()  # (monotonic time, seconds) of recent chat completions
+        self.level = 0  # 0 = normal; n = levels[n - 1] and everything below it
+        self.calm_since = None
+        self.task = None
+        metrics.set_gauge("load.level", 0)
+
+    def start(self):
+        if self.enabled and self.levels and self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.evaluate()
+            except Exception as e:
+                logging.error(f"Load governor error: {e}")
+
+    def observe_chat_latency(self, seconds: float):
+        self.latencies.append((time.monotonic(), seconds))
+
+    def render_started(self):
+        self.renders_in_flight += 1
+
+    def render_finished(self):
+        self.renders_in_flight -= 1
+
+    def signals(self) -> dict:
+        cutoff = time.monotonic() - self.window
+        while self.latencies and self.latencies[0][0] < cutoff:
+            self.latencies.popleft()
+        latencies = sorted(seconds for _, seconds in self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        return {
+            "in_flight_turns": self.in_flight_turns(),
+            "renders_in_flight": self.renders_in_flight,
+            "chat_p95_seconds": p95,
+        }
+
+    def _exceeds(self, level: dict, signals: dict, ratio: float = 1.0) -> bool:
+        return any(level.get(name) is not None and signals[name] >= level[name] * ratio for name in SIGNALS)
+
+    def evaluate(self):
+        signals = self.signals()
+        wanted = 0
+        for index, level in enumerate(self.levels, start=1):
+            if self._exceeds(level, signals):
+                wanted = index
+
+        if wanted > self.level:
+            self._set_level(wanted, signals)
+            self.calm_since = None
+        elif self.level and not self._exceeds(self.levels[self.level - 1], signals, self.recover_ratio):
+            now = time.monotonic()
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.recover_after:
+                self._set_level(self.level - 1, signals)
+                self.calm_since = now  # the next step down needs its own calm period
+        else:
+            self.calm_since = None
+
+    def _set_level(self, level: int, signals: dict):
+        previous, self.level = self.level, level
+        name = self.levels[level - 1].get("name", f"level {level}") if level else "normal"
+        metrics.set_gauge("load.level", level)
+        metrics.increment("load.level_changes")
+        metrics.increment(f"load.entered.{name}")
+        arrow = "⬆️" if level > previous else "⬇️"
+        logging.warning(
+            f"{arrow} Load level {previous} → {level} ({name}): {signals['in_flight_turns']} turns, "
+            f"{signals['renders_in_flight']} renders, chat p95 {signals['chat_p95_seconds']:.1f}s"
+        )
+
+    def _setting(self, key: str):
+        """The value of `key` from the highest active level that sets it"""
+        for level in reversed(self.levels[:self.level]):
+            if key in level:
+                return level[key]
+        return None
+
+    def history_limit(self):
+        return self._setting("max_history")
+
+    def model_override(self):
+        return self._setting("model")
+
+    def defer_cards(self) -> bool:
+        return bool(self._setting("defer_cards"))
+
+    def shed_cards(self) -> bool:
+        return bool(self._setting("shed_cards"))
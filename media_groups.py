@@ -0,0 +1,65 @@
+"""
+Collects the photos of a Telegram album (media group) into one batch.
+
+Telegram delivers an album as separate updates, one per photo, sharing a
+`media_group_id` and arriving within a fraction of a second of each other.
+MediaGroupCollector holds them until no new photo of the group has arrived
+for `window` seconds (or the group reaches `max_items`), then hands the whole
+batch to its handler, so the album becomes one turn: one history write and
+one acknowledgement, however many photos it holds.
+
+Configured by the "media_groups" section of model_config.json.
+"""
+
+import asyncio
+import logging
+
+import metrics
+
+
+class PendingGroup:
+    def __init__(self, context):
+        self.updates = []
+        self.context = context
+        self.timer = None
+
+
+class MediaGroupCollector:
+    def __init__(self, handler, window: float = 1.5, max_items: int = 10):
+        self.handler = handler  # async (updates, context)
+        self.window = window
+        self.max_items = max_items
+        self.groups = {}  # media_group_id -> PendingGroup
+        self.tasks = set()  # handler runs still going; the loop itself only keeps weak references
+
+    def add(self, update, context):
+        """Hold an album update until its group is complete"""
+        group_id = update.message.media_group_id
+        group = self.groups.get(group_id)
+        if group is None:
+            group = self.groups[group_id] = PendingGroup(context)
+        group.updates.append(update)
+        if group.timer:
+            group.timer.cancel()
+        if len(group.updates) >= self.max_items:
+            self._flush(group_id)
+        else:
+            group.timer = asyncio.get_running_loop().call_later(self.window, self._flush, group_id)
+
+    def _flush(self, group_id):
+        group = self.groups.pop(group_id, None)
+        if group is None:
+            return
+        if group.timer:
+            group.timer.cancel()
+        metrics.observe("media_group.size", len(group.updates))
+        logging.info(f"🖼️ Album {group_id}: {len(group.updates)} photo(s) collected")
+        # Telegram doesn't promise delivery order; keep the album's own order
+        updates = sorted(group.updates, key=lambda update: update.message.message_id)
+        task = asyncio.get_running_loop().create_task(self.handler(updates, group.context))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def pending(self) -> int:
+        """Albums still being collected or handled (the shutdown drain waits for these)"""
+        return len(self.groups) + len(self.tasks)
@@ -0,0 +1,87 @@
+"""
+In-process metrics.
+
+Counters, gauges and rolling latency samples shared by the bot's subsystems.
+Everything is kept in memory; the admin /metrics command reads it through
+snapshot(). Safe to call from worker threads.
+"""
+
+import threading
+from collections import defaultdict, deque
+
+SAMPLE_WINDOW = 500  # most recent observations kept per metric
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+_samples = defaultdict(lambda: deque(maxlen=SAMPLE_WINDOW))
+
+
+def increment(name: str, value: int = 1):
+    with _lock:
+        _counters[name] += value
+
+
+def set_gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    """Record one sample, e.g. a latency in seconds"""
+    with _lock:
+        _samples[name].append(value)
+
+
+def get_counter(name: str) -> int:
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def get_gauge(name: str, default: float = 0.0) -> float:
+    with _lock:
+        return _gauges.get(name, default)
+
+
+def sample_count(name: str) -> int:
+    with _lock:
+        return len(_samples.get(name, ()))
+
+
+def percentile(name: str, q: float, default: float = None):
+    """q-th percentile (0-100) of the recent samples for `name`"""
+    with _lock:
+        values = sorted(_samples.get(name, ()))
+    if not values:
+        return default
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def snapshot() -> dict:
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        sample_names = list(_samples)
+    summaries = {
+        name: {
+            "count": sample_count(name),
+            "p50": percentile(name, 50),
+            "p95": percentile(name, 95),
+        }
+        for name in sample_names
+    }
+    return {"counters": counters, "gauges": gauges, "samples": summaries}
+
+
+def format_snapshot() -> str:
+    """Human-readable snapshot for logs and the /metrics command"""
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"{name} = {value}")
+    for name, value in sorted(data["gauges"].items()):
+        lines.append(f"{name} = {value:g}")
+    for name, summary in sorted(data["samples"].items()):
+        lines.append(f"{name}: n={summary['count']} p50={summary['p50']:.3f} p95={summary['p95']:.3f}")
+    return "\n".join(lines) if lines else "(no metrics yet)"
@@ -0,0 +1,214 @@
+"""
+Microbenchmarks for the bot's local hot paths.
+
+Apart from the network calls, a turn spends its CPU in a handful of pure
+functions: rendering the reply to Telegram HTML, building the OpenAI message list, the system
+prompt, history JSON, the card prompt and IMAGE_PATH: parsing. Each case here
+times one of them on realistic input (a full 20-exchange history, the real
+system prompt, long replies) and compares it with the stored baseline in
+microbench_baselines.json:
+
+    python microbench.py                      # compare; exit 1 on a regression
+    python microbench.py --threshold 10       # stricter than the default 25%
+    python microbench.py --filter history     # only cases whose name matches
+    python microbench.py --save               # record new baselines
+
+Baselines are per machine: record them on the box you compare on (the file
+notes where they were taken, and a mismatch is reported). Cases are timed in
+CPU time, so load from other processes on the box doesn't count. Each case
+runs `--repeat` times in each of `--rounds` rounds, interleaved with the other
+cases so that a burst of machine noise can't land on one case alone, and the
+fastest run counts: the least noisy estimate of what the code itself costs.
+A case that still looks slower than the threshold is timed for another set
+of rounds before it counts as a regression.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import timeit
+from datetime import datetime
+
+BASELINES_FILE = "microbench_baselines.json"
+DEFAULT_THRESHOLD = 25.0  # percent slower than baseline that fails the run
+
+REPLY = (
+    "Oh, that's such a *particular* ache — being happy for someone and feeling the room "
+    "get a little bigger around you at the same time. Let's stay with it for a moment. "
+    "When you picture the moment they told you, what's the **first** thing you notice: "
+    "the warmth, or the echo? Some people describe it as <i>standing on a platform</i> "
+    "after the train has left, still waving. Others say it's more like **a window left open** "
+    "in winter — fresh, but it lets the cold in. Which one calls to you?\n\n"
+    "1. A word with a definition, like a page torn from a dictionary\n"
+    "2. A place on a map, somewhere this feeling lives"
+)
+
+USER_TURNS = [
+    "My best friend just got into her dream program abroad.",
+    "I'm so proud of her but the apartment feels huge already.",
+    "The echo, I think. Like my own voice comes back different.",
+    "A word with a definition.",
+    "Something that sounds soft but has an edge to it.",
+]
+
+
+def sample_history(exchanges: int = 20) -> list:
+    """A full day's history as stored by add_to_conversation_history"""
+    history = []
+    for index in range(exchanges):
+        exchange = {
+            "timestamp": f"{9 + index // 4:02d}:{(index * 7) % 60:02d}:00",
+            "user": USER_TURNS[index % len(USER_TURNS)],
+            "assistant": REPLY,
+            "update_id": 500000 + index,
+        }
+        if index == exchanges - 3:
+            # The card's path rides on the reply; tool_calls only record the call
+            exchange["assistant"] = f"IMAGE_PATH:{IMAGE_PATH}\n\n{REPLY}"
+            exchange["tool_calls"] = [{"function": "generate_neologism_image", "args": dict(CARD_ARGUMENTS)}]
+        history.append(exchange)
+    return history
+
+
+CARD_ARGUMENTS = {
+    "neologism_type": "dictionary",
+    "word_or_place": "Farewellow",
+    "pronunciation": "/ˌfɛərˈwɛl.oʊ/",
+    "definition": ("The hollow, glowing pride of watching someone you love leave for "
+                   "something wonderful, while the space they occupied stays warm and "
+                   "empty beside you, like a chair that still remembers its guest. ") * 2,
+    "emotional_keywords": "bittersweet, proud, hollow, tender, luminous",
+    "etymology": "From 'farewell' + 'hollow', with a nod to 'fellow'",
+    "additional_context": "Travellers leave lanterns on the docks; the owl-keepers light them each dusk.",
+}
+IMAGE_PATH = "artifacts/images/3f/a2/3fa2c0ffee5e1b7d2b9c1e8f6a4d3c2b1a0f9e8d7c6b5a4f3e2d1c0b9a8f7e6d.png"
+
+
+def build_cases() -> dict:
+    """name -> zero-argument callable; imported lazily so --help stays fast"""
+    import bot
+    from telegram_html import render_html
+    from tool_functions import build_card_prompt, parse_image_reply
+
+    history = sample_history()
+    history_json = json.dumps(history, ensure_ascii=False, indent=2)
+    locale_arguments = {**CARD_ARGUMENTS, "neologism_type": "locale", "word_or_place": "The Lantern Docks"}
+    image_reply = f"IMAGE_PATH:{IMAGE_PATH}\n\n{REPLY}"
+    long_reply = "\n\n".join([REPLY] * 4)
+    malformed_reply = long_reply.replace("<i>", "<b><i>", 1) + " 3 < 4 & <div>unclosed *"
+
+    return {
+        "render_html": lambda: render_html(long_reply),
+        "render_html.malformed": lambda: render_html(malformed_reply),
+        "format_conversation_for_openai": lambda: bot.format_conversation_for_openai(history),
+        "get_system_prompt": lambda: bot.get_system_prompt("Ada Lovelace"),
+        # The same calls save_/load_conversation_history make, without the disk
+        "history.serialize": lambda: json.dumps(history, ensure_ascii=False, indent=2),
+        "history.deserialize": lambda: json.loads(history_json),
+        "card_prompt.dictionary": lambda: build_card_prompt(**CARD_ARGUMENTS, reference_images=1),
+        "card_prompt.locale": lambda: build_card_prompt(**locale_arguments),
+        "parse_image_reply": lambda: parse_image_reply(image_reply),
+    }
+
+
+def measure(func, repeat: int) -> float:
+    """Seconds per call: the fastest of `repeat` runs, each long enough to time reliably"""
+    timer = timeit.Timer(func, timer=time.process_time)  # CPU time: other processes' load doesn't count
+    number, _ = timer.autorange()  # also warms caches before the timed runs
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure_all(cases: dict, repeat: int, rounds: int) -> dict:
+    """Seconds per call for each case: the fastest over `rounds` interleaved rounds of measure()"""
+    results = {}
+    for _ in range(rounds):
+        for name, func in cases.items():
+            seconds = measure(func, repeat)
+            results[name] = min(seconds, results.get(name, seconds))
+    return results
+
+
+def environment() -> dict:
+    return {"python": platform.python_version(), "machine": platform.machine(), "system": platform.system()}
+
+
+def load_baselines(path: str) -> dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(path: str, results: dict, existing: dict):
+    cases = {**existing.get("cases", {}), **results}
+    document = {
+        **environment(),
+        "recorded_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "cases": {name: cases[name] for name in sorted(cases)},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+
+
+def compare(results: dict, baselines: dict, threshold: float) -> tuple:
+    """(report lines, names of cases that regressed past `threshold` percent)"""
+    lines, regressions = [], []
+    for name, seconds in results.items():
+        baseline = baselines.get("cases", {}).get(name)
+        if baseline is None:
+            lines.append(f"  ➖ {name:30} {seconds * 1e6:10.2f}µs   (no baseline)")
+            continue
+        change = (seconds / baseline - 1) * 100
+        marker = "✅"
+        if change > threshold:
+            marker = "❌"
+            regressions.append(name)
+        lines.append(f"  {marker} {name:30} {seconds * 1e6:10.2f}µs   baseline {baseline * 1e6:10.2f}µs   {change:+6.1f}%")
+    return lines, regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the bot's local hot paths against stored baselines")
+    parser.add_argument("--baselines", default=BASELINES_FILE, help="Baselines JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Percent slower than baseline that counts as a regression")
+    parser.add_argument("--repeat", type=int, default=7, help="Timed runs per case and round (the fastest counts)")
+    parser.add_argument("--rounds", type=int, default=3, help="Interleaved rounds over all cases")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--save", action="store_true", help="Record the results as the new baselines")
+    args = parser.parse_args()
+
+    # Measure the code, not the log handlers
+    logging.basicConfig(level=logging.ERROR)
+
+    cases = {name: func for name, func in build_cases().items() if args.filter in name}
+    results = measure_all(cases, args.repeat, args.rounds)
+
+    baselines = load_baselines(args.baselines)
+    if args.save:
+        save_baselines(args.baselines, results, baselines)
+        print(f"💾 Saved {len(results)} baselines to {args.baselines}")
+        for name, seconds in results.items():
+            print(f"  {name:32} {seconds * 1e6:10.2f}µs")
+        sys.exit(0)
+
+    print(f"⏱️ Microbenchmarks (regression threshold {args.threshold:.0f}%)")
+    recorded_on = {key: baselines.get(key) for key in environment()}
+    if baselines and recorded_on != environment():
+        print(f"⚠️ Baselines were recorded on {recorded_on}, this is {environment()}")
+    lines, regressions = compare(results, baselines, args.threshold)
+    if regressions:
+        # Confirm before failing: a real slowdown survives another set of rounds
+        retimed = measure_all({name: cases[name] for name in regressions}, args.repeat, args.rounds)
+        results.update({name: min(results[name], seconds) for name, seconds in retimed.items()})
+        lines, regressions = compare(results, baselines, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s): {', '.join(regressions)}")
+        sys.exit(1)
+    print("✅ No regressions")
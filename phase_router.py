@@ -0,0 +1,80 @@
+"""
+Per-phase model routing.
+
+Most turns in the ritual are short conversation: the greeting, drawing out
+the vibe, and the chat after a card is made. Only constructing the neologism
+and writing the card's arguments need a strong model and a long budget.
+classify_phase() infers the phase from today's history, and route() picks
+that phase's model and max_tokens from the "routing" section of
+model_config.json:
+
+    greeting      no history yet today
+    vibe          drawing out the feeling (Step 2)
+    construction  the user has just picked a form and the word gets built (Step 4)
+    card          the card is being rendered, with or without a reference image (Step 5)
+    afterglow     a card has been made; talk continues
+
+Phases missing from the config use model_settings. A reply that a phase's
+short budget cuts off (finish_reason "length") is asked for again with the
+construction phase's model and budget; see escalation().
+"""
+
+import re
+from typing import Optional
+
+GREETING, VIBE, CONSTRUCTION, CARD, AFTERGLOW = "greeting", "vibe", "construction", "card", "afterglow"
+
+# Step 3 asks the user to pick a word or a place; their answer starts construction
+CHOICE_PATTERN = re.compile(r"which one calls|two ways|a place on a map|word with a definition", re.IGNORECASE)
+# Step 5 offers a reference image before rendering
+CARD_INVITE_PATTERN = re.compile(r"reference image|visual card|share an image", re.IGNORECASE)
+PHOTO_MARKER = "[PHOTO:"  # user turn recorded by handle_photo
+
+
+def made_card(exchange: dict) -> bool:
+    return any(call.get("function") == "generate_neologism_image" and not call.get("error")
+               for call in exchange.get("tool_calls", []))
+
+
+def classify_phase(conversation_history: list) -> str:
+    """The ritual phase the next turn belongs to"""
+    if not conversation_history:
+        return GREETING
+
+    # The latest assistant turn says where the ritual stands
+    for exchange in reversed(conversation_history):
+        if made_card(exchange):
+            return AFTERGLOW
+        if exchange["user"].startswith(PHOTO_MARKER):
+            continue  # photo acknowledgements don't move the ritual along
+        assistant = exchange["assistant"] or ""
+        if CARD_INVITE_PATTERN.search(assistant):
+            return CARD
+        if CHOICE_PATTERN.search(assistant):
+            return CONSTRUCTION
+        return VIBE
+    return VIBE
+
+
+def phase_route(phase: str, model_settings: dict, routing: Optional[dict]) -> tuple:
+    """(model, max_tokens) configured for `phase`"""
+    routing = routing or {}
+    phase_settings = routing.get("phases", {}).get(phase, {}) if routing.get("enabled") else {}
+    return (
+        phase_settings.get("model") or model_settings["model_name"],
+        phase_settings.get("max_tokens") or model_settings["max_tokens"],
+    )
+
+
+def route(conversation_history: list, model_settings: dict, routing: Optional[dict]) -> tuple:
+    """(phase, model, max_tokens) for the next turn"""
+    phase = classify_phase(conversation_history)
+    return (phase, *phase_route(phase, model_settings, routing))
+
+
+def escalation(max_tokens: int, model_settings: dict, routing: Optional[dict]) -> Optional[tuple]:
+    """(model, max_tokens) to retry a reply cut off at `max_tokens`, or None if no larger budget is configured"""
+    model, construction_tokens = phase_route(CONSTRUCTION, model_settings, routing)
+    if construction_tokens <= max_tokens:
+        return None
+    return model, construction_tokens
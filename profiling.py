@@ -0,0 +1,235 @@
+"""
+On-demand profiling and an event-loop stall watchdog.
+
+Both are opt-in through the "profiling" section of model_config.json and
+cost nothing while off: no sampler thread, no watchdog thread, and
+profiled_turn() leaves process_user_message undecorated.
+
+SamplingProfiler samples every thread's stack every `interval` seconds
+(sys._current_frames) and counts them in folded form, one line per distinct
+stack:
+
+    MainThread;bot.py:process_user_message;resilience.py:_timed_async 42
+
+which flamegraph.pl, speedscope and inferno read directly. Admins start it
+with /profile:
+
+    /profile 30         sample the whole process for 30 seconds
+    /profile turns 5    sample while the next 5 turns run
+
+or by sending the process SIGUSR1 (a `signal_seconds` profile). Profiles
+are written to `output_dir`.
+
+StallWatchdog catches the event loop while it is blocked. The loop updates a
+heartbeat; a watchdog thread checks it, and once the heartbeat is older than
+`stall_seconds` it logs the loop thread's stack at that moment, which is the
+code that is blocking. LoopLagMonitor (async_io) only measures a stall after
+it has ended, when that stack is gone.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+
+import metrics
+from async_io import run_in_background
+
+_settings = {}
+
+
+def configure(settings: dict):
+    """Install the "profiling" section of model_config.json (call before profiled_turn is applied)"""
+    global _settings
+    _settings = settings or {}
+
+
+def enabled() -> bool:
+    return bool(_settings.get("enabled", False))
+
+
+def fold_stack(frame, thread_name: str) -> str:
+    """A frame's stack as one folded line, outermost first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, label: str = "profile"):
+        self.interval = interval
+        self.label = label
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        return self.stacks
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id:
+                    self.stacks[fold_stack(frame, names.get(thread_id, str(thread_id)))] += 1
+            self.samples += 1
+
+    def write_folded(self, output_dir: str, label: str) -> str:
+        """Write the folded stacks; returns the file path"""
+        os.makedirs(output_dir, exist_ok=True)
+        path = os.path.join(output_dir, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{label}.folded")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def summary(self, limit: int = 8) -> str:
+        """Where the samples ended, most frequent first (idle threads included)"""
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        lines = [f"{self.samples} samples over {time.monotonic() - self.started_at:.1f}s"]
+        for leaf, count in leaves.most_common(limit):
+            lines.append(f"  {count * 100 / total:5.1f}%  {leaf}")
+        return "\n".join(lines)
+
+
+# The one profile that may run at a time, and, for /profile turns, its progress
+_active = None
+_turns = None  # {"to_start", "running", "future"}
+_lock = threading.Lock()
+
+
+def _start(label: str):
+    global _active
+    with _lock:
+        if _active is not None:
+            raise RuntimeError("a profile is already running")
+        _active = SamplingProfiler(_settings.get("interval", 0.005), label)
+        _active.start()
+    logging.info(f"🔬 Profiling started ({label})")
+
+
+def _finish() -> tuple:
+    """Stop the running profile and write it; returns (path, summary)"""
+    global _active
+    with _lock:
+        profiler, _active = _active, None
+    profiler.stop()
+    path = profiler.write_folded(_settings.get("output_dir", "profiles"), profiler.label)
+    metrics.increment("profiles.written")
+    logging.info(f"🔬 Profile written to {path}")
+    return path, profiler.summary()
+
+
+async def profile_for(seconds: float) -> tuple:
+    """Sample the whole process for `seconds`; returns (path, summary)"""
+    if _turns is not None:
+        raise RuntimeError("a profile is already running")
+    _start(f"{seconds:g}s")
+    await asyncio.sleep(seconds)
+    return await asyncio.to_thread(_finish)
+
+
+def profile_next_turns(count: int) -> asyncio.Future:
+    """Sample from the start of the next turn until `count` turns have run; the future gets (path, summary)"""
+    global _turns
+    if count < 1:
+        raise ValueError(f"count must be at least 1, not {count}")
+    if _active is not None or _turns is not None:
+        raise RuntimeError("a profile is already running")
+    _turns = {"to_start": count, "running": 0, "future": asyncio.get_running_loop().create_future()}
+    return _turns["future"]
+
+
+def profiled_turn(func):
+    """Decorator for process_user_message: returns it unchanged unless profiling is enabled"""
+    if not enabled():
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        global _turns
+        turns = _turns
+        if turns is None or not turns["to_start"]:
+            return await func(*args, **kwargs)
+        if _active is None:
+            _start(f"{turns['to_start']}-turns")
+        turns["to_start"] -= 1
+        turns["running"] += 1
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            turns["running"] -= 1
+            if not turns["to_start"] and not turns["running"]:
+                _turns = None
+                # Written in the background, so the turn's reply isn't held up
+                run_in_background(_finish_turns(turns["future"]))
+    return wrapper
+
+
+async def _finish_turns(future: asyncio.Future):
+    result = await asyncio.to_thread(_finish)
+    if not future.done():
+        future.set_result(result)
+
+
+class StallWatchdog:
+    def __init__(self, stall_seconds: float = 1.0, interval: float = 0.1):
+        self.stall_seconds = stall_seconds
+        self.interval = interval
+        self.heartbeat = time.monotonic()
+        self.loop_thread_id = None
+        self.task = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self.task = asyncio.get_running_loop().create_task(self._beat())
+        threading.Thread(target=self._watch, name="stall-watchdog", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self.task:
+            self.task.cancel()
+
+    async def _beat(self):
+        while True:
+            self.heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    def _watch(self):
+        reported = None  # heartbeat of the stall already logged
+        while not self._stop.wait(self.interval):
+            heartbeat = self.heartbeat
+            blocked = time.monotonic() - heartbeat
+            if blocked < self.stall_seconds or reported == heartbeat:
+                continue
+            reported = heartbeat
+            frame = sys._current_frames().get(self.loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(no frame)\n"
+            metrics.increment("loop.stall_stacks")
+            logging.warning(f"🐢 Event loop blocked for {blocked * 1000:.0f}ms so far, in:\n{stack}")
@@ -0,0 +1,234 @@
+"""
+Batch card rendering.
+
+Re-renders many neologism cards through generate_neologism_image, e.g. after a
+change to the card prompts, or exports a gallery of them.
+
+Input is JSONL, one neologism per line:
+
+    {"word": "Dépaysement", "pronunciation": "/day-pay-zee-mahn/",
+     "definition": "...", "keywords": "displacement, wonder",
+     "etymology": "From French dépayser ...", "type": "dictionary"}
+
+The tool's own argument names (word_or_place, emotional_keywords,
+neologism_type, additional_context, reference_image_path,
+reference_image_paths) are accepted too.
+
+Usage:
+
+    python render_cards.py cards.jsonl --concurrency 4 --rate 15
+    python render_cards.py cards.jsonl --gallery gallery/
+
+Progress goes to a checkpoint file (default: <input>.checkpoint.jsonl), so an
+interrupted run picks up where it stopped. Specs already rendered, with their
+image still on disk, are skipped.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import html
+import json
+import logging
+import os
+import shutil
+import time
+
+import artifact_store
+from tool_functions import generate_neologism_image, parse_image_reply
+
+FIELD_ALIASES = {
+    'word': 'word_or_place',
+    'keywords': 'emotional_keywords',
+    'type': 'neologism_type',
+}
+TOOL_FIELDS = {
+    'neologism_type', 'word_or_place', 'pronunciation', 'definition',
+    'emotional_keywords', 'etymology', 'additional_context', 'reference_image_path',
+    'reference_image_paths'
+}
+
+
+def spec_to_tool_args(spec: dict) -> dict:
+    args = {FIELD_ALIASES.get(key, key): value for key, value in spec.items()}
+    args = {key: value for key, value in args.items() if key in TOOL_FIELDS}
+    args.setdefault('neologism_type', 'dictionary')
+    return args
+
+
+def spec_key(tool_args: dict) -> str:
+    """Stable identity of a spec, used for checkpointing"""
+    encoded = json.dumps(tool_args, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+def load_specs(path: str) -> list:
+    specs = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                spec = json.loads(line)
+            except json.JSONDecodeError as e:
+                logging.error(f"❌ Skipping line {line_number}: {e}")
+                continue
+            if not isinstance(spec, dict):
+                logging.error(f"❌ Skipping line {line_number}: expected a JSON object, got {type(spec).__name__}")
+                continue
+            specs.append(spec_to_tool_args(spec))
+    return specs
+
+
+def load_checkpoint(path: str) -> dict:
+    """Completed renders from earlier runs: {key: record}"""
+    completed = {}
+    if not os.path.exists(path):
+        return completed
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a run killed mid-write leaves a partial last line
+            if record.get('status') == 'ok':
+                completed[record['key']] = record
+    return completed
+
+
+class RateLimiter:
+    """Spaces call starts evenly to stay under `per_minute`"""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            if self.next_start > now:
+                await asyncio.sleep(self.next_start - now)
+            self.next_start = max(now, self.next_start) + self.interval
+
+
+async def render_all(specs, checkpoint_path, concurrency, rate_per_minute, force=False):
+    completed = {} if force else load_checkpoint(checkpoint_path)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rate_per_minute)
+    checkpoint_lock = asyncio.Lock()
+    stats = {'rendered': 0, 'skipped': 0, 'failed': 0, 'latencies': []}
+    results = []
+
+    async def render_one(index, tool_args):
+        key = spec_key(tool_args)
+        cached = completed.get(key)
+        if cached and os.path.exists(cached['image_path']):
+            stats['skipped'] += 1
+            results.append((tool_args, cached['image_path']))
+            return
+
+        async with semaphore:
+            await limiter.wait()
+            started = time.perf_counter()
+            try:
+                response = await asyncio.to_thread(generate_neologism_image, **tool_args)
+                image_path, message = parse_image_reply(response)
+            except Exception as e:
+                # e.g. a spec missing a required field: fail this card, not the batch
+                image_path, message = None, f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+
+        record = {
+            'key': key,
+            'word': tool_args.get('word_or_place'),
+            'status': 'ok' if image_path else 'failed',
+            'image_path': image_path,
+            'seconds': round(elapsed, 2),
+        }
+        if image_path:
+            stats['rendered'] += 1
+            stats['latencies'].append(elapsed)
+            results.append((tool_args, image_path))
+            logging.info(f"🖼️ [{index + 1}/{len(specs)}] {record['word']} in {elapsed:.1f}s")
+        else:
+            stats['failed'] += 1
+            record['error'] = message
+            logging.error(f"❌ [{index + 1}/{len(specs)}] {record['word']}: {message}")
+
+        async with checkpoint_lock:
+            with open(checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(render_one(i, args) for i, args in enumerate(specs)))
+    stats['elapsed'] = time.perf_counter() - started
+    return stats, results
+
+
+def format_report(stats: dict) -> str:
+    elapsed = stats['elapsed']
+    latencies = sorted(stats['latencies'])
+    lines = [
+        "📊 Batch render report",
+        f"  rendered: {stats['rendered']}  skipped (cached): {stats['skipped']}  failed: {stats['failed']}",
+        f"  elapsed: {elapsed:.1f}s  throughput: {stats['rendered'] / elapsed * 60 if elapsed else 0:.1f} cards/min",
+    ]
+    if latencies:
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        lines.append(f"  render latency p50: {p50:.1f}s  p95: {p95:.1f}s")
+    return "\n".join(lines)
+
+
+def export_gallery(results, gallery_dir: str):
+    """Copy rendered cards into gallery_dir with an index.html"""
+    os.makedirs(gallery_dir, exist_ok=True)
+    entries = []
+    for tool_args, image_path in results:
+        filename = os.path.basename(image_path)
+        shutil.copy2(image_path, os.path.join(gallery_dir, filename))
+        entries.append(
+            f'<figure><img src="{html.escape(filename)}" loading="lazy">'
+            f'<figcaption><b>{html.escape(tool_args.get("word_or_place", ""))}</b> '
+            f'<i>{html.escape(tool_args.get("pronunciation", ""))}</i><br>'
+            f'{html.escape(tool_args.get("definition", ""))}</figcaption></figure>'
+        )
+    with open(os.path.join(gallery_dir, "index.html"), 'w', encoding='utf-8') as f:
+        f.write("<!doctype html><meta charset=\"utf-8\"><title>Soliloquy cards</title>\n")
+        f.write("<style>figure{max-width:960px;margin:2em auto}img{width:100%}</style>\n")
+        f.write("\n".join(entries))
+    print(f"🖼️ Gallery of {len(entries)} cards written to {gallery_dir}/index.html")
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Render many neologism cards concurrently")
+    parser.add_argument("specs", help="JSONL file of neologism specs")
+    parser.add_argument("--concurrency", type=int, default=4, help="Renders in flight at once")
+    parser.add_argument("--rate", type=float, default=15, help="Max renders started per minute (0 = unlimited)")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <specs>.checkpoint.jsonl)")
+    parser.add_argument("--force", action="store_true", help="Ignore the checkpoint and re-render everything")
+    parser.add_argument("--gallery", help="Export rendered cards and an index.html to this directory")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # Store cards where the bot does
+    with open('model_config.json', 'r') as f:
+        artifact_store.configure(json.load(f).get('artifacts', {}))
+
+    specs = load_specs(args.specs)
+    checkpoint_path = args.checkpoint or f"{os.path.splitext(args.specs)[0]}.checkpoint.jsonl"
+    print(f"🎨 Rendering {len(specs)} cards (concurrency {args.concurrency}, {args.rate}/min)")
+
+    stats, results = asyncio.run(render_all(specs, checkpoint_path, args.concurrency, args.rate, args.force))
+    print(format_report(stats))
+
+    if args.gallery:
+        export_gallery(results, args.gallery)
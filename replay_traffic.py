@@ -0,0 +1,312 @@
+"""
+Replays recorded traffic against local stand-ins, for offline load tests.
+
+Reads the traces written by traffic_recorder.py and drives the bot's real
+handlers (text, voice, photo/album, /clear, /reset) with the recorded
+arrival times, at 1x or faster. Everything outside the process is a
+stand-in that reproduces what was recorded: each chat completion waits its
+recorded latency and returns the recorded token counts, reply length and
+tool calls; each card render waits its recorded Gemini latency; each voice
+note waits its recorded transcription time; Telegram sends wait
+--telegram-latency. The bot's own code runs unchanged: per-user locks,
+cancellation, history files, the send queue, pipelined renders.
+
+    python replay_traffic.py traffic/traces-2026-10-18.jsonl
+    python replay_traffic.py traffic/*.jsonl --speed 10          # the day's evening peak in minutes
+    python replay_traffic.py traffic/*.jsonl --latency-scale 0.5 # as if providers were twice as fast
+
+It runs in a scratch directory (history, journal and artifacts don't touch
+the real ones) and prints turn latency per kind next to the recorded one,
+peak concurrency, event-loop lag and send-queue wait.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+SANDBOX_FILES = ["model_config.json", "system_prompt.md", "dictionary_card_prompt.md", "fantasy_locale_prompt.md"]
+HANDLED_KINDS = ("text", "voice", "photo", "clear", "reset")
+# A 1x1 PNG, standing in for every rendered card
+PLACEHOLDER_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082"
+)
+STAND_IN_CARD = {
+    "neologism_type": "dictionary", "word_or_place": "Replaywell", "pronunciation": "/ree-play-wel/",
+    "definition": "The feeling of living a day again at a different speed.",
+    "emotional_keywords": "uncanny, quick, familiar", "etymology": "From English replay + farewell",
+}
+
+# The trace the current update is replaying: {"trace", "calls", "lock"}
+_replaying = contextvars.ContextVar("replaying", default=None)
+
+
+def load_traces(paths: list, limit: int = None) -> list:
+    traces = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            traces.extend(json.loads(line) for line in f if line.strip())
+    traces = sorted((trace for trace in traces if trace.get("kind") in HANDLED_KINDS), key=lambda trace: trace["at"])
+    return traces[:limit] if limit else traces
+
+
+def make_sandbox() -> str:
+    """A scratch working directory with the bot's config, recording and quotas off"""
+    directory = tempfile.mkdtemp(prefix="replay-")
+    for name in SANDBOX_FILES:
+        shutil.copy(os.path.join(REPO_DIR, name), directory)
+    config_path = os.path.join(directory, "model_config.json")
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config["traffic_recording"] = {"enabled": False}
+    config["profiling"] = {"enabled": False}
+    config.setdefault("usage", {})["enabled"] = False
+    config.setdefault("word_of_the_day", {})["enabled"] = False
+    config.setdefault("dedup", {})["persist_path"] = None
+    config["artifacts"] = {"backend": "local", "root": "artifacts"}
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    return directory
+
+
+def synthetic_text(chars: int) -> str:
+    return ("la " * (chars // 3 + 1))[:chars].strip() or "la"
+
+
+def next_call(provider: str):
+    """The replaying trace's next recorded call to `provider`, or None"""
+    state = _replaying.get()
+    if state is None:
+        return None
+    with state["lock"]:
+        for index, call in enumerate(state["calls"]):
+            if call["provider"] == provider:
+                return state["calls"].pop(index)
+    return None
+
+
+def tool_arguments(name: str) -> dict:
+    if name == "generate_neologism_image":
+        return dict(STAND_IN_CARD)
+    if name == "echo":
+        return {"message": "la"}
+    return {}
+
+
+class StandIns:
+    """Replacements for the chat API, Gemini, transcription and Telegram"""
+
+    def __init__(self, latency_scale: float, telegram_latency: float):
+        self.latency_scale = latency_scale
+        self.telegram_latency = telegram_latency
+        self.card_path = None
+
+    async def create_chat_completion(self, hedge: bool = False, **kwargs):
+        call = next_call("openai") or {"seconds": 1.0, "prompt_tokens": 1500, "completion_tokens": 120,
+                                       "content_chars": 400, "tool_calls": []}
+        await asyncio.sleep(call["seconds"] * self.latency_scale)
+        tool_calls = [
+            SimpleNamespace(id=f"call_{index}", type="function",
+                            function=SimpleNamespace(name=name, arguments=json.dumps(tool_arguments(name))))
+            for index, name in enumerate(call.get("tool_calls", []))
+        ]
+        message = SimpleNamespace(content=synthetic_text(call.get("content_chars", 0)) if call.get("content_chars") else None,
+                                  tool_calls=tool_calls or None)
+        usage = SimpleNamespace(prompt_tokens=call.get("prompt_tokens", 0), completion_tokens=call.get("completion_tokens", 0),
+                                total_tokens=call.get("prompt_tokens", 0) + call.get("completion_tokens", 0))
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=finish_reason)], usage=usage)
+
+    def generate_neologism_image(self, **kwargs) -> str:
+        """Runs in a worker thread, like the real render"""
+        call = next_call("gemini") or {"seconds": 10.0}
+        time.sleep(call["seconds"] * self.latency_scale)
+        return f"IMAGE_PATH:{self.card_path}\n\n✨ Your card."
+
+    async def transcribe_clip(self, backend, audio_path: str, duration: float = None) -> str:
+        call = next_call("transcription") or {"seconds": 1.0, "transcript_chars": 120}
+        await asyncio.sleep(call["seconds"] * self.latency_scale)
+        return synthetic_text(call.get("transcript_chars", 120))
+
+    async def get_file(self, file_id: str):
+        """A photo to download (bot.store_photo fetches photos by file_id)"""
+        async def download_as_bytearray():
+            return bytearray(os.urandom(4096))
+        return SimpleNamespace(download_as_bytearray=download_as_bytearray)
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: str = None, **kwargs):
+        await asyncio.sleep(self.telegram_latency)
+        return SimpleNamespace(message_id=0, text=text)
+
+    async def send_photo(self, chat_id: int, photo, caption: str = None, parse_mode: str = None, **kwargs):
+        await asyncio.sleep(self.telegram_latency * 4)  # uploads take longer
+        return SimpleNamespace(message_id=0, photo=[SimpleNamespace(file_id="replay-card")])
+
+
+async def _no_op(*args, **kwargs):
+    return None
+
+
+def make_update(trace: dict, update_id: int, user_id: int):
+    """A stand-in Telegram Update with the recorded sizes"""
+    chat = SimpleNamespace(id=user_id, send_action=_no_op)
+    message = SimpleNamespace(message_id=update_id, chat=chat, text=None, caption=None,
+                              voice=None, photo=None, media_group_id=None)
+    kind = trace["kind"]
+    if kind == "text":
+        message.text = synthetic_text(trace.get("input_chars", 40))
+    elif kind in ("clear", "reset"):
+        message.text = f"/{kind}"
+    elif kind == "voice":
+        async def download_to_drive(path):
+            with open(path, 'wb') as f:
+                f.write(b"\0" * 1024)
+
+        async def get_voice_file():
+            return SimpleNamespace(download_to_drive=download_to_drive)
+        message.voice = SimpleNamespace(duration=trace.get("voice_seconds", 10), file_id=f"voice-{update_id}",
+                                        get_file=get_voice_file)
+    elif kind == "photo":
+        message.photo = [SimpleNamespace(file_id=f"photo-{update_id}")]
+        message.media_group_id = trace.get("album")
+    user = SimpleNamespace(id=user_id, username=None, first_name="Replay", last_name=None)
+    return SimpleNamespace(update_id=update_id, effective_user=user, effective_chat=chat, message=message)
+
+
+async def replay(traces: list, speed: float, stand_ins: StandIns) -> dict:
+    import bot
+    import metrics
+    from async_io import LoopLagMonitor
+    from telegram_sender import OutboundSender
+    import artifact_store
+
+    # Swap every outside dependency for its stand-in
+    bot.create_chat_completion = stand_ins.create_chat_completion
+    bot.transcribe_clip = stand_ins.transcribe_clip
+    bot.TOOL_FUNCTIONS['generate_neologism_image'] = stand_ins.generate_neologism_image
+    stand_ins.card_path = artifact_store.get_store().local_path(
+        artifact_store.get_store().put(PLACEHOLDER_PNG, "images", "png", {"word_or_place": "replay"})
+    )
+    outbound_settings = bot.config.get('outbound', {})
+    bot.outbound = OutboundSender(stand_ins, outbound_settings.get('global_per_second', 25),
+                                  outbound_settings.get('per_chat_interval', 1.0))
+    bot.outbound.start()
+    LoopLagMonitor().start()
+    os.makedirs(bot.CONVERSATIONS_DIR, exist_ok=True)
+
+    handlers = {
+        "text": bot.handle_message, "voice": bot.handle_voice_message, "photo": bot.handle_photo,
+        "clear": bot.handle_clear_command, "reset": bot.handle_reset_command,
+    }
+    context = SimpleNamespace(bot=stand_ins, args=[])
+    user_ids = {}
+    results = []
+    in_flight = 0
+    peak = 0
+
+    async def drive(trace: dict, update_id: int):
+        nonlocal in_flight, peak
+        user_id = user_ids.setdefault(trace.get("user"), 1000 + len(user_ids))
+        _replaying.set({"trace": trace, "calls": list(trace.get("calls", [])), "lock": threading.Lock()})
+        in_flight += 1
+        peak = max(peak, in_flight)
+        started = time.perf_counter()
+        try:
+            await handlers[trace["kind"]](make_update(trace, update_id, user_id), context)
+        except Exception as e:
+            logging.error(f"❌ Replayed {trace['kind']} update {update_id} failed: {e}")
+        finally:
+            in_flight -= 1
+        results.append({"kind": trace["kind"], "seconds": time.perf_counter() - started, "recorded": trace.get("seconds")})
+
+    loop = asyncio.get_running_loop()
+    first_at = traces[0]["at"]
+    replay_started = loop.time()
+    tasks = []
+    for index, trace in enumerate(traces):
+        delay = (trace["at"] - first_at) / speed - (loop.time() - replay_started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(drive(trace, 1 + index)))
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(bot.media_groups.window)  # let the last album flush
+    while bot.outbound.depth():
+        await asyncio.sleep(0.05)
+
+    return {
+        "results": results,
+        "peak_in_flight": peak,
+        "wall_seconds": loop.time() - replay_started,
+        "recorded_seconds": traces[-1]["at"] - first_at,
+        "loop_lag_p95": metrics.percentile("loop.lag", 95, 0.0),
+        "send_wait_p95": metrics.percentile("send_queue.wait", 95, 0.0),
+    }
+
+
+def _percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else 0.0
+
+
+def format_report(report: dict, speed: float) -> str:
+    lines = [
+        f"📼 Replayed {len(report['results'])} updates at {speed:g}x: "
+        f"{report['recorded_seconds']:.0f}s of traffic in {report['wall_seconds']:.0f}s",
+        f"  {'kind':6} {'n':>5}   {'replay p50':>10} {'p95':>8} {'p99':>8}   {'recorded p50':>12} {'p95':>8}",
+    ]
+    for kind in HANDLED_KINDS:
+        rows = [row for row in report["results"] if row["kind"] == kind]
+        if not rows:
+            continue
+        replayed = [row["seconds"] for row in rows]
+        recorded = [row["recorded"] for row in rows if row["recorded"] is not None]
+        lines.append(
+            f"  {kind:6} {len(rows):5}   {_percentile(replayed, 50):9.2f}s {_percentile(replayed, 95):7.2f}s "
+            f"{_percentile(replayed, 99):7.2f}s   {_percentile(recorded, 50):11.2f}s {_percentile(recorded, 95):7.2f}s"
+        )
+    lines.append(f"  peak in-flight updates: {report['peak_in_flight']}")
+    lines.append(f"  event loop lag p95: {report['loop_lag_p95'] * 1000:.1f}ms")
+    lines.append(f"  send queue wait p95: {report['send_wait_p95']:.2f}s")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded traffic against local stand-ins")
+    parser.add_argument("traces", nargs="+", help="Trace files written by traffic_recorder")
+    parser.add_argument("--speed", type=float, default=1.0, help="Arrival speed-up (10 = ten times faster)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier on recorded provider latencies")
+    parser.add_argument("--telegram-latency", type=float, default=0.05, help="Seconds per stand-in Telegram send")
+    parser.add_argument("--limit", type=int, help="Replay only the first N updates")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    traces = load_traces([os.path.abspath(path) for path in args.traces], args.limit)
+    if not traces:
+        sys.exit("No replayable traces found")
+
+    sandbox = make_sandbox()
+    os.chdir(sandbox)
+    sys.path.insert(0, REPO_DIR)
+    os.environ.setdefault("TELEGRAM_TOKEN", "replay")
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    print(f"📼 Replaying {len(traces)} updates from {len(args.traces)} file(s) in {sandbox}")
+    stand_ins = StandIns(args.latency_scale, args.telegram_latency)
+    with contextlib.redirect_stdout(io.StringIO()):  # the bot prints a line per conversation event
+        report = asyncio.run(replay(traces, args.speed, stand_ins))
+    print(format_report(report, args.speed))
+
+    if not args.keep:
+        shutil.rmtree(sandbox, ignore_errors=True)
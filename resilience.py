@@ -0,0 +1,271 @@
+"""
+Circuit breakers, fallback models and hedged requests for OpenAI and Gemini.
+
+Each provider gets a breaker that watches its recent calls. When too many of
+them fail or run slower than the latency threshold, the breaker opens, and
+calls go straight to the provider's configured fallback model, without waiting
+out timeouts on the degraded one. After a cool-down, one probe call tests the
+primary model again (half-open) and closes the breaker if it succeeds. Only
+that probe decides: calls that started before the breaker opened and finish
+later are ignored.
+
+Latency-critical async chat completions can also be hedged: if the first request
+hasn't answered by the recent p95 latency of the same model, a duplicate is
+sent and whichever returns first wins. Latencies are kept per model
+(`latency.<provider>.<model>`) as well as per provider, so a fast model's
+requests aren't hedged against a slow one's p95.
+
+Settings come from the "resilience" section of model_config.json, per
+provider; configure() is called by bot.py on import.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import metrics
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+PROBE = "probe"  # allow_primary()'s ticket for the one half-open probe call
+STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_SETTINGS = {
+    "fallback_model": None,
+    "failure_rate": 0.5,         # share of bad calls in the window that trips the breaker
+    "latency_threshold": 20.0,   # seconds; slower calls count as bad
+    "window": 20,                # recent calls considered
+    "min_calls": 5,              # don't judge on fewer calls than this
+    "open_seconds": 30,          # cool-down before a half-open probe
+    "hedge": False,
+    "hedge_min_delay": 2.0,      # never hedge earlier than this, in seconds
+    "hedge_min_samples": 20,     # p95 needs this many latencies to be trusted
+}
+
+_settings = {}
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider's breaker is open and it has no fallback model"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_rate: float, latency_threshold: float,
+                 window: int, min_calls: int, open_seconds: float, **_):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.latency_threshold = latency_threshold
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.outcomes = deque(maxlen=window)  # True = good call
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+        metrics.set_gauge(f"breaker.{name}.state", STATE_GAUGE[CLOSED])
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logging.warning(f"⚡ Circuit breaker '{self.name}': {self.state} → {state}")
+        self.state = state
+        metrics.increment(f"breaker.{self.name}.to_{state}")
+        metrics.set_gauge(f"breaker.{self.name}.state", STATE_GAUGE[state])
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        elif state == CLOSED:
+            self.outcomes.clear()
+
+    def allow_primary(self) -> Optional[str]:
+        """A ticket if the next call may use the primary model, else None.
+
+        The ticket is CLOSED for an ordinary call and PROBE for the half-open
+        probe; hand it back to record() or abandon() when the call ends.
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return CLOSED
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return PROBE
+            return None
+
+    def abandon(self, ticket: str):
+        """A call was cancelled: it says nothing about the provider, but frees the probe slot"""
+        with self.lock:
+            if ticket == PROBE:
+                self.probe_in_flight = False
+
+    def record(self, ticket: str, success: bool, latency: float):
+        good = success and latency <= self.latency_threshold
+        with self.lock:
+            if ticket == PROBE:
+                self.probe_in_flight = False
+                if self.state == HALF_OPEN:
+                    self._transition(CLOSED if good else OPEN)
+                return
+            if self.state != CLOSED:
+                return  # started before the breaker opened: only the probe decides now
+            self.outcomes.append(good)
+            if self.state == CLOSED and len(self.outcomes) >= self.min_calls:
+                bad_share = self.outcomes.count(False) / len(self.outcomes)
+                if bad_share >= self.failure_rate:
+                    self._transition(OPEN)
+
+
+def configure(settings: dict):
+    """Install per-provider settings (the "resilience" section of model_config.json)"""
+    global _settings
+    _settings = settings or {}
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def provider_settings(provider: str) -> dict:
+    return {**DEFAULT_SETTINGS, **_settings.get(provider, {})}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider, **provider_settings(provider))
+        return _breakers[provider]
+
+
+def _observe_latency(provider: str, model: str, seconds: float):
+    metrics.observe(f"latency.{provider}", seconds)
+    metrics.observe(f"latency.{provider}.{model}", seconds)
+
+
+def _timed(provider: str, model: str, call):
+    started = time.perf_counter()
+    try:
+        result = call(model)
+    except Exception:
+        metrics.increment(f"provider.{provider}.errors")
+        _observe_latency(provider, model, time.perf_counter() - started)
+        raise
+    _observe_latency(provider, model, time.perf_counter() - started)
+    return result
+
+
+def call_with_fallback(provider: str, primary_model: str, call):
+    """Call `call(model)` through the provider's breaker.
+
+    Uses the primary model while the breaker allows it, and the fallback
+    model when it is open or the primary call fails. Blocking; run it in a
+    worker thread from async code.
+    """
+    settings = provider_settings(provider)
+    breaker = get_breaker(provider)
+    fallback_model = settings["fallback_model"]
+
+    ticket = breaker.allow_primary()
+    if ticket:
+        started = time.perf_counter()
+        try:
+            result = _timed(provider, primary_model, call)
+            breaker.record(ticket, True, time.perf_counter() - started)
+            return result
+        except Exception as e:
+            breaker.record(ticket, False, time.perf_counter() - started)
+            if not fallback_model:
+                raise
+            logging.warning(f"⚠️ {provider} {primary_model} failed ({e}); retrying on {fallback_model}")
+        except BaseException:
+            breaker.abandon(ticket)  # cancelled turn
+            raise
+
+    if not fallback_model:
+        metrics.increment(f"provider.{provider}.rejected")
+        raise CircuitOpenError(f"{provider} is unavailable right now (circuit open)")
+
+    metrics.increment(f"provider.{provider}.fallback")
+    return _timed(provider, fallback_model, call)
+
+
+async def _timed_async(provider: str, model: str, call):
+    started = time.perf_counter()
+    try:
+        result = await call(model)
+    except Exception:
+        metrics.increment(f"provider.{provider}.errors")
+        _observe_latency(provider, model, time.perf_counter() - started)
+        raise
+    _observe_latency(provider, model, time.perf_counter() - started)
+    return result
+
+
+async def _hedged_async(provider: str, model: str, call, settings: dict):
+    """Await `call`, sending a duplicate if it hasn't answered by the model's recent p95.
+
+    The first answer wins; the losing request is cancelled rather than left running.
+    """
+    latency_metric = f"latency.{provider}.{model}"
+    if metrics.sample_count(latency_metric) < settings["hedge_min_samples"]:
+        return await _timed_async(provider, model, call)
+
+    delay = max(settings["hedge_min_delay"], metrics.percentile(latency_metric, 95))
+    pending = {asyncio.ensure_future(_timed_async(provider, model, call))}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return done.pop().result()
+
+        metrics.increment(f"provider.{provider}.hedged")
+        logging.info(f"🪞 Hedging {provider} request after {delay:.1f}s")
+        pending.add(asyncio.ensure_future(_timed_async(provider, model, call)))
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def call_with_fallback_async(provider: str, primary_model: str, call, hedge: bool = False):
+    """call_with_fallback for coroutine calls: `await call(model)`.
+
+    Cancelling the awaiting task cancels the request itself, and the breaker
+    doesn't count it as a failure.
+    """
+    settings = provider_settings(provider)
+    breaker = get_breaker(provider)
+    fallback_model = settings["fallback_model"]
+
+    ticket = breaker.allow_primary()
+    if ticket:
+        started = time.perf_counter()
+        try:
+            if hedge and settings["hedge"]:
+                result = await _hedged_async(provider, primary_model, call, settings)
+            else:
+                result = await _timed_async(provider, primary_model, call)
+            breaker.record(ticket, True, time.perf_counter() - started)
+            return result
+        except Exception as e:
+            breaker.record(ticket, False, time.perf_counter() - started)
+            if not fallback_model:
+                raise
+            logging.warning(f"⚠️ {provider} {primary_model} failed ({e}); retrying on {fallback_model}")
+        except BaseException:
+            breaker.abandon(ticket)
+            raise
+
+    if not fallback_model:
+        metrics.increment(f"provider.{provider}.rejected")
+        raise CircuitOpenError(f"{provider} is unavailable right now (circuit open)")
+
+    metrics.increment(f"provider.{provider}.fallback")
+    return await _timed_async(provider, fallback_model, call)
@@ -0,0 +1,115 @@
+"""
+Startup time budget for Soliloquy.
+
+Every Railway redeploy leaves users without replies until polling starts, so
+bot.py times each startup phase and logs a report before it begins polling.
+
+For a module-level breakdown of import cost, run the interpreter's own
+import profiler and summarise it:
+
+    python -X importtime -c "import bot" 2> importtime.log
+    python startup_report.py importtime.log
+
+or let this script do both:
+
+    python startup_report.py --run
+"""
+
+import logging
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """Collects wall-clock durations of named startup phases"""
+
+    def __init__(self, started_at: float = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name: str):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - phase_start))
+
+    def record(self, name: str, seconds: float):
+        """Record a phase that was timed elsewhere (e.g. module import)"""
+        self.phases.append((name, seconds))
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started_at
+        lines = ["⏱️ Startup time budget:"]
+        for name, seconds in self.phases:
+            share = (seconds / total * 100) if total > 0 else 0
+            lines.append(f"  {name:<28} {seconds * 1000:8.1f} ms  {share:5.1f}%")
+        lines.append(f"  {'total (process → ready)':<28} {total * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+    def log_report(self):
+        logging.info(self.report())
+
+
+def parse_importtime(lines):
+    """Parse `python -X importtime` output into (module, self_us, cumulative_us) rows"""
+    rows = []
+    for line in lines:
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|", 2)
+            # Nested imports are indented after the single separator space
+            rows.append((module[1:].rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def summarize_importtime(lines, top: int = 15) -> str:
+    """Top-level packages ranked by cumulative import time"""
+    rows = parse_importtime(lines)
+    # Only top-level entries (no leading indentation) carry their whole subtree
+    top_level = [(module, cumulative) for module, _, cumulative in rows if not module.startswith(" ")]
+    top_level.sort(key=lambda row: row[1], reverse=True)
+    total = sum(cumulative for _, cumulative in top_level)
+
+    lines_out = [f"📦 Import time: {total / 1000:.1f} ms across {len(rows)} modules"]
+    for module, cumulative in top_level[:top]:
+        lines_out.append(f"  {module:<40} {cumulative / 1000:8.1f} ms")
+    return "\n".join(lines_out)
+
+
+def run_importtime(target: str = "bot"):
+    """Import `target` under -X importtime in a fresh interpreter and return its report lines"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print(f"⚠️ Importing {target} exited with {result.returncode}; report may be partial")
+    return result.stderr.splitlines()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Summarise Soliloquy import-time cost")
+    parser.add_argument("logfile", nargs="?", help="Saved stderr of `python -X importtime`")
+    parser.add_argument("--run", action="store_true", help="Run the import profiler on bot.py now")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to show")
+    args = parser.parse_args()
+
+    if args.run:
+        report_lines = run_importtime()
+    elif args.logfile:
+        with open(args.logfile, "r", encoding="utf-8") as f:
+            report_lines = f.read().splitlines()
+    else:
+        parser.error("pass an importtime log file or --run")
+
+    print(summarize_importtime(report_lines, top=args.top))
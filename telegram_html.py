@@ -0,0 +1,374 @@
+"""
+Helpers for Telegram's HTML parse mode.
+
+render_html() turns a model reply into HTML Telegram will accept, in one
+pass: **bold** and *italic* become <b> and <i>, stray <, > and & are escaped,
+unsupported tags are escaped (or, for <br>, become newlines), and every tag is
+balanced. A reply that Telegram refused with "can't parse entities" used to
+fail the whole turn after the model had already been paid for.
+to_plain_text() is the last resort telegram_sender falls back to if Telegram
+still rejects the markup.
+
+Telegram rejects messages longer than 4096 characters (1024 for photo
+captions). split_html() cuts long HTML replies into chunks that stay under
+the limit without breaking a tag or an entity. Tags still open at a cut are
+closed at the end of the chunk and reopened at the start of the next.
+"""
+
+import html
+import re
+import time
+
+import metrics
+
+MESSAGE_LIMIT = 4096
+CAPTION_LIMIT = 1024
+
+TOKEN_PATTERN = re.compile(r"<[^<>]+>|&#?\w+;|[^<&]+|[<&]")
+TAG_PATTERN = re.compile(r"<\s*(/?)\s*([a-zA-Z][\w-]*)[^>]*>")
+
+
+# Tags Telegram's HTML mode understands; the ones that may carry attributes keep them
+SUPPORTED_TAGS = {"b", "strong", "i", "em", "u", "ins", "s", "strike", "del",
+                  "a", "code", "pre", "blockquote", "span", "tg-spoiler", "tg-emoji"}
+TAGS_WITH_ATTRIBUTES = {"a", "code", "pre", "blockquote", "span", "tg-emoji"}
+LITERAL_TAGS = {"code", "pre"}  # no markdown or nested markup inside, except <code> in <pre>
+ENTITY_NAMES = {"lt", "gt", "amp", "quot"}  # the only named entities Telegram accepts
+
+# render_html() jumps between "<", "&" and "*" with str.find and copies the
+# text in between as slices; only these anchored patterns run on the specials
+TAG_AT = re.compile(r"<(/\s*)?([a-zA-Z][\w-]*)([^<>]*)>")
+ENTITY_AT = re.compile(r"&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[a-zA-Z]+);")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+PLAIN_TAG_PATTERN = re.compile(r"</?[a-zA-Z][\w-]*[^<>]*>")
+
+
+class _RenderState:
+    """What render_html() has written so far, and the elements still open"""
+    __slots__ = ("text", "out", "stack", "markdown_open", "literal", "repairs", "converted")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.out = []
+        # Open elements, innermost last: [name, opening tag, index in `out`, from markdown].
+        # A markdown opener writes its marker literally until its closer turns up;
+        # then the marker in `out` is swapped for the tag.
+        self.stack = []
+        self.markdown_open = 0  # markdown openers on the stack
+        self.literal = 0  # open <code>/<pre> elements
+        self.repairs = 0
+        self.converted = 0
+
+
+def _escape_run(state: _RenderState, run: str) -> str:
+    """A plain-text run with its stray ">" escaped"""
+    if ">" in run:
+        state.repairs += run.count(">")
+        run = run.replace(">", "&gt;")
+    return run
+
+
+def _drop_markdown_openers(state: _RenderState):
+    # Unclosed markdown markers stay as the literal asterisks already in `out`
+    state.stack[:] = [element for element in state.stack if not element[3]]
+    state.markdown_open = 0
+
+
+def _open_tag(state: _RenderState, name: str, opening: str, markdown: bool = False):
+    state.stack.append([name, opening, len(state.out), markdown])
+    state.out.append(opening)
+    if markdown:
+        state.markdown_open += 1
+    elif name in LITERAL_TAGS:
+        state.literal += 1
+
+
+def _close_element(state: _RenderState, position: int):
+    """Close stack[position], closing and reopening the HTML elements nested in it"""
+    stack, out = state.stack, state.out
+    if position == len(stack) - 1:  # the usual case: nothing nested inside
+        name, _, _, markdown = stack.pop()
+        out.append(f"</{name}>")
+        if markdown:
+            state.markdown_open -= 1
+        elif name in LITERAL_TAGS:
+            state.literal -= 1
+        return
+    closed = stack[position:]
+    del stack[position:]
+    reopen = [element for element in closed[1:] if not element[3]]
+    if len(closed) > 1:
+        state.repairs += 1
+    for name, _, _, _ in reversed(reopen):
+        out.append(f"</{name}>")
+    out.append(f"</{closed[0][0]}>")
+    for element in closed:
+        if element[3]:
+            state.markdown_open -= 1
+        elif element[0] in LITERAL_TAGS:
+            state.literal -= 1
+    for name, opening, _, _ in reopen:
+        _open_tag(state, name, opening)
+
+
+def _find_open(state: _RenderState, name: str, markdown: bool):
+    """Position of the innermost open `name` element, or None"""
+    stack = state.stack
+    for position in range(len(stack) - 1, -1, -1):
+        if stack[position][0] == name and stack[position][3] == markdown:
+            return position
+    return None
+
+
+def _emphasis(state: _RenderState, end: int, marker: str, name: str):
+    """A markdown marker: close the open one it pairs with, or open one if it can start emphasis"""
+    stack = state.stack
+    if not state.markdown_open:
+        position = None
+    elif stack[-1][0] == name and stack[-1][3]:
+        position = len(stack) - 1
+    else:
+        position = _find_open(state, name, markdown=True)
+    if position is not None:
+        state.out[stack[position][2]] = f"<{name}>"
+        _close_element(state, position)
+        state.converted += 1
+        return
+    following = state.text[end:end + 1]
+    if following and not following.isspace() and following != "*":
+        _open_tag(state, name, marker, markdown=True)
+    else:
+        state.out.append(marker)  # "5 * 3", "* bullet"
+
+
+def _render_tag(state: _RenderState, special: int) -> int:
+    """Render the "<" at `special`; returns where the text after it starts"""
+    match = TAG_AT.match(state.text, special)
+    if match is None:
+        state.out.append("&lt;")
+        state.repairs += 1
+        return special + 1
+    token = match.group(0)
+    name = match.group(2).lower()
+    closing = match.group(1) is not None
+    if state.literal and not (name in LITERAL_TAGS and (closing or name == "code")):
+        state.out.append(html.escape(token, quote=False))
+        state.repairs += 1
+    elif name == "br":
+        state.out.append("\n")
+        state.repairs += 1
+    elif name not in SUPPORTED_TAGS:
+        state.out.append(html.escape(token, quote=False))
+        state.repairs += 1
+    elif closing:
+        element = _find_open(state, name, markdown=False)
+        if element is None:
+            state.repairs += 1  # a closing tag with nothing to close is dropped
+        else:
+            _close_element(state, element)
+    else:
+        attributes = match.group(3)
+        if not attributes.strip():
+            token = f"<{name}>"  # "<b >" and "<B>" alike
+        elif name not in TAGS_WITH_ATTRIBUTES:
+            token = f"<{name}>"
+            state.repairs += 1
+        _open_tag(state, name, token)
+    return match.end()
+
+
+def _render_entity(state: _RenderState, special: int) -> int:
+    """Render the "&" at `special`; returns where the text after it starts"""
+    match = ENTITY_AT.match(state.text, special)
+    if match is None:
+        state.out.append("&amp;")
+        state.repairs += 1
+        return special + 1
+    token = match.group(0)
+    if token[1] == "#" or token[1:-1] in ENTITY_NAMES:
+        state.out.append(token)
+    else:
+        state.out.append("&amp;" + token[1:])  # e.g. &nbsp; is rejected by Telegram
+        state.repairs += 1
+    return match.end()
+
+
+def _render_stars(state: _RenderState, special: int, next_tag: int, next_entity: int) -> int:
+    """Render the run of "*" at `special`; returns where the text after it starts"""
+    text = state.text
+    length = len(text)
+    end = special + 1
+    while end < length and end - special < 3 and text[end] == "*":
+        end += 1
+    stars = end - special
+    closer = -1
+    if stars < 3 and not state.markdown_open and not state.literal and not text[end:end + 1].isspace():
+        # The usual case, *word* or **a phrase** with no markup inside:
+        # convert the pair in one step instead of two trips round the loop
+        closer = text.find("*", end)
+        marker = text[special:end]
+        if (closer < 0 or closer > next_tag or closer > next_entity
+                or not text.startswith(marker, closer) or text[closer + stars:closer + stars + 1] == "*"):
+            closer = -1
+        else:
+            run = text[end:closer]
+            if "\n" in run and PARAGRAPH_BREAK.search(run):
+                closer = -1
+    if closer > 0:
+        name = "b" if stars == 2 else "i"
+        state.out.append(f"<{name}>{_escape_run(state, run)}</{name}>")
+        state.converted += 1
+        return closer + stars
+    if state.literal:
+        state.out.append(text[special:end])
+    elif stars == 1:
+        _emphasis(state, end, "*", "i")
+    elif stars == 2:
+        _emphasis(state, end, "**", "b")
+    elif state.markdown_open and _find_open(state, "i", markdown=True) is not None:
+        # ***both***: opens <b><i>, closes </i></b>
+        _emphasis(state, end, "*", "i")
+        _emphasis(state, end, "**", "b")
+    else:
+        _emphasis(state, end, "**", "b")
+        _emphasis(state, end, "*", "i")
+    return end
+
+
+def render_html(text: str) -> str:
+    """Model reply -> balanced Telegram HTML, in a single left-to-right pass"""
+    if not text:
+        return text
+    started = time.perf_counter()
+    length = len(text)
+    next_tag = text.find("<") % (length + 1)  # not found (-1) -> length
+    next_entity = text.find("&") % (length + 1)
+    next_star = text.find("*") % (length + 1)
+    if next_tag == next_entity == next_star == length and ">" not in text:
+        metrics.observe("render.seconds", time.perf_counter() - started)
+        return text  # nothing to convert or escape
+    state = _RenderState(text)
+
+    position = 0
+    while True:
+        special = next_tag if next_tag < next_entity else next_entity
+        if next_star < special:
+            special = next_star
+        if special > position:
+            run = _escape_run(state, text[position:special])
+            if state.markdown_open and not state.literal and "\n" in run and PARAGRAPH_BREAK.search(run):
+                _drop_markdown_openers(state)  # emphasis never spans paragraphs
+            state.out.append(run)
+        if special == length:
+            break
+
+        if special == next_tag:
+            end = _render_tag(state, special)
+        elif special == next_entity:
+            end = _render_entity(state, special)
+        else:
+            end = _render_stars(state, special, next_tag, next_entity)
+
+        position = end
+        if next_tag < end:
+            next_tag = text.find("<", end) % (length + 1)
+        if next_entity < end:
+            next_entity = text.find("&", end) % (length + 1)
+        if next_star < end:
+            next_star = text.find("*", end) % (length + 1)
+
+    if state.markdown_open:
+        _drop_markdown_openers(state)
+    if state.stack:
+        state.repairs += 1  # tags left open by the model
+        state.out.extend(f"</{element[0]}>" for element in reversed(state.stack))
+
+    metrics.observe("render.seconds", time.perf_counter() - started)
+    if state.converted:
+        metrics.increment("render.markdown_converted")
+    if state.repairs:
+        metrics.increment("render.repaired")
+    return "".join(state.out)
+
+
+def to_plain_text(text: str) -> str:
+    """Telegram HTML -> plain text (tags dropped, entities decoded)"""
+    return html.unescape(PLAIN_TAG_PATTERN.sub("", text))
+
+
+def tokenize(text: str) -> list:
+    """Split HTML into tags, entities and text runs"""
+    return TOKEN_PATTERN.findall(text)
+
+
+def closing_tags(open_tags: list) -> str:
+    return "".join(f"</{name}>" for name, _ in reversed(open_tags))
+
+
+def split_text_run(run: str, room: int) -> tuple:
+    """Cut a plain-text run at the best boundary that fits in `room` characters"""
+    window = run[:room]
+    for separator in ("\n\n", "\n", " "):
+        cut = window.rfind(separator)
+        if cut > room // 3:
+            return run[:cut + len(separator)], run[cut + len(separator):]
+    return window, run[room:]
+
+
+def split_html(text: str, limit: int = MESSAGE_LIMIT) -> list:
+    """Split Telegram HTML into chunks of at most `limit` characters, keeping tags balanced"""
+    if len(text) <= limit:
+        return [text]
+
+    chunks = []
+    open_tags = []  # (name, full opening tag), innermost last
+    current = ""
+    has_text = False  # whether `current` holds anything besides re-opened tags
+
+    def flush():
+        nonlocal current, has_text
+        if has_text:
+            chunks.append(current + closing_tags(open_tags))
+        current = "".join(tag for _, tag in open_tags)
+        has_text = False
+
+    tokens = tokenize(text)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        tag_match = TAG_PATTERN.fullmatch(token)
+        is_text = not tag_match and not token.startswith("&")
+
+        # Reserve room to close the open tags (and this one, if it opens a tag)
+        reserve = len(closing_tags(open_tags))
+        if tag_match and not tag_match.group(1):
+            reserve += len(tag_match.group(2)) + 3
+        room = limit - len(current) - reserve
+        if not has_text and room <= 0:
+            # Tags nested too deep to fit anything; let this chunk run over rather than stall
+            room = limit // 4
+
+        if len(token) <= room or not has_text and not is_text:
+            current += token
+            if tag_match:
+                name = tag_match.group(2).lower()
+                if not tag_match.group(1):
+                    open_tags.append((name, token))
+                elif open_tags and open_tags[-1][0] == name:
+                    open_tags.pop()
+            else:
+                has_text = True
+            index += 1
+        elif is_text and room > 0:
+            # A long text run: take what fits and carry the rest to the next chunk
+            head, tail = split_text_run(token, room)
+            current += head
+            has_text = True
+            tokens[index] = tail
+            flush()
+        else:
+            flush()
+
+    if has_text:
+        chunks.append(current + closing_tags(open_tags))
+    return chunks
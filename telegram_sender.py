@@ -0,0 +1,212 @@
+"""
+Outbound Telegram send queue.
+
+All replies go through one OutboundSender. It keeps Telegram's flood limits
+(roughly one message per second per chat, about thirty per second overall),
+so sends aren't rejected, and it handles RetryAfter by waiting the time
+Telegram asks for and trying again, so the user still gets the message.
+
+Each chat has its own FIFO queue, so a card and its follow-up text arrive in
+order. Across chats, the dispatcher picks the highest-priority head that is
+ready to go: short text replies go before photo uploads. Long HTML text is
+split at tag boundaries to fit the 4096-character limit. A caption over 1024
+characters is sent as a text message after the photo. If Telegram still
+can't parse a message's HTML, it is resent once as plain text
+(`send.bad_markup`) rather than failing the turn.
+
+The time each message waits in the queue is observed as `send_queue.wait`.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+import metrics
+from async_io import exists, read_bytes, run_in_background
+from telegram_html import split_html, to_plain_text, MESSAGE_LIMIT, CAPTION_LIMIT
+
+TEXT_PRIORITY = 0
+PHOTO_PRIORITY = 1
+
+
+def as_plain_text(kwargs: dict) -> dict:
+    """The same send without parse_mode, its text or caption stripped of markup"""
+    plain = {**kwargs, "parse_mode": None}
+    for field in ("text", "caption"):
+        if plain.get(field):
+            plain[field] = to_plain_text(plain[field])
+    return plain
+
+
+def fail(job, error: Exception):
+    """Fail a job's future, unless its caller has already given up on it"""
+    if not job.future.done():
+        job.future.set_exception(error)
+
+
+class OutboundJob:
+    def __init__(self, chat_id: int, priority: int, method: str, kwargs: dict):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.method = method
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class OutboundSender:
+    def __init__(self, bot, global_per_second: float = 25, per_chat_interval: float = 1.0, max_retries: int = 3):
+        self.bot = bot
+        self.global_interval = 1.0 / global_per_second
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.chat_queues = {}        # chat_id -> deque of OutboundJob
+        self.chat_ready_at = {}      # chat_id -> monotonic time the next send may start
+        self.chat_busy = set()       # chats with a send in flight (keeps per-chat order)
+        self.global_ready_at = 0.0
+        self.wakeup = asyncio.Event()
+        self.dispatcher = None
+
+    def start(self):
+        if self.dispatcher is None:
+            self.dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self):
+        if self.dispatcher:
+            self.dispatcher.cancel()
+            self.dispatcher = None
+
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self.chat_queues.values())
+
+    def _enqueue(self, job: OutboundJob) -> asyncio.Future:
+        self.start()
+        self.chat_queues.setdefault(job.chat_id, deque()).append(job)
+        metrics.set_gauge("send_queue.depth", self.depth())
+        self.wakeup.set()
+        return job.future
+
+    def _enqueue_text(self, chat_id: int, text: str, parse_mode: str, kwargs: dict) -> list:
+        return [
+            self._enqueue(OutboundJob(chat_id, TEXT_PRIORITY, "send_message",
+                                      {"text": chunk, "parse_mode": parse_mode, **kwargs}))
+            for chunk in split_html(text, MESSAGE_LIMIT)
+        ]
+
+    async def send_text(self, chat_id: int, text: str, parse_mode: str = 'HTML', **kwargs):
+        """Queue a text message (split if too long); returns the last Message sent"""
+        results = await asyncio.gather(*self._enqueue_text(chat_id, text, parse_mode, kwargs))
+        return results[-1]
+
+    async def send_photo(self, chat_id: int, photo, caption: str = None, parse_mode: str = 'HTML'):
+        """Queue a photo (file path, file_id or bytes); returns the photo's Message"""
+        overflow = None
+        if caption and len(caption) > CAPTION_LIMIT:
+            caption, overflow = None, caption
+
+        photo_future = self._enqueue(OutboundJob(chat_id, PHOTO_PRIORITY, "send_photo",
+                                                 {"photo": photo, "caption": caption, "parse_mode": parse_mode}))
+        if overflow:
+            # Queued right behind the photo in this chat's FIFO, so it lands after it
+            await asyncio.gather(photo_future, *self._enqueue_text(chat_id, overflow, parse_mode, {}))
+        return await photo_future
+
+    def _next_ready_job(self, now: float):
+        """Highest-priority queue head whose chat may send now; else (None, earliest ready time)"""
+        best, earliest = None, None
+        for chat_id, queue in self.chat_queues.items():
+            if not queue or chat_id in self.chat_busy:
+                continue
+            ready_at = self.chat_ready_at.get(chat_id, 0.0)
+            if ready_at > now:
+                earliest = ready_at if earliest is None else min(earliest, ready_at)
+                continue
+            head = queue[0]
+            if best is None or (head.priority, head.enqueued_at) < (best.priority, best.enqueued_at):
+                best = head
+        return best, earliest
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            if self.global_ready_at > now:
+                await asyncio.sleep(self.global_ready_at - now)
+                continue
+
+            job, earliest = self._next_ready_job(now)
+            if job is None:
+                self.wakeup.clear()
+                timeout = (earliest - now) if earliest else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.chat_queues[job.chat_id].popleft()
+            if not self.chat_queues[job.chat_id]:
+                del self.chat_queues[job.chat_id]
+            metrics.set_gauge("send_queue.depth", self.depth())
+            if job.future.done():
+                # Its caller was cancelled (e.g. the turn was /clear-ed): don't send it
+                metrics.increment("send.cancelled")
+                continue
+
+            self.chat_busy.add(job.chat_id)
+            self.global_ready_at = now + self.global_interval
+            run_in_background(self._send(job))
+
+    async def _send(self, job: OutboundJob):
+        from telegram.error import BadRequest, RetryAfter, TimedOut, NetworkError
+
+        if job.attempts == 0:
+            metrics.observe("send_queue.wait", time.monotonic() - job.enqueued_at)
+        job.attempts += 1
+        retry_in = None
+        try:
+            kwargs = dict(job.kwargs)
+            photo = kwargs.get("photo")
+            if isinstance(photo, str) and await exists(photo):
+                # A local path: read it off the loop (per attempt, nothing to rewind on retry)
+                kwargs["photo"] = await read_bytes(photo)
+            result = await getattr(self.bot, job.method)(chat_id=job.chat_id, **kwargs)
+            metrics.increment(f"send.{job.method}")
+            if not job.future.done():
+                job.future.set_result(result)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            retry_in = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+            metrics.increment("send.retry_after")
+            logging.warning(f"🚦 Flood control for chat {job.chat_id}: retrying in {retry_in:.0f}s")
+        except BadRequest as e:
+            # A subclass of NetworkError, but retrying the same markup can't help
+            if job.kwargs.get("parse_mode") and "parse entities" in str(e).lower():
+                metrics.increment("send.bad_markup")
+                logging.warning(f"🧩 Telegram rejected the markup for chat {job.chat_id} ({e}); resending as plain text")
+                job.kwargs = as_plain_text(job.kwargs)
+                retry_in = 0
+            else:
+                metrics.increment("send.failed")
+                fail(job, e)
+        except (TimedOut, NetworkError) as e:
+            retry_in = 2 ** job.attempts
+            logging.warning(f"⚠️ Send to chat {job.chat_id} failed ({e}); retrying in {retry_in}s")
+        except Exception as e:
+            metrics.increment("send.failed")
+            fail(job, e)
+        finally:
+            self.chat_busy.discard(job.chat_id)
+            self.chat_ready_at[job.chat_id] = time.monotonic() + max(self.per_chat_interval, retry_in or 0)
+
+        if retry_in is not None and job.future.done():
+            metrics.increment("send.cancelled")  # cancelled while this attempt was out
+        elif retry_in is not None:
+            if job.attempts > self.max_retries:
+                metrics.increment("send.failed")
+                fail(job, RuntimeError(f"Gave up sending to chat {job.chat_id} after {job.attempts} attempts"))
+            else:
+                # Back to the front of this chat's queue to keep its order
+                self.chat_queues.setdefault(job.chat_id, deque()).appendleft(job)
+        self.wakeup.set()
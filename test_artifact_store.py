@@ -0,0 +1,44 @@
+"""
+Behaviour of artifact_store's local backend: run with `python -m pytest test_artifact_store.py`.
+"""
+
+import hashlib
+import os
+
+from artifact_store import LocalArtifactStore, content_key
+
+
+def test_keys_are_sharded_by_content_hash():
+    digest = hashlib.sha256(b"card").hexdigest()
+    assert content_key(b"card", "images", ".png") == f"images/{digest[:2]}/{digest[2:4]}/{digest}.png"
+
+
+def test_put_stores_bytes_and_metadata(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+    key = store.put(b"card", "images", "png", {"word_or_place": "Eclipsera"})
+    assert store.exists(key)
+    assert store.get(key) == b"card"
+    assert store.metadata(key)["word_or_place"] == "Eclipsera"
+    assert store.local_path(key) == os.path.join(str(tmp_path), *key.split("/"))
+
+
+def test_same_bytes_are_stored_once(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+    first = store.put(b"card", "images", "png", {"n": 1})
+    second = store.put(b"card", "images", "png", {"n": 2})
+    assert first == second
+    assert store.metadata(first)["n"] == 1
+
+
+def test_writes_leave_no_temporary_files(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+    for index in range(5):
+        store.put(f"card {index}".encode(), "images", "png")
+    leftovers = [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+    assert leftovers == []
+
+
+def test_missing_artifact_has_no_metadata(tmp_path):
+    store = LocalArtifactStore(str(tmp_path))
+    assert not store.exists("images/00/00/none.png")
+    assert store.metadata("images/00/00/none.png") == {}
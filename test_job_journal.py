@@ -0,0 +1,111 @@
+"""
+Behaviour of job_journal and the bot's resume of journalled turns:
+run with `python -m pytest test_job_journal.py`.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import job_journal
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_journal, "JOURNAL_DB", str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(job_journal, "_connection", None)
+    yield
+    job_journal.get_connection().close()
+
+
+def accept(update_id: int, kind: str = "text", payload: dict = None) -> bool:
+    return job_journal.accept(update_id, 42, 7, "ada", kind, payload or {"user_input": f"turn {update_id}"})
+
+
+def unfinished_ids() -> list:
+    return [job["update_id"] for job in job_journal.unfinished_jobs()]
+
+
+def test_an_update_is_journalled_once():
+    assert accept(1) is True
+    assert accept(1) is False
+
+
+def test_only_accepted_and_responded_jobs_are_unfinished():
+    for update_id in range(1, 6):
+        accept(update_id)
+    job_journal.mark_responded(2, "reply")
+    job_journal.mark_delivered(3)
+    job_journal.mark_failed(4)
+    job_journal.mark_cancelled(5)
+    assert unfinished_ids() == [1, 2]
+
+
+def test_stale_jobs_are_abandoned():
+    accept(1)
+    job_journal.get_connection().execute("UPDATE jobs SET created_at = '2000-01-01 00:00:00'")
+    assert unfinished_ids() == []
+
+
+def test_attempts_are_counted():
+    accept(1)
+    assert job_journal.record_attempt(1) == 1
+    assert job_journal.record_attempt(1) == 2
+
+
+@pytest.fixture
+def bot(tmp_path, monkeypatch):
+    bot = pytest.importorskip("bot")
+    monkeypatch.setattr(bot, "CONVERSATIONS_DIR", str(tmp_path))
+    sent, model_calls = [], []
+
+    async def send_text(chat_id, text, **kwargs):
+        sent.append((chat_id, text))
+
+    async def process_user_message(user_input, user_id, username, *args, update_id=None, **kwargs):
+        model_calls.append(user_input)
+        return f"reply to {user_input}"
+
+    monkeypatch.setattr(bot, "outbound", SimpleNamespace(send_text=send_text))
+    monkeypatch.setattr(bot, "process_user_message", process_user_message)
+    return SimpleNamespace(module=bot, sent=sent, model_calls=model_calls, application=SimpleNamespace(bot=None))
+
+
+def resume(bot, update_id: int):
+    [job] = [job for job in job_journal.unfinished_jobs() if job["update_id"] == update_id]
+    asyncio.run(bot.module.resume_job(bot.application, job))
+
+
+def test_responded_job_is_only_resent(bot):
+    accept(1)
+    job_journal.mark_responded(1, "stored reply")
+    resume(bot, 1)
+    assert bot.sent == [(42, "stored reply")]
+    assert bot.model_calls == []
+    assert unfinished_ids() == []
+
+
+def test_accepted_job_already_in_history_is_not_run_again(bot):
+    accept(1)
+    bot.module.add_to_conversation_history(7, "turn 1", "reply from before the restart", update_id=1)
+    resume(bot, 1)
+    assert bot.sent == [(42, "reply from before the restart")]
+    assert bot.model_calls == []
+
+
+def test_accepted_job_is_run_once_and_delivered(bot):
+    accept(1)
+    resume(bot, 1)
+    assert bot.model_calls == ["turn 1"]
+    assert bot.sent == [(42, "reply to turn 1")]
+    assert unfinished_ids() == []
+
+
+def test_resume_gives_up_after_max_attempts(bot):
+    accept(1)
+    for _ in range(job_journal.MAX_ATTEMPTS):
+        job_journal.record_attempt(1)
+    asyncio.run(bot.module.resume_unfinished_jobs(bot.application))
+    assert bot.model_calls == []
+    assert unfinished_ids() == []
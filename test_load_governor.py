@@ -0,0 +1,98 @@
+"""
+Behaviour of load_governor and the bot's deferred cards:
+run with `python -m pytest test_load_governor.py`.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from load_governor import LoadGovernor
+from tool_functions import DEFERRED_ACKNOWLEDGEMENTS
+
+LEVELS = [
+    {"name": "trim", "in_flight_turns": 4, "max_history": 6},
+    {"name": "fast", "in_flight_turns": 8, "model": "fast-model"},
+    {"name": "shed", "in_flight_turns": 12, "shed_cards": True},
+]
+
+
+def make_governor(turns: list, **settings):
+    return LoadGovernor({"enabled": True, "levels": LEVELS, "recover_ratio": 0.5,
+                         "recover_after_seconds": 0, **settings}, lambda: turns[0])
+
+
+def test_goes_straight_to_the_highest_level_met():
+    turns = [9]
+    governor = make_governor(turns)
+    governor.evaluate()
+    assert governor.level == 2
+    assert governor.model_override() == "fast-model"
+    assert governor.history_limit() == 6  # the level below still applies
+    assert not governor.shed_cards()
+
+
+def test_comes_down_one_level_at_a_time_once_calm():
+    turns = [13]
+    governor = make_governor(turns)
+    governor.evaluate()
+    assert governor.level == 3
+    turns[0] = 0
+    governor.evaluate()  # starts the calm period
+    assert governor.level == 3
+    levels = []
+    for _ in range(3):
+        governor.evaluate()
+        levels.append(governor.level)
+    assert levels == [2, 1, 0]
+
+
+def test_stays_up_while_near_the_threshold():
+    turns = [8]
+    governor = make_governor(turns)
+    governor.evaluate()
+    turns[0] = 5  # below 8, but not below recover_ratio * 8
+    for _ in range(3):
+        governor.evaluate()
+    assert governor.level == 2
+
+
+def test_latency_signal_uses_the_recent_p95():
+    governor = LoadGovernor({"enabled": True, "levels": [{"chat_p95_seconds": 5, "max_history": 2}]})
+    for seconds in [1.0] * 18 + [9.0] * 2:
+        governor.observe_chat_latency(seconds)
+    governor.evaluate()
+    assert governor.history_limit() == 2
+
+
+def test_deferred_card_is_not_acknowledged_as_made():
+    acknowledgement = DEFERRED_ACKNOWLEDGEMENTS["generate_neologism_image"](
+        word_or_place="Farewellow", caption="Here is your card.")
+    assert "Farewellow" in acknowledgement
+    assert "created" not in acknowledgement and "Here is" not in acknowledgement
+
+
+def test_clearing_cancels_the_users_deferred_cards(monkeypatch):
+    bot = pytest.importorskip("bot")
+    sent = []
+
+    async def send_text(chat_id, text):
+        sent.append(text)
+
+    monkeypatch.setattr(bot, "outbound", SimpleNamespace(send_text=send_text), raising=False)
+
+    async def scenario():
+        renders = [asyncio.create_task(asyncio.sleep(5)) for _ in range(2)]
+        bot.deliver_deferred_card(42, 7, 1, {"word_or_place": "Farewellow"}, renders[0])
+        bot.deliver_deferred_card(43, 8, 2, {"word_or_place": "Lantern Docks"}, renders[1])
+        await asyncio.sleep(0)
+        assert bot.cancel_deferred_cards(7) == 1
+        await asyncio.sleep(0.01)
+        assert renders[0].cancelled() and not renders[1].done()
+        assert list(bot._deferred_cards) == [8]
+        assert sent == []  # a cancelled card isn't reported as a failed render
+        bot.cancel_deferred_cards(8)
+        await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
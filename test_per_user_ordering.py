@@ -0,0 +1,70 @@
+"""
+Per-user serialization under concurrent updates: run with
+`python -m pytest test_per_user_ordering.py`.
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+bot = pytest.importorskip("bot")
+
+
+def make_update(user_id: int, label: str):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), label=label)
+
+
+def run_concurrently(handler, updates):
+    """Dispatch every update as its own task, in arrival order, as concurrent_updates does"""
+    async def main():
+        await asyncio.gather(*(asyncio.ensure_future(handler(update, None)) for update in updates))
+    asyncio.run(main())
+
+
+def test_one_users_updates_run_one_at_a_time_in_arrival_order():
+    events = []
+
+    @bot.serialized_per_user
+    async def handler(update, context):
+        events.append(f"start {update.label}")
+        # Earlier updates take longer, so without the lock they would finish out of order
+        await asyncio.sleep({"a": 0.03, "b": 0.02, "c": 0.01}[update.label])
+        events.append(f"end {update.label}")
+
+    run_concurrently(handler, [make_update(1, label) for label in "abc"])
+    assert events == ["start a", "end a", "start b", "end b", "start c", "end c"]
+
+
+def test_different_users_run_in_parallel():
+    events = []
+
+    @bot.serialized_per_user
+    async def handler(update, context):
+        events.append(f"start {update.label}")
+        await asyncio.sleep(0.02)
+        events.append(f"end {update.label}")
+
+    run_concurrently(handler, [make_update(1, "a"), make_update(2, "b")])
+    assert events[:2] == ["start a", "start b"]
+
+
+def test_concurrent_history_writes_lose_no_exchange(tmp_path, monkeypatch):
+    monkeypatch.setattr(bot, "CONVERSATIONS_DIR", str(tmp_path))
+
+    @bot.serialized_per_user
+    async def handler(update, context):
+        # The read-modify-write a turn does, split by an await as in a real turn
+        history = await bot.run_io(bot.load_conversation_history, 1)
+        await asyncio.sleep(0.001)
+        history.append({"user": update.label, "assistant": "ok"})
+        await bot.run_io(bot.save_conversation_history, 1, history)
+
+    labels = [str(index) for index in range(20)]
+    run_concurrently(handler, [make_update(1, label) for label in labels])
+    assert [exchange["user"] for exchange in bot.load_conversation_history(1)] == labels
+    # Written by rename: no temp files are left behind, and the file is always whole JSON
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1
+    json.loads(files[0].read_text())
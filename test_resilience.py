@@ -0,0 +1,157 @@
+"""
+Behaviour of resilience: run with `python -m pytest test_resilience.py`.
+"""
+
+import asyncio
+
+import pytest
+
+import metrics
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, PROBE, CircuitBreaker, CircuitOpenError
+
+
+def make_breaker(**overrides):
+    settings = {**resilience.DEFAULT_SETTINGS, "window": 4, "min_calls": 4, "open_seconds": 0, **overrides}
+    return CircuitBreaker("test", **settings)
+
+
+def trip(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(breaker.allow_primary(), False, 0.1)
+
+
+@pytest.fixture(autouse=True)
+def fresh_settings():
+    resilience.configure({})
+    yield
+    resilience.configure({})
+
+
+def test_opens_once_enough_calls_are_bad():
+    breaker = make_breaker()
+    for _ in range(3):
+        breaker.record(breaker.allow_primary(), False, 0.1)
+    assert breaker.state == CLOSED  # fewer than min_calls
+    breaker.record(breaker.allow_primary(), True, 0.1)
+    assert breaker.state == OPEN  # 3 of 4 bad
+
+
+def test_slow_calls_count_as_bad():
+    breaker = make_breaker(latency_threshold=1.0)
+    for _ in range(4):
+        breaker.record(breaker.allow_primary(), True, 5.0)
+    assert breaker.state == OPEN
+
+
+def test_open_breaker_refuses_the_primary_until_the_cool_down():
+    breaker = make_breaker(open_seconds=60)
+    trip(breaker)
+    assert breaker.allow_primary() is None
+
+
+def test_one_probe_at_a_time_and_its_success_closes():
+    breaker = make_breaker()
+    trip(breaker)
+    ticket = breaker.allow_primary()
+    assert ticket == PROBE and breaker.state == HALF_OPEN
+    assert breaker.allow_primary() is None  # the probe is still out
+    breaker.record(ticket, True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = make_breaker(open_seconds=60)
+    trip(breaker)
+    breaker.opened_at -= 60
+    breaker.record(breaker.allow_primary(), False, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.allow_primary() is None
+
+
+def test_only_the_probe_decides_a_half_open_breaker():
+    breaker = make_breaker()
+    straggler = breaker.allow_primary()  # admitted while closed, finishes late
+    trip(breaker)
+    probe = breaker.allow_primary()
+    breaker.record(straggler, True, 0.1)
+    assert breaker.state == HALF_OPEN
+    breaker.record(probe, False, 0.1)
+    assert breaker.state == OPEN
+
+
+def test_cancelled_probe_frees_the_slot():
+    breaker = make_breaker()
+    trip(breaker)
+    breaker.abandon(breaker.allow_primary())
+    assert breaker.allow_primary() == PROBE
+
+
+def test_open_breaker_goes_straight_to_the_fallback_model():
+    resilience.configure({"gemini": {"fallback_model": "backup", "window": 2, "min_calls": 2, "open_seconds": 60}})
+    models = []
+
+    def failing(model):
+        models.append(model)
+        if model == "primary":
+            raise RuntimeError("down")
+        return model
+
+    assert resilience.call_with_fallback("gemini", "primary", failing) == "backup"
+    assert resilience.call_with_fallback("gemini", "primary", failing) == "backup"
+    assert resilience.get_breaker("gemini").state == OPEN
+    models.clear()
+    assert resilience.call_with_fallback("gemini", "primary", failing) == "backup"
+    assert models == ["backup"]
+
+
+def test_open_breaker_without_fallback_fails_fast():
+    resilience.configure({"gemini": {"window": 1, "min_calls": 1, "open_seconds": 60}})
+
+    def failing(model):
+        raise RuntimeError("down")
+
+    with pytest.raises(RuntimeError):
+        resilience.call_with_fallback("gemini", "primary", failing)
+    with pytest.raises(CircuitOpenError):
+        resilience.call_with_fallback("gemini", "primary", failing)
+
+
+def test_cancelled_async_call_is_not_a_failure():
+    resilience.configure({"openai": {"window": 1, "min_calls": 1}})
+
+    async def main():
+        task = asyncio.ensure_future(resilience.call_with_fallback_async("openai", "m", lambda model: asyncio.sleep(10)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert resilience.get_breaker("openai").state == CLOSED
+
+
+def test_hedged_request_cancels_the_loser():
+    settings = {**resilience.DEFAULT_SETTINGS, "hedge_min_samples": 1, "hedge_min_delay": 0.05}
+    for _ in range(3):
+        metrics.observe("latency.hedgetest.slow-model", 0.01)
+    calls = []
+
+    async def call(model):
+        calls.append(model)
+        try:
+            # The first request stalls; the hedge answers at once
+            await asyncio.sleep(10 if len(calls) == 1 else 0)
+            return len(calls)
+        except asyncio.CancelledError:
+            calls.append("cancelled")
+            raise
+
+    async def main():
+        result = await resilience._hedged_async("hedgetest", "slow-model", call, settings)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == 2
+    assert calls == ["slow-model", "slow-model", "cancelled"]
+    assert metrics.get_counter("provider.hedgetest.hedged") == 1
@@ -0,0 +1,70 @@
+"""
+Edge cases for telegram_html: run with `python -m pytest test_telegram_html.py`.
+"""
+
+import pytest
+
+from telegram_html import render_html, split_html, to_plain_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Markdown emphasis
+    ("a **bold** b", "a <b>bold</b> b"),
+    ("a *soft* b", "a <i>soft</i> b"),
+    ("***both***", "<b><i>both</i></b>"),
+    ("**bold with *italic* inside**", "<b>bold with <i>italic</i> inside</b>"),
+    ("5 * 3 = 15", "5 * 3 = 15"),
+    ("* a bullet", "* a bullet"),
+    ("an *unclosed marker", "an *unclosed marker"),
+    ("*one\n\nparagraph*", "*one\n\nparagraph*"),  # emphasis never spans paragraphs
+    ("*one\nline*", "<i>one\nline</i>"),
+    # Stray markup is escaped
+    ("3 < 4 & 5 > 2", "3 &lt; 4 &amp; 5 &gt; 2"),
+    ("if a < b and c > d", "if a &lt; b and c &gt; d"),
+    ("<div>x</div>", "&lt;div&gt;x&lt;/div&gt;"),
+    ("fish &chips", "fish &amp;chips"),
+    ("a&nbsp;b", "a&amp;nbsp;b"),
+    ("&lt; &#39; &#x27; &amp;", "&lt; &#39; &#x27; &amp;"),
+    # Tags
+    ("line<br>next<br/>", "line\nnext\n"),
+    ("<b >x</ b>", "<b>x</b>"),
+    ("<B>x</B>", "<b>x</b>"),
+    ('<b class="x">y</b>', "<b>y</b>"),
+    ('<a href="https://e.com/?a=1&b=2">link</a>', '<a href="https://e.com/?a=1&b=2">link</a>'),
+    ("x</b>", "x"),  # a closing tag with nothing to close is dropped
+    ("<b>open", "<b>open</b>"),
+    ("<b>1<i>2</b>3</i>", "<b>1<i>2</i></b><i>3</i>"),
+    ("**a <i>b** c</i>", "<b>a <i>b</i></b><i> c</i>"),
+    # Nothing is converted inside <code> and <pre>
+    ("<code>*x* <b></code>", "<code>*x* &lt;b&gt;</code>"),
+    ("<pre><code>a**b**</code></pre>", "<pre><code>a**b**</code></pre>"),
+    # Untouched
+    ("plain words", "plain words"),
+    ("", ""),
+])
+def test_render_html(text, expected):
+    assert render_html(text) == expected
+
+
+def test_render_html_is_idempotent():
+    once = render_html("**a** < *b* & <i>c</i> <u>open")
+    assert render_html(once) == once
+
+
+def test_to_plain_text():
+    assert to_plain_text("<b>fish</b> &amp; <i>chips</i> &lt;3") == "fish & chips <3"
+
+
+def test_split_html_keeps_tags_balanced():
+    chunks = split_html("<b>" + "word " * 300 + "</b>", limit=200)
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert len(chunk) <= 200
+        assert chunk.startswith("<b>") and chunk.endswith("</b>")
+        assert chunk.count("<b>") == chunk.count("</b>")
+
+
+def test_split_html_never_cuts_an_entity():
+    chunks = split_html("&amp;" * 100, limit=42)
+    assert "".join(chunks) == "&amp;" * 100
+    assert all(chunk.endswith(";") for chunk in chunks)
@@ -0,0 +1,93 @@
+"""
+Behaviour of telegram_sender's queue: run with `python -m pytest test_telegram_sender.py`.
+"""
+
+import asyncio
+
+import pytest
+
+telegram_error = pytest.importorskip("telegram.error")
+
+from telegram_sender import OutboundSender
+
+
+class FakeBot:
+    def __init__(self, fail_with=None):
+        self.sent = []
+        self.fail_with = list(fail_with or [])
+
+    async def send_message(self, chat_id, text, parse_mode=None, **kwargs):
+        if self.fail_with:
+            raise self.fail_with.pop(0)
+        self.sent.append((chat_id, "text", text))
+        return text
+
+    async def send_photo(self, chat_id, photo, caption=None, parse_mode=None, **kwargs):
+        self.sent.append((chat_id, "photo", caption))
+        return photo
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_each_chat_keeps_its_order():
+    async def main():
+        bot = FakeBot()
+        sender = OutboundSender(bot, global_per_second=1000, per_chat_interval=0)
+        await asyncio.gather(*(sender.send_text(1, f"m{index}") for index in range(5)))
+        await sender.stop()
+        return bot.sent
+
+    assert [text for _, _, text in run(main())] == [f"m{index}" for index in range(5)]
+
+
+def test_text_goes_before_a_queued_photo():
+    async def main():
+        bot = FakeBot()
+        sender = OutboundSender(bot, global_per_second=1000, per_chat_interval=0)
+        await asyncio.gather(sender.send_photo(1, "card"), sender.send_text(2, "quick"))
+        await sender.stop()
+        return bot.sent
+
+    assert run(main())[0] == (2, "text", "quick")
+
+
+def test_flood_control_is_waited_out_and_retried():
+    async def main():
+        bot = FakeBot(fail_with=[telegram_error.RetryAfter(0)])
+        sender = OutboundSender(bot, global_per_second=1000, per_chat_interval=0)
+        result = await sender.send_text(1, "hello")
+        await sender.stop()
+        return result, bot.sent
+
+    result, sent = run(main())
+    assert result == "hello"
+    assert sent == [(1, "text", "hello")]
+
+
+def test_rejected_markup_is_resent_as_plain_text():
+    async def main():
+        bot = FakeBot(fail_with=[telegram_error.BadRequest("Can't parse entities")])
+        sender = OutboundSender(bot, global_per_second=1000, per_chat_interval=0)
+        await sender.send_text(1, "<b>bold</b> &amp; more")
+        await sender.stop()
+        return bot.sent
+
+    assert run(main()) == [(1, "text", "bold & more")]
+
+
+def test_a_cancelled_callers_message_is_not_sent():
+    async def main():
+        bot = FakeBot()
+        sender = OutboundSender(bot, global_per_second=1000, per_chat_interval=0.05)
+        first = asyncio.ensure_future(sender.send_text(1, "first"))
+        second = asyncio.ensure_future(sender.send_text(1, "second"))
+        await asyncio.sleep(0)
+        second.cancel()  # e.g. the turn was cleared while its reply waited in the queue
+        await first
+        await asyncio.sleep(0.1)
+        await sender.stop()
+        return bot.sent
+
+    assert run(main()) == [(1, "text", "first")]
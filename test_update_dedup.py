@@ -0,0 +1,67 @@
+"""
+Behaviour of update_dedup: run with `python -m pytest test_update_dedup.py`.
+"""
+
+from update_dedup import UpdateDeduplicator
+
+
+def test_second_delivery_is_a_duplicate():
+    dedup = UpdateDeduplicator()
+    assert dedup.check_and_add(1) is False
+    assert dedup.check_and_add(1) is True
+
+
+def test_keeps_only_the_most_recent_ids():
+    dedup = UpdateDeduplicator(capacity=3)
+    for update_id in range(1, 5):
+        dedup.check_and_add(update_id)
+    assert list(dedup.seen_ids) == [2, 3, 4]
+    assert dedup.check_and_add(1) is False  # forgotten, so processed again
+
+
+def test_persisted_ids_survive_a_restart(tmp_path):
+    path = str(tmp_path / "seen.txt")
+    dedup = UpdateDeduplicator(persist_path=path)
+    dedup.check_and_add(7)
+    dedup.persist(7)
+
+    restarted = UpdateDeduplicator(persist_path=path)
+    assert restarted.check_and_add(7) is True
+
+
+def test_redelivered_update_that_never_reached_the_journal_is_processed(tmp_path):
+    # Seen, but the process crashed before the update was journalled or handled
+    path = str(tmp_path / "seen.txt")
+    dedup = UpdateDeduplicator(persist_path=path)
+    dedup.check_and_add(7)
+    dedup.check_and_add(8)
+    dedup.persist(8)
+
+    restarted = UpdateDeduplicator(persist_path=path)
+    assert restarted.check_and_add(7) is False
+    assert restarted.check_and_add(8) is True
+
+
+def test_persisting_twice_writes_once(tmp_path):
+    path = tmp_path / "seen.txt"
+    dedup = UpdateDeduplicator(persist_path=str(path))
+    dedup.check_and_add(7)
+    dedup.persist(7)
+    dedup.persist(7)
+    assert path.read_text().split() == ["7"]
+
+
+def test_compaction_keeps_recent_persisted_ids_only(tmp_path):
+    path = tmp_path / "seen.txt"
+    dedup = UpdateDeduplicator(capacity=3, persist_path=str(path))
+    dedup.check_and_add(100)  # in flight: never persisted
+    for update_id in range(1, 8):
+        dedup.check_and_add(update_id)
+        dedup.persist(update_id)
+    assert dedup.lines_written < 2 * dedup.capacity + 1
+    ids = [int(line) for line in path.read_text().split()]
+    assert 100 not in ids
+    assert ids[-3:] == [5, 6, 7]
+
+    restarted = UpdateDeduplicator(capacity=3, persist_path=str(path))
+    assert list(restarted.seen_ids) == [5, 6, 7]
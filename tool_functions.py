@@ -1,9 +1,19 @@
 from typing import Optional
 import datetime
+import html
 import os
 import logging
+import time
 from datetime import datetime as dt
 
+import resilience
+import turn_control
+import artifact_store
+import traffic_recorder
+
+GEMINI_IMAGE_MODEL = 'gemini-2.5-flash-image'
+MAX_REFERENCE_IMAGES = 3  # the image model works best with up to three inputs
+
 def get_current_time_tool() -> str:
     """Tool function for getting the current date and time"""
     now = datetime.datetime.now()
@@ -13,7 +23,35 @@ def echo_tool(message: str) -> str:
     """Tool function that echoes back the provided message"""
     return f"You said: {message}"
 
-def generate_neologism_image(
+def parse_image_reply(text: str):
+    """Split an 'IMAGE_PATH:<path>' reply into (image_path, remaining text).
+
+    Returns (None, text) when the reply carries no image.
+    """
+    if not text.startswith("IMAGE_PATH:"):
+        return None, text
+    lines = text.split('\n', 1)
+    image_path = lines[0].replace("IMAGE_PATH:", "").strip()
+    remaining = lines[1].strip() if len(lines) > 1 else ""
+    return image_path, remaining
+
+def card_caption(word_or_place: str, caption: Optional[str] = None) -> str:
+    """Caption sent with a neologism card: the model's own words, or a default"""
+    if caption and caption.strip():
+        return caption.strip()
+    return f"✨ I've created a visual card for <b>{html.escape(word_or_place)}</b> — the image captures its essence in paint and light."
+
+def reference_image_list(reference_image_path: Optional[str] = None, reference_image_paths: Optional[list] = None) -> list:
+    """The existing reference images among the given paths, without repeats, at most MAX_REFERENCE_IMAGES"""
+    if isinstance(reference_image_paths, str):
+        reference_image_paths = [reference_image_paths]
+    candidates = ([reference_image_path] if reference_image_path else []) + list(reference_image_paths or [])
+    paths = [path for path in dict.fromkeys(candidates) if path and os.path.exists(path)]
+    if len(paths) > MAX_REFERENCE_IMAGES:
+        logging.info(f"📸 Using the first {MAX_REFERENCE_IMAGES} of {len(paths)} reference images")
+    return paths[:MAX_REFERENCE_IMAGES]
+
+def build_card_prompt(
     neologism_type: str,
     word_or_place: str,
     pronunciation: str,
@@ -21,69 +59,15 @@ def generate_neologism_image(
     emotional_keywords: str,
     etymology: str,
     additional_context: Optional[str] = None,
-    reference_image_path: Optional[str] = None
+    reference_images: int = 0
 ) -> str:
-    """
-    Generate visual card for neologism using Gemini 2.5 Flash Image.
-
-    Two-stage process:
-    Stage 1: Read template → Generate customized prompt → Save to generated_prompts/
-    Stage 2: Call Gemini API → Generate image → Save to generated_images/
-
-    Args:
-        neologism_type: "dictionary" or "locale"
-        word_or_place: The neologism word or place name
-        pronunciation: Pronunciation guide
-        definition: Complete definition
-        emotional_keywords: 3-5 comma-separated mood descriptors
-        etymology: Linguistic roots
-        additional_context: For locales - terrain, creatures, rituals (optional)
-        reference_image_path: Path to user-uploaded reference image (optional)
-
-    Returns:
-        Success message with IMAGE_PATH: prefix for bot.py to detect and send
-    """
-    try:
-        from google import genai
-        from google.genai import types
-        from PIL import Image
-
-        # Get Gemini API key
-        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-        if not GEMINI_API_KEY:
-            return "❌ Error: GEMINI_API_KEY not found in environment variables"
+    """The Gemini prompt for a card ("dictionary" or "locale"); pure, so microbench.py can time it"""
+    # Wrap definition in content-safe language
+    emotion_description = f"expressing the feeling of {definition[:200]}"
 
-        # Create directories if they don't exist
-        os.makedirs("generated_prompts", exist_ok=True)
-        os.makedirs("generated_images", exist_ok=True)
-
-        # ========== STAGE 1: Generate Customized Prompt ==========
-
-        logging.info(f"🎨 Stage 1: Generating customized prompt for {word_or_place} ({neologism_type})")
-
-        # Read appropriate template
-        if neologism_type == "dictionary":
-            template_path = "dictionary_card_prompt.md"
-        elif neologism_type == "locale":
-            template_path = "fantasy_locale_prompt.md"
-        else:
-            return f"❌ Error: Invalid neologism_type '{neologism_type}'. Must be 'dictionary' or 'locale'"
-
-        if not os.path.exists(template_path):
-            return f"❌ Error: Template file '{template_path}' not found"
-
-        with open(template_path, 'r', encoding='utf-8') as f:
-            template = f.read()
-
-        # Extract only the style reference section (not the full template with examples)
-        # We'll use the template as a style guide to generate a fully customized prompt
-
-        # Wrap definition in content-safe language
-        emotion_description = f"expressing the feeling of {definition[:200]}"
-
-        # Build customized prompt
-        if neologism_type == "dictionary":
-            customized_prompt = f"""In expressionist painterly style with visible, constructed brushwork, depict an urbane scene from the point of view of a stray cat and with the back of the cat's head peeking out at the bottom. The scene analogizes the emotion **{word_or_place}** — {emotion_description}.
+    # Build customized prompt
+    if neologism_type == "dictionary":
+        customized_prompt = f"""In expressionist painterly style with visible, constructed brushwork, depict an urbane scene from the point of view of a stray cat and with the back of the cat's head peeking out at the bottom. The scene analogizes the emotion **{word_or_place}** — {emotion_description}.
 
 **Visual Style:**
 Textured strokes with impasto passages and gestural marks creating faceted, almost geological planes. Warm undertones (ochre, burnt sienna, raw umber) break through cooler surface colors (violet, blue-green, slate) as though emotion is surfacing through painted skin.
@@ -115,8 +99,8 @@ On the right side, incorporate a stylized definition panel:
 --ar 16:9 --style expressionist painterly --lighting chiaroscuro --mood psychological emotional --texture gestural impasto
 """
 
-        else:  # locale
-            customized_prompt = f"""A painterly fantasy landscape expressing the emotion **{word_or_place}** — {emotion_description}.
+    else:  # locale
+        customized_prompt = f"""A painterly fantasy landscape expressing the emotion **{word_or_place}** — {emotion_description}.
 
 Painted in expressionist style with visible, imperfect brushstrokes, layered pigments, and gestural energy. The lighting is symbolic and emotional: radiant where hope lives, murky where memory fades.
 
@@ -146,25 +130,99 @@ On the right side, incorporate a stylized definition panel:
 --ar 16:9 --style painterly --lighting expressionist diffuse --details mythic symbolic --mood cinematic emotional --texture gestural layered
 """
 
-        # Handle reference image context if provided
-        if reference_image_path and os.path.exists(reference_image_path):
-            customized_prompt += f"\n\n**Reference Image:** Drawing color palette, mood, and atmospheric inspiration from the provided reference image."
-            logging.info(f"📸 Including reference image: {reference_image_path}")
+    # Handle reference image context if provided
+    if reference_images == 1:
+        customized_prompt += f"\n\n**Reference Image:** Drawing color palette, mood, and atmospheric inspiration from the provided reference image."
+    elif reference_images > 1:
+        customized_prompt += f"\n\n**Reference Images:** Drawing color palette, mood, and atmospheric inspiration from the {reference_images} provided reference images, blended into one scene."
+
+    return customized_prompt
+
+def generate_neologism_image(
+    neologism_type: str,
+    word_or_place: str,
+    pronunciation: str,
+    definition: str,
+    emotional_keywords: str,
+    etymology: str,
+    additional_context: Optional[str] = None,
+    reference_image_path: Optional[str] = None,
+    caption: Optional[str] = None,
+    reference_image_paths: Optional[list] = None
+) -> str:
+    """
+    Generate visual card for neologism using Gemini 2.5 Flash Image.
+
+    Two-stage process:
+    Stage 1: Read template → Generate customized prompt → Save to the artifact store (prompts/)
+    Stage 2: Call Gemini API → Generate image → Save to the artifact store (images/)
+
+    Args:
+        neologism_type: "dictionary" or "locale"
+        word_or_place: The neologism word or place name
+        pronunciation: Pronunciation guide
+        definition: Complete definition
+        emotional_keywords: 3-5 comma-separated mood descriptors
+        etymology: Linguistic roots
+        additional_context: For locales - terrain, creatures, rituals (optional)
+        reference_image_path: Path to user-uploaded reference image (optional)
+        reference_image_paths: Paths of several reference images, e.g. an album (optional)
+        caption: Model-written message to send with the card (optional)
+
+    Returns:
+        Success message with IMAGE_PATH: prefix for bot.py to detect and send
+    """
+    try:
+        from google import genai
+        from google.genai import types
+        from PIL import Image
+
+        # Get Gemini API key
+        GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+        if not GEMINI_API_KEY:
+            return "❌ Error: GEMINI_API_KEY not found in environment variables"
+
+        # ========== STAGE 1: Generate Customized Prompt ==========
+
+        logging.info(f"🎨 Stage 1: Generating customized prompt for {word_or_place} ({neologism_type})")
+
+        # Read appropriate template
+        if neologism_type == "dictionary":
+            template_path = "dictionary_card_prompt.md"
+        elif neologism_type == "locale":
+            template_path = "fantasy_locale_prompt.md"
+        else:
+            return f"❌ Error: Invalid neologism_type '{neologism_type}'. Must be 'dictionary' or 'locale'"
+
+        if not os.path.exists(template_path):
+            return f"❌ Error: Template file '{template_path}' not found"
 
-        # Save customized prompt
-        timestamp = dt.now().strftime("%Y%m%d_%H%M%S")
-        safe_name = "".join(c for c in word_or_place if c.isalnum() or c in (' ', '-', '_')).strip()
-        prompt_filename = f"{safe_name}_{neologism_type}_{timestamp}.md"
-        prompt_path = os.path.join("generated_prompts", prompt_filename)
+        with open(template_path, 'r', encoding='utf-8') as f:
+            template = f.read()
 
-        with open(prompt_path, 'w', encoding='utf-8') as f:
-            f.write(f"# {word_or_place}\n\n")
-            f.write(f"**Type:** {neologism_type}\n")
-            f.write(f"**Generated:** {dt.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write("---\n\n")
-            f.write(customized_prompt)
+        # Extract only the style reference section (not the full template with examples)
+        # We'll use the template as a style guide to generate a fully customized prompt
 
-        logging.info(f"✅ Stage 1 complete: Prompt saved to {prompt_path}")
+        reference_paths = reference_image_list(reference_image_path, reference_image_paths)
+        customized_prompt = build_card_prompt(
+            neologism_type, word_or_place, pronunciation, definition,
+            emotional_keywords, etymology, additional_context, len(reference_paths)
+        )
+        if reference_paths:
+            logging.info(f"📸 Including reference image(s): {', '.join(reference_paths)}")
+
+        # Save customized prompt (content-addressed: the same prompt is stored once;
+        # the generation time goes in the metadata sidecar, not the content)
+        store = artifact_store.get_store()
+        card_metadata = {
+            "word_or_place": word_or_place,
+            "neologism_type": neologism_type,
+            "generated_at": dt.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        prompt_document = f"# {word_or_place}\n\n**Type:** {neologism_type}\n\n---\n\n{customized_prompt}"
+        prompt_key = store.put(prompt_document.encode('utf-8'), "prompts", "md", card_metadata)
+
+        logging.info(f"✅ Stage 1 complete: Prompt saved as {prompt_key}")
 
         # ========== STAGE 2: Generate Image with Gemini ==========
 
@@ -176,28 +234,41 @@ On the right side, incorporate a stylized definition panel:
         # Prepare contents (text + optional image)
         contents = [customized_prompt]
 
-        # Add reference image if provided
-        if reference_image_path and os.path.exists(reference_image_path):
+        # Add reference images if provided
+        for reference_path in reference_paths:
             try:
-                reference_img = Image.open(reference_image_path)
+                reference_img = Image.open(reference_path)
                 contents.append(reference_img)
-                logging.info(f"✅ Reference image loaded: {reference_image_path}")
+                logging.info(f"✅ Reference image loaded: {reference_path}")
             except Exception as e:
-                logging.warning(f"⚠️ Could not load reference image: {e}")
-
-        # Generate image with 16:9 aspect ratio
-        response = genai_client.models.generate_content(
-            model='gemini-2.5-flash-image',
-            contents=contents,
-            config=types.GenerateContentConfig(
-                temperature=0.7,
-                response_modalities=["IMAGE"],
-                image_config=types.ImageConfig(
-                    aspect_ratio="16:9",
-                )
+                logging.warning(f"⚠️ Could not load reference image {reference_path}: {e}")
+
+        generation_config = types.GenerateContentConfig(
+            temperature=0.7,
+            response_modalities=["IMAGE"],
+            image_config=types.ImageConfig(
+                aspect_ratio="16:9",
             )
         )
 
+        def generate(model):
+            turn = turn_control.current_turn()
+            if turn:
+                # Issued on the event loop, so cancelling the turn aborts the request
+                return turn.run_async(lambda: genai_client.aio.models.generate_content(
+                    model=model, contents=contents, config=generation_config
+                ))
+            return genai_client.models.generate_content(model=model, contents=contents, config=generation_config)
+
+        # Don't start (and pay for) a render whose turn was already cancelled
+        turn_control.checkpoint()
+
+        # Generate image with 16:9 aspect ratio (through the Gemini circuit breaker,
+        # which switches to resilience.gemini.fallback_model while it is open)
+        gemini_started = time.perf_counter()
+        response = resilience.call_with_fallback('gemini', GEMINI_IMAGE_MODEL, generate)
+        traffic_recorder.note_call('gemini', time.perf_counter() - gemini_started)
+
         # Extract image data from response (handle 0-byte issue)
         image_data = None
 
@@ -230,18 +301,20 @@ On the right side, incorporate a stylized definition panel:
                 logging.error(f"Response text: {response.text[:200]}")
             return error_msg
 
-        # Save image
-        image_filename = f"{safe_name}_{timestamp}.png"
-        image_path = os.path.join("generated_images", image_filename)
-
-        with open(image_path, 'wb') as f:
-            f.write(image_data)
+        # Save image (unless the turn was cancelled while Gemini was painting)
+        turn_control.checkpoint()
+        image_key = store.put(image_data, "images", "png", {
+            **card_metadata,
+            "prompt_key": prompt_key,
+            "reference_image_paths": reference_paths,
+        })
+        image_path = store.local_path(image_key)
 
         logging.info(f"✅ Stage 2 complete: Image saved to {image_path}")
         logging.info(f"🎉 Neologism image generation complete for '{word_or_place}'")
 
         # Return with IMAGE_PATH: prefix so bot.py knows to send the image
-        return f"IMAGE_PATH:{image_path}\n\n✨ I've created a visual card for <b>{word_or_place}</b> — the image captures its essence in paint and light."
+        return f"IMAGE_PATH:{image_path}\n\n{card_caption(word_or_place, caption)}"
 
     except ImportError as e:
         error_msg = f"❌ Missing dependency: {str(e)}\n\nPlease install: pip install google-genai pillow"
@@ -254,9 +327,39 @@ On the right side, incorporate a stylized definition panel:
         logging.exception("Full traceback:")
         return error_msg
 
+def acknowledge_neologism_image(word_or_place: str, caption: Optional[str] = None, **kwargs) -> str:
+    """Tool result for a card that is still rendering (pipelined mode).
+
+    The text the model sees doesn't depend on the pixels, so it can be
+    returned before Gemini has finished.
+    """
+    return card_caption(word_or_place, caption)
+
+def acknowledge_deferred_neologism_image(word_or_place: str, **kwargs) -> str:
+    """Tool result for a card the load governor deferred: it follows the reply, so nothing is shown yet"""
+    return f"🎨 The card for <b>{html.escape(word_or_place)}</b> is still being painted and will be sent on its own when it's ready."
+
 # Function registry for tool calls
 TOOL_FUNCTIONS = {
     'get_current_time': get_current_time_tool,
     'echo': echo_tool,
     'generate_neologism_image': generate_neologism_image
 }
+
+# Tools whose successful result is already a finished message for the user.
+# With tool_settings.direct_reply enabled, bot.py sends these results as-is
+# instead of asking the model to write a follow-up response.
+USER_READY_TOOLS = {'generate_neologism_image'}
+
+# Tools that can be acknowledged immediately and run in the background.
+# With tool_settings.pipelined_render enabled, bot.py feeds the acknowledgement
+# to the follow-up completion while the real call runs concurrently.
+TOOL_ACKNOWLEDGEMENTS = {
+    'generate_neologism_image': acknowledge_neologism_image
+}
+
+# Acknowledgements for the same tools when the load governor defers their
+# results until after the reply (see load_governor's defer_cards).
+DEFERRED_ACKNOWLEDGEMENTS = {
+    'generate_neologism_image': acknowledge_deferred_neologism_image
+}
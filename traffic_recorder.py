@@ -0,0 +1,128 @@
+"""
+Opt-in recording of anonymized, turn-level traffic traces.
+
+With the "traffic_recording" section of model_config.json enabled, every
+handled update leaves one JSON line in `directory`/traces-YYYY-MM-DD.jsonl:
+
+    {"at": 1760890000.123, "user": "9f2c41d07a3b", "kind": "text",
+     "input_chars": 84, "seconds": 3.41, "reply_chars": 612, "outcome": "ok",
+     "calls": [{"provider": "openai", "seconds": 1.92, "prompt_tokens": 2210,
+                "completion_tokens": 143, "content_chars": 0,
+                "tool_calls": ["generate_neologism_image"]},
+               {"provider": "gemini", "seconds": 11.8}, ...]}
+
+No message text, transcript, caption or Telegram id is written: users are a
+salted hash (stable for the process, or across restarts with TRAFFIC_SALT),
+and everything else is a size, a duration or a tool name. The arrival times
+keep the real shape of the traffic, evening peaks included.
+replay_traffic.py plays the traces back against local stand-ins.
+
+When recording is off, recorded() leaves the handlers undecorated and
+note_call()/note() return at once.
+"""
+
+import contextvars
+import functools
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import date
+
+from async_io import run_io
+
+_settings = {}
+_salt = (os.getenv("TRAFFIC_SALT") or os.urandom(16).hex()).encode()
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_write_lock = threading.Lock()
+
+
+def configure(settings: dict):
+    """Install the "traffic_recording" section of model_config.json (before handlers are decorated)"""
+    global _settings
+    _settings = settings or {}
+
+
+def enabled() -> bool:
+    return bool(_settings.get("enabled", False))
+
+
+def anonymize(value) -> str:
+    return hmac.new(_salt, str(value).encode(), hashlib.sha256).hexdigest()[:12]
+
+
+def describe_update(kind: str, update) -> dict:
+    """The sizes of an update, never its content"""
+    trace = {"at": round(time.time(), 3), "kind": kind}
+    if update.effective_user:
+        trace["user"] = anonymize(update.effective_user.id)
+    message = update.message
+    if message is None:
+        return trace
+    if message.text:
+        trace["input_chars"] = len(message.text)
+    if message.voice:
+        trace["voice_seconds"] = message.voice.duration
+    if message.photo:
+        trace["photos"] = 1
+        if message.media_group_id:
+            trace["album"] = anonymize(message.media_group_id)
+    return trace
+
+
+def recorded(kind: str):
+    """Decorator for a handler: record its update as a trace (no-op unless recording is enabled)"""
+    def decorator(handler):
+        if not enabled():
+            return handler
+
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            if random.random() >= _settings.get("sample_rate", 1.0):
+                return await handler(update, context)
+            trace = describe_update(kind, update)
+            trace["calls"] = []
+            token = _current_trace.set(trace)
+            started = time.perf_counter()
+            trace.setdefault("outcome", "ok")
+            try:
+                return await handler(update, context)
+            except BaseException:
+                trace["outcome"] = "error"
+                raise
+            finally:
+                trace["seconds"] = round(time.perf_counter() - started, 3)
+                _current_trace.reset(token)
+                await run_io(write, trace)
+        return wrapper
+    return decorator
+
+
+def note_call(provider: str, seconds: float, **fields):
+    """Record one provider call (openai, gemini, transcription) in the current trace"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["calls"].append({"provider": provider, "seconds": round(seconds, 3), **fields})
+
+
+def note(**fields):
+    """Set fields on the current trace, e.g. reply_chars or outcome"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+def write(trace: dict):
+    directory = _settings.get("directory", "traffic")
+    path = os.path.join(directory, f"traces-{date.today().strftime('%Y-%m-%d')}.jsonl")
+    try:
+        with _write_lock:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(trace) + "\n")
+    except Exception as e:
+        logging.error(f"Traffic recording error: {e}")
@@ -0,0 +1,147 @@
+"""
+Voice transcription backends.
+
+    openai          - the hosted Whisper API (default). Nothing to install, but
+                      every note is uploaded and queued remotely.
+    faster_whisper  - a local CTranslate2 Whisper model on the CPU. The model is
+                      loaded once and kept warm; concurrent notes share it
+                      through a small thread pool (one slot per model worker).
+
+The backend is chosen by the "transcription" section of model_config.json.
+Each clip's real-time factor (processing seconds / audio seconds) is logged
+and observed as `transcription.<backend>.rtf`, so the two can be compared on
+a given deployment with /metrics.
+"""
+
+import abc
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import metrics
+import traffic_recorder
+
+# Whisper sometimes mislabels accented English; anything else is re-run as English
+ACCEPTED_LANGUAGES = {'en', 'zh', 'zh-cn', 'zh-tw'}
+
+
+class TranscriptionBackend(abc.ABC):
+    """Interface: turn an audio file into text. Blocking; raises on failure."""
+    name = "base"
+    executor = None  # None = asyncio's default thread pool
+
+    def load(self):
+        """Do any expensive one-time setup (e.g. loading a model)"""
+
+    @abc.abstractmethod
+    def transcribe(self, audio_path: str) -> str:
+        """The text spoken in the audio file"""
+
+
+class WhisperAPIBackend(TranscriptionBackend):
+    name = "openai"
+
+    def __init__(self, get_client, model: str = "whisper-1"):
+        self.get_client = get_client
+        self.model = model
+
+    def transcribe(self, audio_path: str) -> str:
+        with open(audio_path, 'rb') as audio_file:
+            # First attempt: Auto-detect language (no language parameter)
+            transcript = self.get_client().audio.transcriptions.create(
+                model=self.model,
+                file=audio_file,
+                response_format="json"  # Use JSON to get language info
+            )
+
+        detected_language = getattr(transcript, 'language', 'unknown')
+        logging.info(f"🌐 Detected language: {detected_language}")
+        if detected_language in ACCEPTED_LANGUAGES:
+            return transcript.text
+
+        logging.info(f"🔄 Non-English/Chinese detected ({detected_language}), retrying with English")
+        with open(audio_path, 'rb') as audio_file:
+            return self.get_client().audio.transcriptions.create(
+                model=self.model,
+                file=audio_file,
+                response_format="text",
+                language="en"
+            )
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    name = "faster_whisper"
+
+    def __init__(self, model_size: str = "small", device: str = "cpu", compute_type: str = "int8",
+                 workers: int = 2, cpu_threads: int = 0, beam_size: int = 1):
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self.beam_size = beam_size
+        self.model = None
+        self.load_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+
+    def load(self):
+        with self.load_lock:
+            if self.model is not None:
+                return
+            from faster_whisper import WhisperModel  # optional dependency, see requirements.txt
+
+            started = time.perf_counter()
+            self.model = WhisperModel(
+                self.model_size,
+                device=self.device,
+                compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+                num_workers=self.workers
+            )
+            logging.info(f"🎧 Loaded faster-whisper '{self.model_size}' ({self.compute_type}) in {time.perf_counter() - started:.1f}s")
+
+    def _run(self, audio_path: str, language: Optional[str] = None):
+        segments, info = self.model.transcribe(audio_path, beam_size=self.beam_size, language=language)
+        # Segments are a lazy generator; decoding happens while joining
+        return " ".join(segment.text.strip() for segment in segments).strip(), info
+
+    def transcribe(self, audio_path: str) -> str:
+        self.load()
+        text, info = self._run(audio_path)
+        logging.info(f"🌐 Detected language: {info.language} ({info.language_probability:.2f})")
+        if info.language in ACCEPTED_LANGUAGES:
+            return text
+
+        logging.info(f"🔄 Non-English/Chinese detected ({info.language}), retrying with English")
+        text, _ = self._run(audio_path, language="en")
+        return text
+
+
+def create_backend(settings: dict, get_openai_client) -> TranscriptionBackend:
+    """Build the backend named in the "transcription" config section"""
+    backend = settings.get('backend', 'openai')
+    if backend == 'faster_whisper':
+        return FasterWhisperBackend(**settings.get('faster_whisper', {}))
+    if backend != 'openai':
+        logging.warning(f"⚠️ Unknown transcription backend '{backend}', using the Whisper API")
+    return WhisperAPIBackend(get_openai_client, settings.get('openai_model', 'whisper-1'))
+
+
+async def transcribe_clip(backend: TranscriptionBackend, audio_path: str, duration: Optional[float] = None) -> str:
+    """Transcribe off the event loop and record latency and real-time factor"""
+    started = time.perf_counter()
+    text = await asyncio.get_running_loop().run_in_executor(backend.executor, backend.transcribe, audio_path)
+    elapsed = time.perf_counter() - started
+
+    metrics.observe(f"transcription.{backend.name}.seconds", elapsed)
+    traffic_recorder.note_call('transcription', elapsed, audio_seconds=duration, transcript_chars=len(text))
+    if duration:
+        rtf = elapsed / duration
+        metrics.observe(f"transcription.{backend.name}.rtf", rtf)
+        logging.info(f"🎙️ Transcribed {duration:.0f}s clip with {backend.name} in {elapsed:.2f}s (RTF {rtf:.2f})")
+    else:
+        logging.info(f"🎙️ Transcribed clip with {backend.name} in {elapsed:.2f}s")
+    return text
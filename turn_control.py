@@ -0,0 +1,122 @@
+"""
+Cancellable turns.
+
+Each text or voice turn runs as a tracked task per user. When /clear or /reset
+arrives, or a new message supersedes the turn (see the "cancellation"
+section of model_config.json), the task is cancelled:
+
+- awaited chat completions are cancelled in place, which closes their HTTP
+  connections (bot.py uses the async OpenAI client for this);
+- work running in worker threads (the card render) sees the turn through a
+  context variable. Its Gemini request is issued on the event loop via
+  run_async() so that it can be cancelled too, and checkpoint() stops it
+  before it writes any files;
+- nothing after the cancellation point writes history, the catalogue or a
+  reply. Once a turn starts writing its results it commits, and from then
+  on it can't be cancelled, so its writes are never half-done.
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import CancelledError as FutureCancelledError
+from typing import Optional
+
+
+class TurnCancelled(BaseException):
+    """Raised inside a cancelled turn. A BaseException, like asyncio.CancelledError,
+    so `except Exception` error handling doesn't swallow it."""
+
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class Turn:
+    def __init__(self, user_id: int, kind: str, user_input: str = ""):
+        self.user_id = user_id
+        self.kind = kind
+        self.user_input = user_input
+        self.loop = asyncio.get_running_loop()
+        self.cancelled = threading.Event()
+        self.reason = None
+        self.committed = False
+        self.task = None
+        self.pending = set()  # loop futures started from worker threads via run_async
+        self.pending_lock = threading.Lock()
+
+    async def _run_with_context(self, coro):
+        _current_turn.set(self)
+        return await coro
+
+    async def run(self, coro):
+        """Run `coro` as this turn's task; raises TurnCancelled if the turn is cancelled.
+
+        A turn can run several steps in sequence (e.g. transcribe, then reply);
+        a cancel between steps stops the next one from starting.
+        """
+        if self.cancelled.is_set():
+            coro.close()
+            raise TurnCancelled(self.reason)
+        self.task = asyncio.ensure_future(self._run_with_context(coro))
+        try:
+            return await self.task
+        except asyncio.CancelledError:
+            if self.cancelled.is_set():
+                raise TurnCancelled(self.reason) from None
+            raise
+
+    def commit(self):
+        """Mark the point of no return (results are being written); later cancels are ignored"""
+        self.committed = True
+
+    def cancel(self, reason: str) -> bool:
+        """Cancel the turn from the event loop thread; False if it already committed"""
+        if self.committed:
+            return False
+        self.reason = reason
+        self.cancelled.set()
+        if self.task:
+            self.task.cancel()
+        with self.pending_lock:
+            for future in self.pending:
+                future.cancel()
+        return True
+
+    def checkpoint(self):
+        """Raise TurnCancelled if the turn was cancelled (call from any thread)"""
+        if self.cancelled.is_set():
+            raise TurnCancelled(self.reason)
+
+    def run_async(self, make_coro):
+        """From a worker thread: run the coroutine on the event loop, so cancel() can abort it"""
+        self.checkpoint()
+        future = asyncio.run_coroutine_threadsafe(make_coro(), self.loop)
+        with self.pending_lock:
+            self.pending.add(future)
+        if self.cancelled.is_set():
+            future.cancel()
+        try:
+            return future.result()
+        except FutureCancelledError:
+            raise TurnCancelled(self.reason) from None
+        finally:
+            with self.pending_lock:
+                self.pending.discard(future)
+
+
+def current_turn() -> Optional[Turn]:
+    return _current_turn.get()
+
+
+def commit():
+    """Commit the current turn, if any (see Turn.commit)"""
+    turn = current_turn()
+    if turn:
+        turn.commit()
+
+
+def checkpoint():
+    """Raise TurnCancelled if running inside a cancelled turn; no-op elsewhere"""
+    turn = current_turn()
+    if turn:
+        turn.checkpoint()
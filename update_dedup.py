@@ -0,0 +1,94 @@
+"""
+Duplicate update detection.
+
+Telegram redelivers updates whose offset was never confirmed, e.g. after a
+crash or a retried getUpdates. Without a check, a redelivered message runs the
+whole model pipeline again and appends a second copy of the exchange to
+history. bot.py checks every update_id here before any handler runs.
+
+check_and_add() only touches memory, so it runs on the event loop without
+yielding; persist() does the file write and belongs on the I/O pool. An id
+is only persisted once its update can no longer be lost, i.e. when it has
+been journalled or handled. Until then a crash forgets it and Telegram's
+redelivery is processed. Persisting the same id twice writes it once.
+
+The store is bounded, keeping the most recent `capacity` ids. It can persist
+to an append-only file so that ids survive a restart; the file is compacted
+when it grows to twice the capacity.
+"""
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class UpdateDeduplicator:
+    def __init__(self, capacity: int = 10000, persist_path: Optional[str] = None):
+        self.capacity = capacity
+        self.persist_path = persist_path
+        self.seen_ids = OrderedDict()  # update_id -> whether it is in the persist file
+        self.lines_written = 0
+        self.lock = threading.Lock()
+        self.persist_lock = threading.Lock()
+        if persist_path:
+            self._load()
+
+    def _load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.isdigit():
+                        self._remember(int(line), persisted=True)
+                        self.lines_written += 1
+            logging.info(f"🧾 Loaded {len(self.seen_ids)} recent update ids from {self.persist_path}")
+        except Exception as e:
+            logging.error(f"Error loading update ids from {self.persist_path}: {e}")
+
+    def _remember(self, update_id: int, persisted: bool = False):
+        self.seen_ids[update_id] = persisted
+        self.seen_ids.move_to_end(update_id)
+        while len(self.seen_ids) > self.capacity:
+            self.seen_ids.popitem(last=False)
+
+    def persist(self, update_id: int):
+        """Append `update_id` to the persist file (blocking: call it off the event loop)"""
+        if not self.persist_path:
+            return
+        with self.persist_lock:
+            with self.lock:
+                if self.seen_ids.get(update_id):
+                    return
+                if update_id in self.seen_ids:
+                    self.seen_ids[update_id] = True
+            self._persist(update_id)
+
+    def _persist(self, update_id: int):
+        try:
+            if self.lines_written >= 2 * self.capacity:
+                with self.lock:
+                    # Ids still in flight stay out of the file, as they would have
+                    seen_ids = [seen_id for seen_id, persisted in self.seen_ids.items() if persisted]
+                temp_path = f"{self.persist_path}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(f"{seen_id}\n" for seen_id in seen_ids)
+                os.replace(temp_path, self.persist_path)
+                self.lines_written = len(seen_ids)
+            else:
+                with open(self.persist_path, 'a', encoding='utf-8') as f:
+                    f.write(f"{update_id}\n")
+                self.lines_written += 1
+        except Exception as e:
+            logging.error(f"Error persisting update id {update_id}: {e}")
+
+    def check_and_add(self, update_id: int) -> bool:
+        """True if `update_id` was already processed; otherwise records it in memory and returns False"""
+        with self.lock:
+            if update_id in self.seen_ids:
+                return True
+            self._remember(update_id)
+            return False
@@ -0,0 +1,133 @@
+"""
+Per-user usage ledger and quotas.
+
+Records, per user and day, the chat tokens, card renders and seconds of voice
+transcription each user consumed (SQLite, `usage.db`). Before bot.py admits
+expensive work, it checks the daily quotas in the "usage" section of
+model_config.json:
+
+    daily_tokens                 over it, a new turn is declined without a model call
+    daily_renders                over it, the card isn't painted; the word still is
+    daily_transcription_seconds  over it, voice notes are declined (text still works)
+
+A quota of 0 or null means unlimited. Admins (ADMIN_USER_IDS) are exempt.
+/usage shows the top consumers.
+"""
+
+import logging
+import sqlite3
+import threading
+from datetime import date
+from typing import Optional
+
+USAGE_DB = "usage.db"
+
+TOKENS, RENDERS, TRANSCRIPTION_SECONDS = "tokens", "renders", "transcription_seconds"
+QUOTA_SETTINGS = {
+    TOKENS: "daily_tokens",
+    RENDERS: "daily_renders",
+    TRANSCRIPTION_SECONDS: "daily_transcription_seconds",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    username TEXT,
+    turns INTEGER NOT NULL DEFAULT 0,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    renders INTEGER NOT NULL DEFAULT 0,
+    transcription_seconds REAL NOT NULL DEFAULT 0,
+    rejections INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_usage_day_tokens ON usage(day, tokens);
+"""
+
+_connection = None
+_lock = threading.RLock()
+
+
+def get_connection() -> sqlite3.Connection:
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(USAGE_DB, check_same_thread=False)
+            _connection.row_factory = sqlite3.Row
+            _connection.execute("PRAGMA journal_mode=WAL")
+            _connection.execute("PRAGMA synchronous=NORMAL")
+            _connection.executescript(SCHEMA)
+        return _connection
+
+
+def _today() -> str:
+    return date.today().strftime("%Y-%m-%d")
+
+
+def record(user_id: int, username: Optional[str] = None, turns: int = 0, tokens: int = 0,
+           renders: int = 0, transcription_seconds: float = 0.0, rejections: int = 0):
+    """Add to the user's totals for today"""
+    try:
+        connection = get_connection()
+        with _lock, connection:
+            connection.execute(
+                """INSERT INTO usage (day, user_id, username, turns, tokens, renders, transcription_seconds, rejections)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(day, user_id) DO UPDATE SET
+                       username = COALESCE(excluded.username, username),
+                       turns = turns + excluded.turns,
+                       tokens = tokens + excluded.tokens,
+                       renders = renders + excluded.renders,
+                       transcription_seconds = transcription_seconds + excluded.transcription_seconds,
+                       rejections = rejections + excluded.rejections""",
+                (_today(), user_id, username, turns, tokens, renders, transcription_seconds, rejections)
+            )
+    except Exception as e:
+        logging.error(f"Usage ledger error for user {user_id}: {e}")
+
+
+def usage_today(user_id: int) -> dict:
+    connection = get_connection()
+    with _lock:
+        row = connection.execute(
+            "SELECT * FROM usage WHERE day = ? AND user_id = ?", (_today(), user_id)
+        ).fetchone()
+    if row:
+        return dict(row)
+    return {"turns": 0, TOKENS: 0, RENDERS: 0, TRANSCRIPTION_SECONDS: 0.0, "rejections": 0}
+
+
+def over_quota(user_id: int, resource: str, settings: dict, amount: float = 0) -> bool:
+    """Whether admitting `amount` more of `resource` would exceed the user's daily quota"""
+    quota = settings.get(QUOTA_SETTINGS[resource])
+    if not settings.get("enabled", False) or not quota:
+        return False
+    try:
+        used = usage_today(user_id)[resource]
+    except Exception as e:
+        logging.error(f"Usage ledger error for user {user_id}: {e}")
+        return False  # never lock users out because the ledger is unavailable
+    return used + amount > quota
+
+
+def top_consumers(day: Optional[str] = None, limit: int = 10) -> list:
+    connection = get_connection()
+    with _lock:
+        return connection.execute(
+            "SELECT * FROM usage WHERE day = ? ORDER BY tokens DESC, renders DESC LIMIT ?",
+            (day or _today(), limit)
+        ).fetchall()
+
+
+def format_top_consumers(day: Optional[str] = None, limit: int = 10) -> str:
+    rows = top_consumers(day, limit)
+    lines = [f"Usage for {day or _today()}"]
+    if not rows:
+        lines.append("  (nothing recorded)")
+    for row in rows:
+        name = row["username"] or row["user_id"]
+        lines.append(
+            f"  {name}: {row['tokens']:,} tokens, {row['turns']} turns, {row['renders']} renders, "
+            f"{row['transcription_seconds']:.0f}s voice, {row['rejections']} declined"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,202 @@
+"""
+Shared word of the day.
+
+Step 1 of the ritual opens with a word from Koenig's Dictionary of Obscure
+Sorrows. Rather than have the model pick and explain one in every user's first
+turn, the word is chosen once per day, cached on disk keyed by date, and
+injected into /start and first turns for everyone.
+
+Precompute from cron or a Railway job with:
+
+    python word_of_the_day.py            # today
+    python word_of_the_day.py 2025-01-15 # a specific date
+"""
+
+import asyncio
+import html
+import json
+import logging
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from async_io import run_io
+
+WORD_OF_THE_DAY_DIR = "word_of_the_day"
+RECENT_DAYS = 30  # avoid repeating words chosen within this window
+RETRY_INITIAL_SECONDS = 60  # first retry after a failed precompute, doubling each time
+RETRY_MAX_SECONDS = 30 * 60
+
+WORD_OF_THE_DAY_PROMPT = """Choose today's word of the day from John Koenig's The Dictionary of Obscure Sorrows.
+Pick a real entry from the dictionary. Do not choose any of these recent words: {recent}.
+
+Reply with JSON only, using these keys:
+- "word": the entry as it appears in the dictionary
+- "pronunciation": a pronunciation guide, e.g. "/day-pay-zee-mahn/"
+- "definition": the definition in 1-3 sentences, poetic and concrete
+- "etymology": its linguistic roots in one sentence"""
+
+_generation_lock = asyncio.Lock()
+
+
+def get_word_of_the_day_path(day: date) -> str:
+    return os.path.join(WORD_OF_THE_DAY_DIR, f"{day.strftime('%Y-%m-%d')}.json")
+
+
+def load_word_of_the_day(day: Optional[date] = None) -> Optional[dict]:
+    """Cached payload for `day` (default today), or None if not yet computed"""
+    day = day or date.today()
+    path = get_word_of_the_day_path(day)
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except Exception as e:
+        logging.error(f"Error loading word of the day for {day}: {e}")
+    return None
+
+
+def save_word_of_the_day(day: date, payload: dict):
+    os.makedirs(WORD_OF_THE_DAY_DIR, exist_ok=True)
+    path = get_word_of_the_day_path(day)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, path)
+
+
+def recent_words(day: date, days: int = RECENT_DAYS) -> list:
+    words = []
+    for offset in range(1, days + 1):
+        payload = load_word_of_the_day(day - timedelta(days=offset))
+        if payload:
+            words.append(payload['word'])
+    return words
+
+
+def render_word_of_the_day(payload: dict) -> str:
+    """Telegram-HTML presentation, in the Step 1 format of system_prompt.md"""
+    return (
+        f"<b>{html.escape(payload['word'])}</b>\n"
+        f"<i>{html.escape(payload['pronunciation'])}</i>\n"
+        f"<i>{html.escape(payload['definition'])}</i>\n"
+        f"<i>{html.escape(payload['etymology'])}</i>"
+    )
+
+
+def word_of_the_day_system_note(payload: dict) -> str:
+    """Appended to the system prompt on a user's first turn of the day"""
+    return (
+        "\n\nToday's word of the day, shared by everyone who visits today, has already been chosen. "
+        "Use it for Step 1 instead of choosing another:\n"
+        f"{payload['word']} {payload['pronunciation']} — {payload['definition']} ({payload['etymology']})"
+    )
+
+
+def parse_reply(content: str) -> dict:
+    """The JSON object in a reply, even if the model wrapped it in a code fence or prose"""
+    match = re.search(r"\{.*\}", content, re.DOTALL)
+    return json.loads(match.group(0) if match else content)
+
+
+def generate_word_of_the_day(client, model: str, day: Optional[date] = None, json_mode: bool = True) -> dict:
+    """Ask the model for the day's word and cache it (blocking).
+
+    json_mode requests response_format=json_object; turn it off for backends
+    that don't support it, and the reply is parsed from plain text.
+    """
+    day = day or date.today()
+    recent = recent_words(day)
+    extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{
+            "role": "user",
+            "content": WORD_OF_THE_DAY_PROMPT.format(recent=", ".join(recent) or "none")
+        }],
+        temperature=0.9,
+        max_tokens=300,
+        **extra
+    )
+    data = parse_reply(response.choices[0].message.content)
+    payload = {
+        "date": day.strftime("%Y-%m-%d"),
+        "word": data["word"],
+        "pronunciation": data.get("pronunciation", ""),
+        "definition": data["definition"],
+        "etymology": data.get("etymology", ""),
+        "generated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    save_word_of_the_day(day, payload)
+    logging.info(f"📖 Word of the day for {payload['date']}: {payload['word']} (tokens: {response.usage.total_tokens})")
+    return payload
+
+
+async def ensure_word_of_the_day(client, model: str, day: Optional[date] = None,
+                                 json_mode: bool = True) -> Optional[dict]:
+    """Return the day's word, computing it at most once across concurrent callers"""
+    day = day or date.today()
+    payload = await run_io(load_word_of_the_day, day)
+    if payload:
+        return payload
+
+    async with _generation_lock:
+        payload = await run_io(load_word_of_the_day, day)
+        if payload:
+            return payload
+        try:
+            return await asyncio.to_thread(generate_word_of_the_day, client, model, day, json_mode)
+        except Exception as e:
+            logging.error(f"❌ Error generating word of the day for {day}: {e}")
+            return None
+
+
+async def run_daily_precompute(client, model: str, json_mode: bool = True):
+    """Background job: compute today's word now, then again just after each midnight.
+
+    A failed generation is retried with exponential backoff (up to
+    RETRY_MAX_SECONDS) instead of leaving the day without a word.
+    """
+    retry_delay = RETRY_INITIAL_SECONDS
+    while True:
+        payload = await ensure_word_of_the_day(client, model, json_mode=json_mode)
+        now = datetime.now()
+        next_midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        until_midnight = (next_midnight - now).total_seconds() + 5
+        if payload:
+            retry_delay = RETRY_INITIAL_SECONDS
+            await asyncio.sleep(until_midnight)
+        else:
+            logging.warning(f"📖 Retrying the word of the day in {retry_delay:.0f}s")
+            await asyncio.sleep(min(retry_delay, until_midnight))
+            retry_delay = min(retry_delay * 2, RETRY_MAX_SECONDS)
+
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+
+    import chat_backend
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open('model_config.json', 'r') as f:
+        config = json.load(f)
+    settings = config.get('word_of_the_day', {})
+    api_settings = config['api_settings']
+
+    target_day = datetime.strptime(sys.argv[1], "%Y-%m-%d").date() if len(sys.argv) > 1 else date.today()
+    existing = load_word_of_the_day(target_day)
+    if existing:
+        print(f"📖 Already cached for {target_day}: {existing['word']}")
+    else:
+        # The same backend, model fallback and JSON mode as the bot's precompute
+        client = chat_backend.create_client(api_settings, os.getenv("OPENAI_API_KEY"))
+        chat_backend.load_served_models(client, api_settings)
+        default_model = config['model_settings']['model_name']
+        model = chat_backend.served_model(settings.get('model') or default_model, default_model)
+        json_mode = chat_backend.is_hosted(api_settings.get('base_url'))
+        generated = generate_word_of_the_day(client, model, target_day, json_mode=json_mode)
+        print(f"📖 {generated['word']} — {generated['definition']}")